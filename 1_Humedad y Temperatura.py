@@ -4,6 +4,8 @@ import numpy as np
 import plotly.graph_objects as go
 from datetime import datetime, timedelta
 import requests
+from backend_client import latency_caption
+from dashboard_stream import fetch_dashboard, get_realtime_stream, poll_realtime
 
 # URL del backend Flask - Debe apuntar al endpoint /api
 API_URL = "http://localhost:5000/api"
@@ -63,15 +65,35 @@ st.markdown(f"**Dispositivo Asignado:** `{DEVICE_ID}`")
 # 2. FUNCIONES
 # ==========================================================
 
-@st.cache_data(ttl=5) # Cachea los datos por 5 segundos
-def get_sensor_data(sensor_type, device_id):
+def load_panels(device_id):
+    """Humedad y temperatura en una sola petición (/api/batch); None si falla."""
+    try:
+        return fetch_dashboard(API_URL, device_id, ["hum", "temp"])
+    except Exception as e:
+        st.info(f"Advertencia: No se pudo cargar la página en una sola petición. Error: {e}")
+        return None
+
+
+def get_sensor_data(sensor_type, device_id, panels=None):
     """
-    Descarga los últimos 30 datos de un tipo de sensor y filtra por IDDevice.
+    Últimos 30 datos de un tipo de sensor del IDDevice.
+    Se leen del stream (/api/stream) y, si no está conectado, de /api/realtime
+    pidiendo solo las lecturas nuevas desde el último refresco.
     """
+    if panels and sensor_type in panels["realtime"]:
+        # Ya cargado con load_panels
+        df = panels["realtime"][sensor_type]
+        if df.empty:
+            st.info(f"Advertencia: No se encontraron datos de '{sensor_type}' para el dispositivo `{device_id}`.")
+        return df.sort_values(by="TimeStamp")
+
     try:
-        r = requests.get(f"{API_URL}/realtime?type={sensor_type}&device_id={device_id}")
-        r.raise_for_status() 
-        data = r.json()
+        data = get_realtime_stream(API_URL, device_id).latest(sensor_type)
+        if data is None:
+            df = poll_realtime(API_URL, device_id, sensor_type)
+            if df.empty:
+                st.info(f"Advertencia: No se encontraron datos de '{sensor_type}' para el dispositivo `{device_id}`.")
+            return df.sort_values(by="TimeStamp")
 
         if not data:
             st.info(f"Advertencia: No se encontraron datos de '{sensor_type}' para el dispositivo `{device_id}`.")
@@ -88,7 +110,7 @@ def get_sensor_data(sensor_type, device_id):
         return df
 
     except requests.exceptions.HTTPError as http_err:
-        st.error(f"Error HTTP al obtener datos: {http_err}. Código: {r.status_code}")
+        st.error(f"Error HTTP al obtener datos: {http_err}. Código: {http_err.response.status_code}")
         return pd.DataFrame({"TimeStamp": [], "value": []})
     except requests.exceptions.ConnectionError:
         st.error("🔌 Error de conexión. Asegúrate que el servidor Flask está corriendo en el puerto 5000.")
@@ -98,9 +120,9 @@ def get_sensor_data(sensor_type, device_id):
         return pd.DataFrame({"TimeStamp": [], "value": []})
 
 
-def humchart():  # Humedad gráfica de líneas
+def humchart(panels=None):  # Humedad gráfica de líneas
     st.markdown("### Monitoreo de Humedad en Tiempo Real (%)")
-    data = get_sensor_data("hum", DEVICE_ID)
+    data = get_sensor_data("hum", DEVICE_ID, panels)
 
     if data.empty:
         st.warning("No hay datos de Humedad para mostrar.")
@@ -173,10 +195,10 @@ def humstandard(view_mode):
         """, unsafe_allow_html=True)
 
 
-def tempchart():  # Temperatura gráfica de líneas
+def tempchart(panels=None):  # Temperatura gráfica de líneas
     st.markdown("### Monitoreo de Temperatura en Tiempo Real (°C)")
     
-    data = get_sensor_data("temp", DEVICE_ID)
+    data = get_sensor_data("temp", DEVICE_ID, panels)
 
     if data.empty:
         st.warning("No hay datos de Temperatura para mostrar.")
@@ -278,17 +300,31 @@ def tipsforkitchen():
 
       
 # Aplicación principal
+# Segundos entre refrescos de las gráficas de tiempo real
+REALTIME_REFRESH_SECONDS = 5
+
+@st.fragment(run_every=REALTIME_REFRESH_SECONDS)
+def realtime_chart(chart):
+    """
+    Gráfica de tiempo real que se refresca sola cada REALTIME_REFRESH_SECONDS
+    sin volver a ejecutar la página (estilos, logo y consejos se pintan una vez).
+    Humedad y temperatura llegan en una sola petición al backend; la segunda
+    gráfica la lee de la caché compartida.
+    """
+    chart(load_panels(DEVICE_ID))
+
+
 def main():
     # Layout principal con columnas
     col_main, col_side = st.columns([2, 1], gap="large")
-    
+
     with col_main:
-        humchart()
+        realtime_chart(humchart)
         st.markdown("<br>", unsafe_allow_html=True)
         humstandard(None)
         st.markdown("<br>", unsafe_allow_html=True)
         
-        tempchart()
+        realtime_chart(tempchart)
         st.markdown("<br>", unsafe_allow_html=True)
         tempstandard(None)
         
@@ -304,6 +340,11 @@ def main():
     </div>
     """, unsafe_allow_html=True)
 
+    # Latencia de las cargas del dashboard (cliente HTTP compartido)
+    caption = latency_caption("/api/batch")
+    if caption:
+        st.caption(caption)
+
 
 if __name__ == "__main__":
     main()
@@ -5,6 +5,9 @@ import plotly.graph_objects as go
 from datetime import datetime, timedelta
 import requests
 import streamlit.components.v1 as components
+from backend_client import get_backend_client, latency_caption
+from dashboard_stream import (fetch_dashboard, fetch_gas_history, fetch_thresholds, get_realtime_stream,
+                              poll_realtime, submit_fetch)
 
 # URL del backend Flask - CORREGIDO AL PUERTO CORRECTO
 API_URL = "http://localhost:5000"
@@ -30,6 +33,12 @@ if 'last_alert_time' not in st.session_state:
     st.session_state.last_alert_time = None
 if 'alert_cooldown' not in st.session_state:
     st.session_state.alert_cooldown = False
+if 'alert_popup_until' not in st.session_state:
+    st.session_state.alert_popup_until = None
+
+# Segundos que la alerta de gas queda en pantalla, y mínimo entre dos alertas
+ALERT_POPUP_SECONDS = 3
+ALERT_COOLDOWN_SECONDS = 30
 
 
 def pagina_registro():
@@ -62,7 +71,7 @@ def pagina_registro():
         try:
             with st.spinner("Registrando usuario..."):
              
-                response = requests.post(f"{API_URL}/register", json=payload, timeout=5) 
+                response = get_backend_client().post(f"{API_URL}/register", json=payload)
             
             data = response.json()
 
@@ -102,10 +111,9 @@ def pagina_login():
         try:
             with st.spinner("Verificando credenciales..."):
                 
-                response = requests.post(
+                response = get_backend_client().post(
                     f"{API_URL}/login",
-                    json={"IDUser": id_user, "password": password},
-                    timeout=5
+                    json={"IDUser": id_user, "password": password}
                 )
             
             data = response.json()
@@ -240,7 +248,32 @@ st.sidebar.image("Imagen de WhatsApp 2025-11-25 a las 07.44.11_472dd4f8 - Editad
 
 # Lógica de las funciones del dashboard
 API_DASHBOARD = "http://localhost:5000/api" 
-def generate_realtime_data(sensor_type):
+# Espera máxima de un panel a su carga (el cliente HTTP ya tiene timeouts por intento)
+PANEL_FETCH_TIMEOUT = 30
+
+def start_panel_fetches(device_id, mode):
+    """
+    Lanza a la vez, al principio del rerun, las cargas de los paneles del dashboard
+    y devuelve {carga: Future}. Los hilos no usan st.*: todo se pasa como argumento.
+    """
+    # st.cache_resource: se resuelve aquí, en el hilo del script
+    stream = get_realtime_stream(API_DASHBOARD, device_id)
+    return {
+        # Tiempo real e histórico de gas en una sola petición al backend
+        "dashboard": submit_fetch(fetch_dashboard, API_DASHBOARD, device_id, ["gas"], [f"gas:{mode}"], stream),
+        "thresholds": submit_fetch(fetch_thresholds, API_DASHBOARD, device_id),
+    }
+
+def load_panel(futures, name, what=None):
+    """Espera la carga `name` de start_panel_fetches; None si falló (con aviso si se indica `what`)."""
+    try:
+        return futures[name].result(timeout=PANEL_FETCH_TIMEOUT)
+    except Exception as e:
+        if what:
+            st.info(f"Advertencia: No se pudo cargar {what}. Error: {e}")
+        return None
+
+def generate_realtime_data(sensor_type, panels=None):
     """Descarga los últimos 30 datos de un tipo de sensor (gas, humedad, temperatura)
         asociados al IDDevice del usuario logueado."""
    
@@ -252,11 +285,16 @@ def generate_realtime_data(sensor_type):
             "value": [0.0] * 30
         })
 
+    if panels and sensor_type in panels["realtime"]:
+        # Ya cargado con start_panel_fetches
+        return panels["realtime"][sensor_type]
+
     try:
-      
-        r = requests.get(f"{API_DASHBOARD}/realtime?type={sensor_type}&device_id={device_id}")
-        r.raise_for_status() 
-        data = r.json()
+        # Lecturas que empuja /api/stream; si el stream no está listo se consulta /api/realtime
+        data = get_realtime_stream(API_DASHBOARD, device_id).latest(sensor_type)
+        if data is None:
+            # Solo se piden las lecturas posteriores a las que ya tiene la sesión
+            return poll_realtime(API_DASHBOARD, device_id, sensor_type)
 
         timestamps = [item["TimeStamp"] for item in data]
         values = [item["value"] for item in data]
@@ -276,7 +314,7 @@ def generate_realtime_data(sensor_type):
             "value": [0.0] * 30
         })
         
-def generate_gas_data(mode='weekly'):
+def generate_gas_data(mode='weekly', panels=None):
     """Genera datos de consumo de gas."""
     device_id = st.session_state.get("id_device")
     if not device_id:
@@ -290,9 +328,12 @@ def generate_gas_data(mode='weekly'):
         }).sort_values(by='date')
 
     try:
-        r = requests.get(f"{API_DASHBOARD}/gas/{mode}?device_id={device_id}")
-        r.raise_for_status()
-        data = r.json()
+        if panels and f"gas:{mode}" in panels:
+            # Ya cargado con start_panel_fetches
+            data = panels[f"gas:{mode}"]
+        else:
+            # Compartido con las demás sesiones que miran el mismo dispositivo
+            data = fetch_gas_history(API_DASHBOARD, device_id, mode)
         df = pd.DataFrame(data)
         df["date"] = pd.to_datetime(df["date"])
         df["label"] = df["date"].dt.strftime("%d")
@@ -310,6 +351,16 @@ def generate_gas_data(mode='weekly'):
             'consumption': [0.0] * days
         }).sort_values(by='date')
 
+# Límite de gas si no se pueden leer los umbrales del backend (igual a GAS_ALARM_THRESHOLD)
+DEFAULT_GAS_LIMIT = 500
+
+def get_alarm_thresholds(device_id):
+    """Umbrales de alarma efectivos del backend, para no repetirlos en el dashboard."""
+    try:
+        return fetch_thresholds(API_DASHBOARD, device_id)
+    except Exception:
+        return {}
+
 # Header
 def render_header(user_name):
     col1, col2 = st.columns([4, 1])
@@ -322,12 +373,14 @@ def render_header(user_name):
             st.toast("No hay nuevas notificaciones", icon="ℹ️")
 
 # Gráfica en tiempo real
-def render_realtime_chart():
+def render_realtime_chart(panels=None, thresholds=None):
     st.markdown("### Monitoreo de Gas en Tiempo Real (PPM)")
     
-    data = generate_realtime_data("gas")
+    data = generate_realtime_data("gas", panels)
     latest_value = data["value"].iloc[-1] if len(data) > 0 else 0
-    GAS_LIMIT = 79
+    if thresholds is None:
+        thresholds = get_alarm_thresholds(st.session_state.get("id_device"))
+    GAS_LIMIT = thresholds.get("gas", {}).get("max") or DEFAULT_GAS_LIMIT
 
     
     st.markdown(f"**DEBUG** - Device: `{st.session_state.get('id_device')}`, Última lectura: **{latest_value}** PPM, Límite: {GAS_LIMIT}")
@@ -338,7 +391,7 @@ def render_realtime_chart():
     if latest_value > GAS_LIMIT:
        
         if (st.session_state.last_alert_time is None or 
-            (current_time - st.session_state.last_alert_time).total_seconds() > 30):
+            (current_time - st.session_state.last_alert_time).total_seconds() > ALERT_COOLDOWN_SECONDS):
             
             if not st.session_state.alert_already_ack:
                 st.session_state.show_alert_popup = True
@@ -384,8 +437,27 @@ def render_realtime_chart():
     
     st.plotly_chart(fig, use_container_width=True, key="realtime")
 
+# Segundos entre refrescos de la gráfica de tiempo real
+REALTIME_REFRESH_SECONDS = 5
+
+@st.fragment(run_every=REALTIME_REFRESH_SECONDS)
+def render_realtime_fragment():
+    """
+    Gráfica de tiempo real y alerta de gas, refrescadas cada REALTIME_REFRESH_SECONDS
+    sin volver a ejecutar todo el script: estilos, logo, histórico y mapa se
+    pintan solo cuando el usuario interactúa con la página.
+    """
+    futures = st.session_state.pop("realtime_futures", None)
+    if futures is not None:
+        # Rerun completo: datos y umbrales de start_panel_fetches
+        render_realtime_chart(load_panel(futures, "dashboard"), load_panel(futures, "thresholds") or {})
+    else:
+        # Refresco del fragmento: stream o caché compartida
+        render_realtime_chart()
+    render_gas_alert_popup()
+
 # Gráfica de consumo de gas
-def render_gas_chart():
+def render_gas_chart(panels=None):
     col1, col2 = st.columns([3, 1])
     with col1:
         st.markdown("### Consumo Histórico de Gas")
@@ -398,7 +470,7 @@ def render_gas_chart():
         )
     
     current_mode = 'weekly' if view_mode == "Semanal" else 'monthly'
-    data = generate_gas_data(current_mode)
+    data = generate_gas_data(current_mode, panels)
     
     fig = go.Figure()
     fig.add_trace(go.Bar(
@@ -520,13 +592,29 @@ def render_location_map():
 
 
 def render_gas_alert_popup():
-    if not st.session_state.get("show_alert_popup", False):
+    """
+    Alerta de gas a pantalla completa que se cierra sola a los ALERT_POPUP_SECONDS.
+    El cierre lo hace el navegador (animación CSS): el script no se detiene y las
+    gráficas se siguen actualizando mientras la alerta está visible. El plazo se
+    guarda en la sesión, así que la alerta sigue visible en los reruns hasta que vence.
+    """
+    now = datetime.now()
+    if st.session_state.get("show_alert_popup", False):
+        # Alerta nueva: se da por reconocida y el cooldown cuenta desde ahora
+        st.session_state.show_alert_popup = False
+        st.session_state.alert_already_ack = True
+        st.session_state.last_alert_time = now
+        st.session_state.alert_popup_until = now + timedelta(seconds=ALERT_POPUP_SECONDS)
+
+    until = st.session_state.get("alert_popup_until")
+    if until is None or now >= until:
         return
+    remaining = (until - now).total_seconds()
 
     # CSS para el popup que cubre toda la pantalla
-    st.markdown("""
+    st.markdown(f"""
     <style>
-    .alert-overlay {
+    .alert-overlay {{
         position: fixed;
         top: 0;
         left: 0;
@@ -534,9 +622,10 @@ def render_gas_alert_popup():
         height: 100%;
         background-color: rgba(0, 0, 0, 0.65);
         z-index: 9998;
-    }
+        animation: popup-hide 0s linear {remaining:.1f}s forwards;
+    }}
     
-    .alert-popup {
+    .alert-popup {{
         position: fixed;
         top: 50%;
         left: 50%;
@@ -550,46 +639,37 @@ def render_gas_alert_popup():
         box-shadow: 0 4px 12px rgba(0,0,0,0.4);
         text-align: center;
         z-index: 9999;
-        animation: popup-fade 0.3s ease-out;
-    }
+        animation: popup-fade 0.3s ease-out, popup-hide 0s linear {remaining:.1f}s forwards;
+    }}
     
-    @keyframes popup-fade {
-        from { opacity: 0; transform: translate(-50%, -50%) scale(0.9); }
-        to { opacity: 1; transform: translate(-50%, -50%) scale(1); }
-    }
+    @keyframes popup-fade {{
+        from {{ opacity: 0; transform: translate(-50%, -50%) scale(0.9); }}
+        to {{ opacity: 1; transform: translate(-50%, -50%) scale(1); }}
+    }}
+    
+    /* Cierre automático en el navegador, sin detener el script */
+    @keyframes popup-hide {{
+        to {{ visibility: hidden; opacity: 0; pointer-events: none; }}
+    }}
     
     /* Asegurarse de que el popup esté por encima de todo */
-    .main > div {
+    .main > div {{
         z-index: auto !important;
-    }
+    }}
     </style>
     """, unsafe_allow_html=True)
 
     # HTML del popup
-    st.markdown("""
+    st.markdown(f"""
     <div class="alert-overlay"></div>
     <div class="alert-popup">
         <h2>🚨 ALERTA DE GAS</h2>
         <p>Se ha detectado una concentración peligrosa de gas.</p>
         <p><b>¡Evacúe de inmediato!</b></p>
-        <p><small>Esta alerta se cerrará automáticamente en 3 segundos</small></p>
+        <p><small>Esta alerta se cerrará automáticamente en {ALERT_POPUP_SECONDS} segundos</small></p>
     </div>
     """, unsafe_allow_html=True)
 
-    # Botón invisible para el cierre automático
-    close_placeholder = st.empty()
-    
-    # Cierre automático después de 3 segundos
-    import time
-    time.sleep(3)
-    
-    if st.session_state.get("show_alert_popup", False):
-        st.session_state.show_alert_popup = False
-        st.session_state.alert_already_ack = True
-        st.session_state.last_alert_time = datetime.now()
-        close_placeholder.empty()
-        st.rerun()
-
 
 
 
@@ -640,13 +720,20 @@ def main_dashboard():
             render_emergency_contact()
             render_location_map()
     else:
+        # Todas las cargas a la vez: la página tarda lo que la más lenta, no la suma
+        current_mode = 'weekly' if st.session_state.get('view_mode', "Semanal") == "Semanal" else 'monthly'
+        futures = start_panel_fetches(st.session_state['id_device'], current_mode)
+
         # layout principal con columnas
         col_main, col_side = st.columns([2, 1], gap="large")
 
         with col_main:
-            render_realtime_chart()   
+            # La primera ejecución del fragmento usa las cargas ya lanzadas
+            st.session_state["realtime_futures"] = futures
+            render_realtime_fragment()
+            panels = load_panel(futures, "dashboard", "el dashboard en una sola petición")
             st.markdown("<br>", unsafe_allow_html=True)
-            view_mode = render_gas_chart()
+            view_mode = render_gas_chart(panels)
             st.markdown("<br>", unsafe_allow_html=True)
             render_weekly_summary(view_mode)
 
@@ -656,8 +743,6 @@ def main_dashboard():
             st.markdown("<br>", unsafe_allow_html=True)
             render_location_map()
 
-       
-        render_gas_alert_popup()
 
     # footer
     st.markdown("---")
@@ -667,6 +752,11 @@ def main_dashboard():
     </div>
     """, unsafe_allow_html=True)
 
+    # Latencia de las cargas del dashboard (cliente HTTP compartido)
+    caption = latency_caption("/api/batch")
+    if caption:
+        st.caption(caption)
+
     if st.sidebar.button("Cerrar Sesión", type="secondary", use_container_width=True):
         st.session_state["logged_in"] = False
         st.session_state["auth_option"] = "Iniciar Sesión"
@@ -0,0 +1,89 @@
+import numpy as np
+
+
+class AlarmRules:
+    """
+    Umbrales de alarma por tipo de sensor, con reglas específicas por dispositivo.
+    Las reglas se compilan una vez al crear el objeto y cada lote de lecturas
+    se evalúa en una sola pasada vectorizada con numpy.
+
+    Formato de las reglas:
+        {'gas': {'max': 500}, 'temp': {'min': 5, 'max': 45}}
+    Una lectura es alarma si es mayor que 'max' o menor que 'min'.
+    """
+
+    def __init__(self, rules, device_rules=None):
+        self._default = self._compile(rules)
+        self._by_device = {
+            mac_base: self._compile({**rules, **overrides})
+            for mac_base, overrides in (device_rules or {}).items()
+        }
+
+    @staticmethod
+    def _compile(rules):
+        compiled = {}
+        for sensor_type, rule in rules.items():
+            low = rule.get('min')
+            high = rule.get('max')
+            if low is None and high is None:
+                continue
+            compiled[sensor_type] = (
+                -np.inf if low is None else float(low),
+                np.inf if high is None else float(high),
+            )
+        return compiled
+
+    def _rules_for(self, mac_base):
+        return self._by_device.get(mac_base, self._default)
+
+    def thresholds(self, mac_base=None):
+        """Umbrales efectivos de un dispositivo (para que los dashboards no los repitan)."""
+        return {
+            sensor_type: {
+                'min': None if np.isneginf(low) else low,
+                'max': None if np.isposinf(high) else high,
+            }
+            for sensor_type, (low, high) in self._rules_for(mac_base).items()
+        }
+
+    def evaluate(self, mac_base, types, values):
+        """
+        Evalúa un lote completo. Devuelve (alarmas, válidas), dos listas de bool.
+        Las lecturas no numéricas de un tipo con regla se marcan como no válidas;
+        un valor None no es alarma.
+        """
+        rules = self._rules_for(mac_base)
+        count = len(types)
+        if not count or not rules:
+            return [False] * count, [True] * count
+
+        numbers, valid = _to_float_array(values)
+
+        unique_types, type_index = np.unique(np.asarray(types, dtype=object).astype(str), return_inverse=True)
+        lows = np.array([rules.get(t, (-np.inf, np.inf))[0] for t in unique_types])[type_index]
+        highs = np.array([rules.get(t, (-np.inf, np.inf))[1] for t in unique_types])[type_index]
+        has_rule = np.array([t in rules for t in unique_types])[type_index]
+
+        # Las comparaciones con NaN (None) son False: no hay alarma
+        alarms = (numbers > highs) | (numbers < lows)
+        valid = valid | ~has_rule
+        return alarms.tolist(), valid.tolist()
+
+
+def _to_float_array(values):
+    """Convierte los valores a float64 (None -> NaN). Devuelve (array, válidos)."""
+    try:
+        numbers = np.asarray(values, dtype=np.float64)
+        return numbers, np.ones(len(numbers), dtype=bool)
+    except (TypeError, ValueError):
+        pass
+    # Hay algún valor no numérico: se convierte uno a uno
+    numbers = np.empty(len(values), dtype=np.float64)
+    valid = np.ones(len(values), dtype=bool)
+    for i, value in enumerate(values):
+        try:
+            numbers[i] = np.nan if value is None else float(value)
+        except (TypeError, ValueError):
+            numbers[i] = np.nan
+            valid[i] = False
+    return numbers, valid
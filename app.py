@@ -1,13 +1,34 @@
-from flask import Flask, request, jsonify
-import mysql.connector 
+from flask import Flask, Response, request, jsonify
 from datetime import datetime
+import hashlib
 import json 
+import math
+import threading
+import time
+import atexit
+
+from storage import StorageError, create_storage, naive_timestamp
+from schema import ensure_schema
+from ingest import IngestBuffer, IngestQueueFull
+from device_registry import DeviceRegistry
+from device_versions import DeviceVersions
+from dedup import BatchInFlight, IngestDeduplicator
+from realtime_buffer import RealtimeBuffers
+from stream_hub import StreamHub, StreamHubFull
+from alarm_rules import AlarmRules
+from binary_format import BINARY_CONTENT_TYPE, decode_lecturas, lecturas_to_columns
+from rollups import ROLLUP_SECONDS
+import columnar
+import downsample
 
 
 
 app = Flask(__name__)
 
 
+# Motor de almacenamiento: 'mysql' (servidor) o 'sqlite' (embebido, modo WAL)
+STORAGE_BACKEND = 'mysql'
+
 DB_CONFIG = {
     'host': 'localhost',
     'user': 'root',
@@ -15,17 +36,164 @@ DB_CONFIG = {
     'database': 'iot'
 }
 
+# Configuración del pool de conexiones
+DB_POOL_CONFIG = {
+    'pool_size': 10,              # Máximo de conexiones abiertas
+    'prewarm': 4,                 # Conexiones abiertas al arrancar
+    'checkout_timeout': 5,        # Segundos de espera si el pool está lleno
+    'health_check_interval': 30   # Ping a conexiones ociosas más de N segundos
+}
+
+# Configuración del backend SQLite
+SQLITE_CONFIG = {
+    'path': 'iot.db',
+    'busy_timeout': 5000          # Milisegundos de espera si otra conexión está escribiendo
+}
+
+# Modo de ingesta de /datos:
+#   'sync'  -> inserta y hace commit dentro de la petición
+#   'async' -> valida, encola y responde 202; un hilo escritor agrupa los commits
+INGEST_CONFIG = {
+    'mode': 'sync',
+    'max_queue_batches': 1000,    # Lotes en cola antes de aplicar contrapresión (503)
+    'flush_rows': 5000,           # Filas por commit agrupado
+    'flush_interval': 0.5,        # Segundos máximos entre commits
+    'enqueue_timeout': 0.05       # Espera máxima para encolar antes de responder 503
+}
+
+# Escritura masiva en 'sensor': INSERT multi-fila en trozos de chunk_size y,
+# a partir de infile_threshold filas, LOAD DATA LOCAL INFILE (None lo desactiva)
+BULK_INSERT_CONFIG = {
+    'chunk_size': 1000,
+    'infile_threshold': 20000,
+    'infile_connections': 2       # Conexiones aparte que pueden usar LOAD DATA LOCAL (solo desde su directorio temporal)
+}
+
+# Descarte de reintentos en /datos en memoria: por el último 'seq' de lote de
+# cada dispositivo (si lo envía; uno menor es un reinicio del dispositivo) y, con
+# check_readings, por (IDSensor, TimeStamp) en un conjunto LRU. El estado es de cada
+# proceso: con varios workers un reintento que llega a otro worker no se detecta
+DEDUP_CONFIG = {
+    'enabled': True,
+    'check_readings': False,      # Descarta lecturas válidas que comparten IDSensor y segundo
+    'capacity': 100000            # Claves recientes (y dispositivos) que se recuerdan
+}
+
+# Esquema de la BD (ver schema.py):
+#   auto_migrate -> aplica las migraciones pendientes al arrancar
+#   on_missing   -> 'fail' no arranca si falta una migración o un índice; 'warn' solo avisa
+#   lock_timeout -> segundos que un proceso espera a que otro termine de migrar
+SCHEMA_CONFIG = {
+    'auto_migrate': True,
+    'on_missing': 'fail',
+    'lock_timeout': 600
+}
+
+# Últimas lecturas en memoria para /api/realtime (ver realtime_buffer.py)
+REALTIME_BUFFER_CONFIG = {
+    'enabled': True,
+    'capacity': 30,               # Lecturas por (dispositivo, tipo)
+    'max_series': 10000,          # Series en memoria como máximo (~16 bytes por lectura)
+    'idle_ttl': 300,              # Segundos sin consultas antes de liberar una serie
+    'resync_ttl': 5               # Recarga desde la BD (con varios workers); None con un solo proceso
+}
+
+# Stream de lecturas nuevas para los dashboards (/api/stream, Server-Sent Events)
+# Cada conexión abierta ocupa un hilo del servidor mientras dura (gthread y waitress
+# no son asíncronos): el máximo de conexiones por proceso son los hilos del
+# servidor menos 'reserved_threads', que quedan siempre libres para /datos
+STREAM_CONFIG = {
+    'server_threads': 8,          # Hilos por proceso (serve.py lo sustituye por --threads)
+    'reserved_threads': 4,        # Hilos que el stream nunca ocupa
+    'max_queue': 100,             # Eventos pendientes por conexión antes de pedir al cliente que recargue
+    'heartbeat': 15,              # Segundos entre comentarios ': ping' (detecta clientes caídos)
+    'resync_interval': 30         # Con varios workers: cada N s se pide recargar /api/realtime; None con un solo proceso
+}
+
+# ETag en las rutas de lectura según la versión de ingesta de cada dispositivo:
+# si no llegaron lecturas nuevas se responde 304 sin consultar la BD
+ETAG_CONFIG = {
+    'enabled': True,
+    'resync_ttl': 5               # Con varios workers: el ETag caduca cada N s; None con un solo proceso
+}
+
+# Historial de cualquier rango reducido a un número de puntos (/api/history, ver downsample.py)
+HISTORY_CONFIG = {
+    'default_points': 500,
+    'max_points': 5000,
+    'max_source_rows': 20000      # Filas leídas como máximo (lecturas o agregados); si no, resolución más gruesa
+}
+
+# Páginas de /api/alarms (paginación por cursor sobre la tabla alarm_event)
+ALARMS_PAGE_CONFIG = {
+    'default_limit': 50,
+    'max_limit': 500
+}
+
+# Segundos que se confía en la caché de dispositivos antes de recargarla desde la BD
+DEVICE_REGISTRY_TTL = 30
+
 GAS_ALARM_THRESHOLD = 500  
 
-# Función de conexión a la BD
-def get_db_connection():
-    # Intenta la conexión
-    try:
-        return mysql.connector.connect(**DB_CONFIG)
-    except mysql.connector.Error as err:
-        print(f"Error al conectar a la base de datos: {err}")
-        
-        raise
+# Reglas de alarma por tipo de sensor: alarma si la lectura > 'max' o < 'min'
+ALARM_RULES = {
+    'gas': {'max': GAS_ALARM_THRESHOLD},
+    'hum': {'min': None, 'max': None},
+    'temp': {'min': None, 'max': None}
+}
+
+# Reglas específicas por dispositivo (reemplazan la regla del tipo indicado), p. ej.:
+# 'AABBCCDDEEFF': {'gas': {'max': 300}, 'temp': {'max': 45}}
+ALARM_RULES_BY_DEVICE = {}
+
+alarm_rules = AlarmRules(ALARM_RULES, ALARM_RULES_BY_DEVICE)
+_deduplicator = IngestDeduplicator(DEDUP_CONFIG['capacity'], DEDUP_CONFIG['check_readings'])
+_realtime_buffers = RealtimeBuffers(**{k: v for k, v in REALTIME_BUFFER_CONFIG.items() if k != 'enabled'})
+def stream_max_subscribers():
+    """Conexiones de /api/stream por proceso: hilos del servidor menos los reservados."""
+    return max(0, STREAM_CONFIG['server_threads'] - STREAM_CONFIG['reserved_threads'])
+
+_stream_hub = StreamHub(stream_max_subscribers(), STREAM_CONFIG['max_queue'])
+_device_versions = DeviceVersions(ETAG_CONFIG['resync_ttl'])
+
+_storage = None
+_storage_lock = threading.Lock()
+
+def get_storage():
+    """Crea el almacenamiento la primera vez que se necesita y lo reutiliza después."""
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                storage = create_storage(
+                    STORAGE_BACKEND,
+                    db_config=DB_CONFIG,
+                    pool_config=DB_POOL_CONFIG,
+                    bulk_config=BULK_INSERT_CONFIG,
+                    sqlite_config=SQLITE_CONFIG
+                )
+                try:
+                    ensure_schema(storage, SCHEMA_CONFIG['auto_migrate'], SCHEMA_CONFIG['on_missing'],
+                                  SCHEMA_CONFIG['lock_timeout'])
+                except Exception:
+                    storage.close()
+                    raise
+                _storage = storage
+    return _storage
+
+_device_registry = None
+_device_registry_lock = threading.Lock()
+
+def get_device_registry():
+    """Registro de dispositivos conocidos; se carga completo la primera vez."""
+    global _device_registry
+    if _device_registry is None:
+        with _device_registry_lock:
+            if _device_registry is None:
+                registry = DeviceRegistry(get_storage().device_ids, ttl=DEVICE_REGISTRY_TTL)
+                registry.reload()
+                _device_registry = registry
+    return _device_registry
 
 # ==================================================================
 # RUTAS DE AUTENTICACIÓN
@@ -38,8 +206,6 @@ def register_user():
     Requiere: IDUser, Mail, FName, LName, Password.
     El campo IDDevice se deja NULL al inicio y se asigna después.
     """
-    conn = None
-    cursor = None 
     try:
         data = request.json
         # Validación
@@ -47,41 +213,23 @@ def register_user():
         if not all(field in data for field in required_fields):
             return jsonify({"success": False, "message": "Faltan campos obligatorios"}), 400
 
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
         id_user = data['IDUser']
         
-        #verificar si el IDUser ya existe
-        cursor.execute("SELECT IDUser FROM user WHERE IDUser = %s", (id_user,))
-        if cursor.fetchone():
-            return jsonify({"success": False, "message": f"El ID de usuario '{id_user}' ya está registrado"}), 409
-
-        # Insertar nuevo usuario. 
-        insert_query = """
-            INSERT INTO user (IDUser, Mail, FName, LName, Password, IDDevice)
-            VALUES (%s, %s, %s, %s, %s, NULL) -- Se inserta NULL en IDDevice
-        """
-        user_data = (
+        # Insertar nuevo usuario (falla si el IDUser ya existe)
+        created = get_storage().create_user(
             data['IDUser'], data['Mail'], data['FName'], data['LName'], data['Password']
         )
-        
-        cursor.execute(insert_query, user_data)
-        conn.commit()
+        if not created:
+            return jsonify({"success": False, "message": f"El ID de usuario '{id_user}' ya está registrado"}), 409
         
         return jsonify({"success": True, "message": "Usuario registrado exitosamente. Asigne un dispositivo al iniciar sesión."}), 201
 
-    except mysql.connector.Error as err:
-        print(f"Error de MySQL en registro: {err}")
+    except StorageError as err:
+        print(f"Error de BD en registro: {err}")
         return jsonify({"success": False, "message": f"Error de base de datos: {err.msg}"}), 500
     except Exception as e:
         print(f"Error en registro: {e}")
         return jsonify({"success": False, "message": "Error interno del servidor"}), 500
-    finally:
-        if cursor: 
-            cursor.close()
-        if conn and conn.is_connected():
-            conn.close()
 
 
 @app.route('/login', methods=['POST'])
@@ -90,8 +238,6 @@ def login_user():
     Ruta para iniciar sesión.
     Verifica IDUser y Password. Si es exitoso, retorna IDDevice.
     """
-    conn = None
-    cursor = None 
     try:
         data = request.json
         id_user = data.get('IDUser')
@@ -100,13 +246,10 @@ def login_user():
         if not id_user or not password:
             return jsonify({"success": False, "message": "Faltan ID de usuario o contraseña"}), 400
 
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True) 
+        storage = get_storage()
 
         # Buscar el usuario por IDUser
-        query = "SELECT IDUser, IDDevice, FName, LName, Mail, Password FROM user WHERE IDUser = %s"
-        cursor.execute(query, (id_user,))
-        user_row = cursor.fetchone()
+        user_row = storage.get_user(id_user)
         
         if user_row:
             # 1. Verificar la contraseña (
@@ -116,21 +259,9 @@ def login_user():
                 
                 current_device = user_row['IDDevice']
                 if not current_device:
-                   
-                    cursor.execute("""
-                        SELECT IDDevice FROM device 
-                        WHERE IDDevice NOT IN (SELECT IDDevice FROM user WHERE IDDevice IS NOT NULL)
-                        ORDER BY IDDevice ASC 
-                        LIMIT 1
-                    """)
-                    unassigned_device = cursor.fetchone()
-
-                    if unassigned_device:
-                        new_device_id = unassigned_device['IDDevice']
-                        # Asignar el dispositivo al usuario
-                        update_query = "UPDATE user SET IDDevice = %s WHERE IDUser = %s"
-                        cursor.execute(update_query, (new_device_id, id_user))
-                        conn.commit()
+                    # Asignar el primer dispositivo sin dueño
+                    new_device_id = storage.assign_free_device(id_user)
+                    if new_device_id:
                         current_device = new_device_id
                         print(f"Dispositivo {new_device_id} asignado automáticamente al usuario {id_user} durante el login.")
 
@@ -150,132 +281,212 @@ def login_user():
             # Usuario no encontrado
             return jsonify({"success": False, "message": "Usuario no encontrado"}), 404
 
-    except mysql.connector.Error as err:
-        print(f"Error de MySQL en login: {err}")
+    except StorageError as err:
+        print(f"Error de BD en login: {err}")
         return jsonify({"success": False, "message": f"Error de base de datos: {err.msg}"}), 500
     except Exception as e:
         print(f"Error en login: {e}")
         return jsonify({"success": False, "message": "Error interno del servidor"}), 500
-    finally:
-        if cursor: # Cierra el cursor de forma segura
-            cursor.close()
-        if conn and conn.is_connected():
-            conn.close()
 
 # ==================================================================
 # RUTAS DE DATOS DE SENSORES
 # ==================================================================
 
+def parse_lecturas(mac_base, columns):
+    """
+    Valida las lecturas y construye las tuplas de inserción para la tabla 'sensor'.
+    `columns` trae una lista por campo (ver binary_format.lecturas_to_columns).
+    Las alarmas de todo el lote se evalúan en una sola pasada.
+    Lecture se convierte a float y TimeStamp a datetime sin zona aquí, una sola vez:
+    lanza ValueError si alguna lectura no se puede guardar, para responder 400
+    antes de encolar el lote en lugar de perderlo en el escritor.
+    """
+    values = [parse_lecture_value(i, value) for i, value in enumerate(columns['Lecture'])]
+    timestamps = [naive_timestamp(ts) for ts in columns['TimeStamp']]
+    for i, timestamp in enumerate(timestamps):
+        if timestamp is None:
+            raise ValueError(f"TimeStamp inválido en la lectura {i}: {columns['TimeStamp'][i]!r}")
+
+    alarms, _ = alarm_rules.evaluate(mac_base, columns['type'], values)
+
+    # ** CONSTRUCCIÓN DEL ID SENSOR ÚNICO ** (mac_base + id_suffix)
+    return [
+        (mac_base, mac_base + id_suffix, sensor_type, lecture_value, timestamp, is_alarm)
+        for sensor_type, lecture_value, timestamp, id_suffix, is_alarm in zip(
+            columns['type'], values, timestamps, columns['id_suffix'], alarms)
+    ]
+
+
+def parse_lecture_value(index, value):
+    """Lecture como float (None si no trae valor). Lanza ValueError si no es un número finito."""
+    if value is None:
+        return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        number = math.nan
+    if not math.isfinite(number):
+        raise ValueError(f"Lecture no numérico en la lectura {index}: {value!r}")
+    return number
+
+
+def ensure_device(mac_base):
+    """
+    Verifica si el IDDevice ya existe en la tabla 'device'.
+    Si NO existe, lo registra automáticamente Y lo asigna al usuario más reciente sin dispositivo.
+    Los dispositivos conocidos se resuelven en memoria sin consultar la BD.
+    """
+    registry = get_device_registry()
+    if registry.is_known(mac_base):
+        return
+
+    storage = get_storage()
+    if not storage.device_exists(mac_base):
+        print(f"Dispositivo nuevo detectado: {mac_base}. Registrando en la tabla 'device'.")
+        id_user = storage.register_device(mac_base)
+        if id_user:
+            print(f"Dispositivo {mac_base} ASIGNADO exitosamente al usuario más reciente sin dispositivo: {id_user}")
+        else:
+            print(f"Dispositivo {mac_base} registrado, pero NO HAY usuarios sin dispositivo para asignar.")
+
+    # Registrado ahora o por otro proceso después de la última recarga
+    registry.add(mac_base)
+
+
+def publish_readings(rows):
+    """Entrega las lecturas ya guardadas a los buffers de /api/realtime, al stream y a los ETag."""
+    if REALTIME_BUFFER_CONFIG['enabled']:
+        _realtime_buffers.push(rows)
+    _stream_hub.publish(rows)
+    # Lo último: un ETag nuevo nunca se calcula sobre un buffer sin las lecturas del lote
+    _device_versions.bump(row[0] for row in rows)
+
+
+def write_ingest_batches(batches):
+    """Escritor del modo asíncrono: guarda lotes de varios dispositivos en un solo commit."""
+    for mac_base in sorted({mac for mac, _, _ in batches}):
+        ensure_device(mac_base)
+
+    rows = [row for _, batch_rows, _ in batches for row in batch_rows]
+    get_storage().insert_readings(rows)
+    for _, _, keys in batches:
+        _deduplicator.commit(keys)
+    publish_readings(rows)
+
+
+def drop_ingest_batch(batch):
+    """Lote descartado por el escritor: sus reintentos deben volver a aceptarse."""
+    _deduplicator.release(batch[2])
+
+
+_ingest_buffer = None
+_ingest_buffer_lock = threading.Lock()
+
+def get_ingest_buffer():
+    """Crea y arranca el escritor en segundo plano la primera vez que se usa."""
+    global _ingest_buffer
+    if _ingest_buffer is None:
+        with _ingest_buffer_lock:
+            if _ingest_buffer is None:
+                options = {k: v for k, v in INGEST_CONFIG.items() if k != 'mode'}
+                buffer = IngestBuffer(write_ingest_batches, drop_fn=drop_ingest_batch, **options)
+                buffer.start()
+                atexit.register(buffer.stop)
+                _ingest_buffer = buffer
+    return _ingest_buffer
+
+
 @app.route('/datos', methods=['POST'])
 def receive_data():
-    conn = None
-    cursor = None
+    dedup_keys = []
+    stored = False
     
     try:
       
-        try:
-            data = request.json
-        except Exception:
-            
-            return jsonify({"status": "error", "message": "JSON inválido"}), 400
-        
-        # 1. Extraer la MAC base y lecturas
-        mac_base = data.get('mac_base')
-        lecturas = data.get('lecturas')
-        
-        if not mac_base or not lecturas:
-            return jsonify({"status": "error", "message": "Faltan datos esenciales (mac_base/lecturas)"}), 400
-            
-        insert_data = []
-
-        # 2. PROCESAR CADA LECTURA INDIVIDUALMENTE
-        for lectura in lecturas:
-            sensor_type = lectura.get('type')
-            lecture_value = lectura.get('Lecture')
-            timestamp_str = lectura.get('TimeStamp')
-            id_suffix = lectura.get('id_suffix')
-            is_alarm = False
-            
-            # ** CONSTRUCCIÓN DEL ID SENSOR ÚNICO **
-            id_sensor_unico = mac_base + id_suffix
-            
-            # Lógica de Alarma para gas
-            if sensor_type == 'gas':
-                try:
-                    
-                    if lecture_value is not None and float(lecture_value) > GAS_ALARM_THRESHOLD:
-                        is_alarm = True
-                except (TypeError, ValueError):
-                    
-                    continue
-
-            # Almacenar la tupla de inserción
-            insert_data.append((mac_base, id_sensor_unico, sensor_type, lecture_value, timestamp_str, is_alarm))
-            
-        
-        # 3. CONEXIÓN Y VERIFICACIÓN/REGISTRO DEL DISPOSITIVO
-        if insert_data:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            
-            # A. Verificar si el IDDevice ya existe en la tabla 'device'
-            cursor.execute("SELECT IDDevice FROM device WHERE IDDevice = %s", (mac_base,))
-            device_exists = cursor.fetchone()
-            
-            # B. Si NO existe, lo registramos automáticamente Y lo asignamos a un usuario.
-            if device_exists is None:
-                print(f"Dispositivo nuevo detectado: {mac_base}. Registrando en la tabla 'device'.")
-                
-                # 1. Insertar en la tabla 'device'
-                insert_device_query = "INSERT INTO device (IDDevice) VALUES (%s)"
-                try:
-                    cursor.execute(insert_device_query, (mac_base,)) 
-                    conn.commit()
-                    print(f"Dispositivo {mac_base} registrado exitosamente en la tabla 'device'.")
-                except mysql.connector.Error as db_err_device:
-                    print(f"Error al registrar dispositivo {mac_base} en 'device': {db_err_device}")
-                    return jsonify({"status": "error", "message": f"Error al registrar dispositivo: {db_err_device.msg}"}), 500
-
-                # 2. Asignar el nuevo IDDevice al usuario MÁS RECIENTE sin IDDevice
-                # NOTA: Asumimos que la tabla 'user' tiene un campo de autoincremento (ID) 
-                # o TimeStamp para determinar el más reciente. Aquí usamos un ORDER BY IDUser DESC 
-                # asumiendo que IDUser es secuencial o lo más cercano a 'reciente'.
-                # Si tienes un campo 'CreationDate' o 'ID' de autoincremento, úsalo.
-                
-               
-                find_user_query = """
-                    SELECT IDUser 
-                    FROM user 
-                    WHERE IDDevice IS NULL 
-                    ORDER BY IDUser DESC 
-                    LIMIT 1
-                """
-                cursor.execute(find_user_query)
-                user_to_link = cursor.fetchone()
+        if request.mimetype == BINARY_CONTENT_TYPE:
+            # Formato binario compacto: se decodifica todo el lote de una vez
+            try:
+                mac_base, columns = decode_lecturas(request.get_data())
+            except ValueError as e:
+                return jsonify({"status": "error", "message": f"Formato binario inválido: {e}"}), 400
+            if not mac_base or not columns['type']:
+                return jsonify({"status": "error", "message": "Faltan datos esenciales (mac_base/lecturas)"}), 400
+            seq = request.headers.get('X-Batch-Seq')
+        else:
+            try:
+                data = request.json
+            except Exception:
                 
-                if user_to_link:
-                    id_user = user_to_link[0]
-                    update_user_query = "UPDATE user SET IDDevice = %s WHERE IDUser = %s"
-                    cursor.execute(update_user_query, (mac_base, id_user))
-                    conn.commit()
-                    print(f"Dispositivo {mac_base} ASIGNADO exitosamente al usuario más reciente sin dispositivo: {id_user}")
-                else:
-                    print(f"Dispositivo {mac_base} registrado, pero NO HAY usuarios sin dispositivo para asignar.")
+                return jsonify({"status": "error", "message": "JSON inválido"}), 400
             
-            # C. Proseguir con la inserción de datos del sensor
-            sql_query = "INSERT INTO sensor (IDDevice, IDSensor, type, Lecture, TimeStamp, alarm) VALUES (%s, %s, %s, %s, %s, %s)"
+            # 1. Extraer la MAC base y lecturas
+            mac_base = data.get('mac_base')
+            lecturas = data.get('lecturas')
             
-            # ejecutamos todos los datos recopilados en un solo lote
-            cursor.executemany(sql_query, insert_data) 
-            
-            conn.commit()
+            if not mac_base or not lecturas:
+                return jsonify({"status": "error", "message": "Faltan datos esenciales (mac_base/lecturas)"}), 400
+
+            columns = lecturas_to_columns(lecturas)
+            seq = data.get('seq', request.headers.get('X-Batch-Seq'))
+
+        # Número de secuencia opcional del lote (para descartar reintentos)
+        if seq is not None:
+            try:
+                seq = int(seq)
+            except (TypeError, ValueError):
+                return jsonify({"status": "error", "message": "Número de secuencia 'seq' inválido"}), 400
             
-            print(f"Datos insertados exitosamente del dispositivo base: {mac_base}")
-            return jsonify({"status": "success", "message": "Datos insertados correctamente"}), 200
-        else:
+        # 2. PROCESAR CADA LECTURA INDIVIDUALMENTE
+        try:
+            insert_data = parse_lecturas(mac_base, columns)
+        except ValueError as e:
+            return jsonify({"status": "error", "message": f"Lecturas inválidas: {e}"}), 400
+
+        if not insert_data:
             return jsonify({"status": "error", "message": "No hay datos válidos para insertar"}), 400
 
-    except mysql.connector.Error as db_err:
+        # Descartar lotes y lecturas ya recibidos (reintentos del dispositivo)
+        if DEDUP_CONFIG['enabled']:
+            try:
+                insert_data, dedup_keys = _deduplicator.claim(mac_base, seq, insert_data)
+            except BatchInFlight:
+                # La primera copia aún no se ha guardado: no se puede confirmar ni descartar
+                response = jsonify({"status": "error", "message": "El lote se está guardando, reintente más tarde"})
+                response.headers['Retry-After'] = '1'
+                return response, 409
+            if not insert_data:
+                return jsonify({"status": "success", "message": "Datos ya registrados (reintento)"}), 200
+
+        # Modo asíncrono: encolar y responder de inmediato
+        if INGEST_CONFIG['mode'] == 'async':
+            try:
+                get_ingest_buffer().enqueue(mac_base, insert_data, dedup_keys)
+            except IngestQueueFull:
+                # Contrapresión: el dispositivo debe reintentar más tarde
+                response = jsonify({"status": "error", "message": "Servidor ocupado, reintente más tarde"})
+                response.headers['Retry-After'] = '1'
+                return response, 503
+            stored = True
+            return jsonify({"status": "success", "message": "Datos recibidos y encolados"}), 202
+
+        # 3. VERIFICACIÓN/REGISTRO DEL DISPOSITIVO
+        storage = get_storage()
+        try:
+            ensure_device(mac_base)
+        except StorageError as db_err_device:
+            print(f"Error al registrar dispositivo {mac_base} en 'device': {db_err_device}")
+            return jsonify({"status": "error", "message": f"Error al registrar dispositivo: {db_err_device.msg}"}), 500
+        
+        # 4. Proseguir con la inserción de datos del sensor en un solo lote
+        storage.insert_readings(insert_data)
+        stored = True
+        _deduplicator.commit(dedup_keys)
+        publish_readings(insert_data)
+        
+        print(f"Datos insertados exitosamente del dispositivo base: {mac_base}")
+        return jsonify({"status": "success", "message": "Datos insertados correctamente"}), 200
+
+    except StorageError as db_err:
         print(f"Error de base de datos: {db_err}")
         return jsonify({"status": "error", "message": f"Error al insertar en la BD: {db_err.msg}"}), 500
     except Exception as e:
@@ -283,162 +494,578 @@ def receive_data():
         return jsonify({"status": "error", "message": "Error interno del servidor"}), 500
     
     finally:
-        if cursor: # Cierra el cursor de forma segura
-            cursor.close()
-        if conn and conn.is_connected():
-            conn.close()
+        if dedup_keys and not stored:
+            # No se guardó: el reintento del dispositivo debe aceptarse
+            _deduplicator.release(dedup_keys)
 
 # ==================================================================
 # RUTAS DE STREAMLIT
 # ==================================================================
 
+def device_etag(device_id, extra=""):
+    """ETag de los datos de un dispositivo (None si están desactivados). Se calcula antes de leerlos."""
+    if not ETAG_CONFIG['enabled']:
+        return None
+    return _device_versions.etag(device_id, extra)
+
+
+def query_tag(*values):
+    """Resumen corto de los parámetros ya normalizados de una consulta, para el ETag."""
+    return hashlib.sha1(repr(values).encode()).hexdigest()[:12]
+
+
+def not_modified(etag):
+    """Respuesta 304 si el cliente ya tiene esa versión (If-None-Match); si no, None."""
+    if etag is None or not request.if_none_match.contains(etag):
+        return None
+    _device_versions.count_not_modified()
+    response = Response(status=304)
+    response.set_etag(etag)
+    return response
+
+
+def with_etag(response, etag):
+    if etag is not None:
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache' # Revalidar siempre con If-None-Match
+    return response
+
+
+def parse_since(value):
+    """
+    Cursor 'since' de /api/realtime (TimeStamp ISO) como datetime sin zona,
+    como se guarda en la BD; None si no se indica. Lanza ValueError si no es ISO.
+    """
+    if not value:
+        return None
+    since = naive_timestamp(value)
+    if since is None:
+        raise ValueError(f"TimeStamp inválido: {value}")
+    return since
+
+
+def realtime_series(device_id, sensor_type, since=None, columns=False):
+    """
+    Últimas 30 lecturas de la serie (de `since` en adelante), con TimeStamp en ISO.
+    Con columns=True, columnas numpy con TimeStamp en epoch ms (ver columnar.py).
+    """
+    if REALTIME_BUFFER_CONFIG['enabled']:
+        # Desde memoria; solo consulta la BD si el buffer de la serie está frío
+        rows = _realtime_buffers.latest(
+            device_id, sensor_type, 30,
+            lambda limit: get_storage().latest_readings(device_id, sensor_type, limit=limit),
+            since=since, columns=columns)
+    else:
+        rows = get_storage().latest_readings(device_id, sensor_type, limit=30, since=since)
+        if columns:
+            rows = columnar.rows_to_columns(rows)
+    if columns:
+        return rows
+
+    # Convertir objetos datetime a string ISO para JSON
+    for row in rows:
+        if isinstance(row['TimeStamp'], datetime):
+            row['TimeStamp'] = row['TimeStamp'].isoformat()
+    return rows
+
+
+def series_response(data, fmt):
+    """Respuesta de una serie en el formato negociado (filas ya en ISO si fmt es 'json')."""
+    if fmt == 'arrow':
+        return Response(columnar.columns_to_arrow(data), mimetype=columnar.ARROW_MIMETYPE)
+    if fmt == 'columns':
+        response = jsonify(columnar.columns_to_json(data))
+        response.mimetype = columnar.COLUMNS_MIMETYPE
+        return response
+    return jsonify(data)
+
+
+def series_cursor(data, fmt):
+    """TimeStamp ISO más reciente de una serie de realtime_series (None si está vacía)."""
+    if fmt == 'json':
+        return data[0]['TimeStamp'] if data else None
+    return columnar.newest_iso(data)
+
+
+def format_not_acceptable():
+    formats = "json, columns" + (", arrow" if columnar.arrow_available() else "")
+    return jsonify({"error": f"Formato no disponible. Use 'format' = {formats}"}), 406
+
+
+def gas_series(device_id, mode):
+    """Consumo promedio diario de gas para 'weekly' o 'monthly' (KeyError si el modo no existe)."""
+    return get_storage().daily_averages(device_id, 'gas', GAS_MODE_DAYS[mode])
+
+
+def alarm_series(device_id, sensor_type='gas', limit=50, since=None, until=None, before=None):
+    """
+    Últimas `limit` alarmas del dispositivo (de alarm_event), con TimeStamp en ISO
+    y el valor de gas como gas_ppm. Devuelve (filas, cursor de la página siguiente o None).
+    """
+    # Una fila de más para saber si hay otra página
+    rows = get_storage().alarm_events(device_id, sensor_type, limit + 1, since, until, before)
+    next_cursor = alarm_cursor(rows[limit - 1]) if len(rows) > limit else None
+    rows = rows[:limit]
+    for row in rows:
+        del row['IDEvent']
+        if isinstance(row['TimeStamp'], datetime):
+            row['TimeStamp'] = row['TimeStamp'].isoformat()
+        if sensor_type == 'gas':
+            # Renombrar para ser más legible en el frontend
+            row['gas_ppm'] = row.pop('value')
+    return rows, next_cursor
+
+
+def alarm_cursor(row):
+    """Cursor de /api/alarms: TimeStamp ISO y IDEvent del último evento de la página."""
+    timestamp = row['TimeStamp'].isoformat() if isinstance(row['TimeStamp'], datetime) else row['TimeStamp']
+    return f"{timestamp}_{row['IDEvent']}"
+
+
+def parse_alarm_cursor(value):
+    """(TimeStamp, IDEvent) del cursor de /api/alarms; None si no se indica. Lanza ValueError."""
+    if not value:
+        return None
+    timestamp, _, event_id = value.rpartition("_")
+    if not timestamp:
+        raise ValueError(f"Cursor inválido: '{value}'")
+    return parse_since(timestamp), int(event_id)
+
 # ENDPOINT PARA STREAMLIT → DATOS EN TIEMPO REAL
 @app.route('/api/realtime', methods=['GET'])
 def api_realtime():
-    """Obtiene los últimos 30 datos filtrados por tipo de sensor Y IDDevice."""
-    conn = None
-    cursor = None
+    """
+    Obtiene los últimos 30 datos filtrados por tipo de sensor Y IDDevice.
+    Con `since` (TimeStamp ISO) devuelve solo los de ese TimeStamp en adelante; la cabecera
+    X-Cursor trae el TimeStamp más reciente para usarlo como `since` en la siguiente consulta.
+    El cursor incluye su segundo para no perder lecturas guardadas después en ese
+    mismo segundo: las que el cliente ya tenía vuelven a llegar y debe descartarlas.
+    Formato con `format` o Accept: json (filas), columns o arrow (ver columnar.py).
+    """
     try:
         sensor_type = request.args.get("type", None)
         device_id = request.args.get("device_id", None) # Parámetro OBLIGATORIO para filtrar
+        since_param = request.args.get("since", None)   # Cursor opcional
 
         if not sensor_type or not device_id:
             return jsonify([]) # Devolver lista vacía si faltan parámetros
 
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
+        try:
+            since = parse_since(since_param)
+        except ValueError:
+            return jsonify({"error": "Parámetro 'since' inválido (use un TimeStamp ISO)"}), 400
+
+        fmt = columnar.negotiate_format(request)
+        if fmt is None:
+            return format_not_acceptable()
 
-        # Consulta SQL ACTUALIZADA para filtrar por IDDevice
-        query = """
-            SELECT TimeStamp, Lecture AS value
-            FROM sensor
-            WHERE type=%s AND IDDevice=%s
-            ORDER BY TimeStamp DESC
-            LIMIT 30
-        """
-        cursor.execute(query, (sensor_type, device_id)) # Se pasa IDDevice para el filtrado
-        rows = cursor.fetchall()
+        # Sin lecturas nuevas del dispositivo: 304 sin tocar la BD
+        etag = device_etag(device_id, "" if fmt == 'json' else fmt)
+        cached = not_modified(etag)
+        if cached:
+            return cached
 
-        # Convertir objetos datetime a string ISO para JSON
-        for row in rows:
-            if isinstance(row['TimeStamp'], datetime):
-                row['TimeStamp'] = row['TimeStamp'].isoformat()
+        data = realtime_series(device_id, sensor_type, since, columns=fmt != 'json')
 
-        return jsonify(rows)
+        response = with_etag(series_response(data, fmt), etag)
+        response.vary.add('Accept')
+        cursor = series_cursor(data, fmt) or since_param
+        if cursor:
+            response.headers['X-Cursor'] = cursor
+        return response
 
     except Exception as e:
         print("Error realtime:", e)
         return jsonify({"error": "Error al obtener datos"}), 500
-    finally:
-        if cursor: # Cierra el cursor de forma segura
-            cursor.close()
-        if conn and conn.is_connected():
-            conn.close()
     
+def sse_event(event, data):
+    """Formatea un evento de Server-Sent Events."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+# ENDPOINT PARA STREAMLIT → LECTURAS NUEVAS EN CUANTO SE GUARDAN (SSE)
+@app.route('/api/stream', methods=['GET'])
+def api_stream():
+    """
+    Stream de lecturas nuevas de un dispositivo (text/event-stream).
+    Eventos: 'readings' {type, readings: [{TimeStamp, value}]} con cada lote guardado,
+    y 'resync' cuando el cliente debe recargar /api/realtime (se quedó atrás o,
+    con varios workers, periódicamente porque este proceso no ve todos los lotes).
+    """
+    device_id = request.args.get("device_id", None) # Parámetro OBLIGATORIO para filtrar
+    types = [t for t in request.args.get("types", "gas,hum,temp").split(",") if t]
+    if not device_id:
+        return jsonify({"error": "Falta el parámetro device_id"}), 400
+
+    try:
+        subscription = _stream_hub.subscribe(device_id, types)
+    except StreamHubFull:
+        response = jsonify({"error": "Demasiadas conexiones de stream, use /api/realtime"})
+        response.headers['Retry-After'] = '30'
+        return response, 503
+
+    def events():
+        try:
+            yield "retry: 3000\n\n" # Espera del navegador/cliente antes de reconectar
+            last_resync = time.monotonic()
+            while not subscription.closed:
+                items, lagged = subscription.get(STREAM_CONFIG['heartbeat'])
+                if lagged:
+                    yield sse_event("resync", {"reason": "lagged"})
+                for item in items:
+                    yield sse_event("readings", item)
+                if not items and not lagged:
+                    yield ": ping\n\n"
+
+                resync_interval = STREAM_CONFIG['resync_interval']
+                if resync_interval and time.monotonic() - last_resync >= resync_interval:
+                    last_resync = time.monotonic()
+                    yield sse_event("resync", {"reason": "interval"})
+        finally:
+            # El cliente se desconectó o el servidor se apaga
+            _stream_hub.unsubscribe(subscription)
+
+    response = Response(events(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no' # Sin buffer en un proxy nginx
+    return response
+
 # ENDPOINT PARA STREAMLIT → CONSUMO GAS SEMANAL/MENSUAL
+GAS_MODE_DAYS = {"weekly": 7, "monthly": 30}
+
 @app.route('/api/gas/<mode>', methods=['GET'])
 def api_gas(mode):
     """Obtiene el consumo promedio de gas agrupado por día, filtrado por IDDevice."""
-    conn = None
-    cursor = None # Inicializado a None para un cierre seguro
     try:
         device_id = request.args.get("device_id", None) # Parámetro OBLIGATORIO para filtrar
 
         if not device_id:
             return jsonify([]) # Devolver lista vacía si falta el parámetro
 
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-
-        # Base de la consulta, incluyendo IDDevice
-        base_query = """
-            SELECT DATE(TimeStamp) AS date,
-                   AVG(Lecture) AS consumption
-            FROM sensor
-            WHERE type='gas' AND IDDevice=%s
-        """
-        
         # Filtro de tiempo
-        if mode == "weekly":
-            time_filter = "AND TimeStamp >= NOW() - INTERVAL 7 DAY"
-        elif mode == "monthly":
-            time_filter = "AND TimeStamp >= NOW() - INTERVAL 30 DAY"
-        else:
+        if mode not in GAS_MODE_DAYS:
             return jsonify({"error": "Modo de gas inválido. Use 'weekly' o 'monthly'"}), 400
         
-        # Construcción final de la consulta
-        query = f"""
-            {base_query}
-            {time_filter}
-            GROUP BY DATE(TimeStamp)
-            ORDER BY date ASC
-        """
-        
-        cursor.execute(query, (device_id,)) # Se pasa IDDevice para el filtrado
-        rows = cursor.fetchall()
+        # La ventana de días cambia a medianoche aunque no lleguen lecturas
+        etag = device_etag(device_id, datetime.now().strftime("%Y%m%d"))
+        cached = not_modified(etag)
+        if cached:
+            return cached
 
-        return jsonify(rows)
+        return with_etag(jsonify(gas_series(device_id, mode)), etag)
 
     except Exception as e:
         print("Error gas:", e)
         return jsonify({"error": "Error al obtener datos"}), 500
-    finally:
-        if cursor: # Cierra el cursor de forma segura
-            cursor.close()
-        if conn and conn.is_connected():
-            conn.close()
+
+# ENDPOINT PARA STREAMLIT → HISTORIAL DE CUALQUIER RANGO
+def history_series(device_id, sensor_type, since, until, points, method):
+    """
+    Serie de [since, until) reducida a `points` puntos como columnas (ver columnar.py).
+    Lee las lecturas crudas si el rango es corto y, si no, los agregados más
+    finos que quepan en HISTORY_CONFIG['max_source_rows'], así que el coste no
+    depende de cuántas lecturas haya en el rango. Devuelve (columnas, resolución).
+    """
+    max_rows = HISTORY_CONFIG['max_source_rows']
+    span = (until - since).total_seconds()
+    storage = get_storage()
+
+    if span <= max_rows:
+        # Rango corto: lecturas crudas si no son más de max_rows (una por segundo o menos)
+        rows = storage.readings_between(device_id, sensor_type, since, until, max_rows + 1)
+        if len(rows) <= max_rows:
+            columns = columnar.rows_to_columns(rows)
+            timestamps, values = downsample.drop_missing(columns['TimeStamp'], columns['value'])
+            if method == 'lttb':
+                timestamps, values = downsample.lttb(timestamps, values, points)
+            else:
+                timestamps, values = downsample.minmax(timestamps, values, points=points)
+            return {'TimeStamp': timestamps, 'value': values}, 'raw'
+
+    resolution = next((name for name, seconds in ROLLUP_SECONDS.items() if span / seconds <= max_rows), 'day')
+    columns = columnar.rollups_to_columns(storage.rollups(device_id, sensor_type, resolution, since, until))
+    if method == 'lttb':
+        timestamps, averages = downsample.drop_missing(columns['TimeStamp'], columns['avg'])
+        timestamps, values = downsample.lttb(timestamps, averages, points)
+    else:
+        timestamps, low, high = downsample.drop_missing(columns['TimeStamp'], columns['min'], columns['max'])
+        timestamps, values = downsample.minmax(timestamps, low, high, points)
+    return {'TimeStamp': timestamps, 'value': values}, resolution
+
+@app.route('/api/history', methods=['GET'])
+def api_history():
+    """
+    Lecturas de un rango cualquiera reducidas a como máximo `points` puntos.
+    Parámetros: device_id, type, from y to (TimeStamp ISO; to = ahora si no se indica),
+    points (por defecto HISTORY_CONFIG['default_points']) y method: 'minmax'
+    (conserva los picos, por defecto) o 'lttb'.
+    Respuesta en orden cronológico, en el formato negociado como /api/realtime;
+    la cabecera X-Resolution indica si se usaron lecturas ('raw') o agregados.
+    Solo hay ETag (y 304) si se indica 'to'.
+    """
+    sensor_type = request.args.get("type", None)
+    device_id = request.args.get("device_id", None)
+    method = request.args.get("method", "minmax")
+    if not sensor_type or not device_id or not request.args.get("from"):
+        return jsonify({"error": "Faltan los parámetros 'device_id', 'type' y 'from'"}), 400
+    if method not in downsample.METHODS:
+        return jsonify({"error": "Método inválido. Use 'minmax' o 'lttb'"}), 400
+
+    try:
+        since = parse_since(request.args.get("from"))
+        until = parse_since(request.args.get("to")) or datetime.now()
+        points = int(request.args.get("points", HISTORY_CONFIG['default_points']))
+    except ValueError:
+        return jsonify({"error": "Parámetros inválidos: 'from'/'to' deben ser TimeStamp ISO y 'points' un entero"}), 400
+    if until <= since:
+        return jsonify({"error": "'to' debe ser posterior a 'from'"}), 400
+    points = max(2, min(points, HISTORY_CONFIG['max_points']))
+
+    fmt = columnar.negotiate_format(request)
+    if fmt is None:
+        return format_not_acceptable()
+
+    # Sin 'to' el rango acaba ahora y cambia aunque no lleguen lecturas: sin ETag
+    etag = None
+    if request.args.get("to"):
+        etag = device_etag(device_id, query_tag(sensor_type, since, until, points, method, fmt))
+    cached = not_modified(etag)
+    if cached:
+        return cached
+
+    try:
+        columns, resolution = history_series(device_id, sensor_type, since, until, points, method)
+    except Exception as e:
+        print("Error history:", e)
+        return jsonify({"error": "Error al obtener datos"}), 500
+
+    data = columnar.columns_to_rows(columns) if fmt == 'json' else columns
+    response = with_etag(series_response(data, fmt), etag)
+    response.vary.add('Accept')
+    response.headers['X-Resolution'] = resolution
+    return response
 
 # ==================================================================
 # RUTAS DE ALARMAS (COMPATIBILIDAD CON GAS2.PY)
 # ==================================================================
 
+@app.route('/api/thresholds', methods=['GET'])
+def api_thresholds():
+    """Umbrales de alarma efectivos por tipo de sensor para un dispositivo."""
+    device_id = request.args.get("device_id", None)
+    return jsonify(alarm_rules.thresholds(device_id))
+
 @app.route('/api/alarms', methods=['GET'])
 def api_alarms():
     """
-    Obtiene el historial de las últimas 50 alarmas de gas registradas
+    Obtiene el historial de alarmas (por defecto de gas, las 50 últimas)
     para un dispositivo específico. Ideal para mostrar en Streamlit.
+    Parámetros opcionales: type, limit, from y to (TimeStamp ISO) y cursor.
+    La cabecera X-Next-Cursor trae el cursor de la página siguiente (más antigua)
+    y X-Total-Count el número de alarmas del rango.
     """
-    conn = None
-    cursor = None
     try:
         device_id = request.args.get("device_id", None) 
         if not device_id:
             return jsonify({"error": "Falta el parámetro 'device_id'"}), 400
+        sensor_type = request.args.get("type", "gas")
 
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-
-        # Consulta SQL para obtener lecturas donde 'alarm' sea True (1) y el tipo sea 'gas'
-        query = """
-            SELECT TimeStamp, IDSensor, Lecture AS value
-            FROM sensor
-            WHERE type='gas' AND alarm=1 AND IDDevice=%s
-            ORDER BY TimeStamp DESC
-            LIMIT 50
-        """
-        cursor.execute(query, (device_id,)) 
-        rows = cursor.fetchall()
-
-        # Convertir objetos datetime a string ISO para JSON
-        for row in rows:
-            if isinstance(row['TimeStamp'], datetime):
-                row['TimeStamp'] = row['TimeStamp'].isoformat()
-            # Renombrar para ser más legible en el frontend
-            row['gas_ppm'] = row.pop('value')
+        try:
+            limit = int(request.args.get("limit", ALARMS_PAGE_CONFIG['default_limit']))
+            since = parse_since(request.args.get("from"))
+            until = parse_since(request.args.get("to"))
+            before = parse_alarm_cursor(request.args.get("cursor"))
+        except ValueError:
+            return jsonify({"error": "Parámetros inválidos: 'limit' debe ser un entero, "
+                                     "'from'/'to' TimeStamp ISO y 'cursor' el de X-Next-Cursor"}), 400
+        limit = max(1, min(limit, ALARMS_PAGE_CONFIG['max_limit']))
+
+        etag = device_etag(device_id, query_tag(sensor_type, limit, since, until, before))
+        cached = not_modified(etag)
+        if cached:
+            return cached
+
+        with get_storage().connection():
+            rows, next_cursor = alarm_series(device_id, sensor_type, limit, since, until, before)
+            total = get_storage().count_alarm_events(device_id, sensor_type, since, until)
 
-        return jsonify(rows)
+        response = with_etag(jsonify(rows), etag)
+        if next_cursor:
+            response.headers['X-Next-Cursor'] = next_cursor
+        response.headers['X-Total-Count'] = str(total)
+        return response
 
     except Exception as e:
         print("Error en api_alarms:", e)
         return jsonify({"error": "Error al obtener el historial de alarmas"}), 500
-    finally:
-        if cursor: 
-            cursor.close()
-        if conn and conn.is_connected():
-            conn.close()
+
+# ==================================================================
+# RUTA DE CARGA AGRUPADA PARA LOS DASHBOARDS
+# ==================================================================
+
+def load_batch_series(device_id, spec, fmt='json'):
+    """
+    Resuelve una serie de /api/batch. Devuelve (datos, cursor).
+    Con fmt='columns' las series realtime van en columnas.
+    Lanza ValueError si la especificación no es válida.
+    """
+    name, _, arg = spec.partition(":")
+    if name == "realtime" and arg:
+        sensor_type, _, since_param = arg.partition("@")
+        data = realtime_series(device_id, sensor_type, parse_since(since_param), columns=fmt == 'columns')
+        cursor = series_cursor(data, fmt) or since_param or None
+        return (columnar.columns_to_json(data) if fmt == 'columns' else data), cursor
+    if name == "gas" and arg in GAS_MODE_DAYS:
+        return gas_series(device_id, arg), None
+    if name == "alarms" and not arg:
+        return alarm_series(device_id)[0], None
+    if name == "thresholds" and not arg:
+        return alarm_rules.thresholds(device_id), None
+    raise ValueError(f"Serie desconocida: '{spec}'")
+
+@app.route('/api/batch', methods=['GET'])
+def api_batch():
+    """
+    Varias series de un dispositivo en una sola petición y con una sola conexión a la BD.
+    Parámetro `series`, separadas por comas:
+        realtime:<tipo>[@<since>]   igual que /api/realtime (con cursor opcional)
+        gas:weekly | gas:monthly    igual que /api/gas/<mode>
+        alarms                      igual que /api/alarms
+        thresholds                  igual que /api/thresholds
+    Respuesta: {"series": {especificación: datos}, "cursors": {especificación: X-Cursor}}.
+    Con format=columns (o Accept) las series realtime van en columnas, como en /api/realtime.
+    """
+    device_id = request.args.get("device_id", None)
+    specs = [spec for spec in request.args.get("series", "").split(",") if spec]
+    if not device_id or not specs:
+        return jsonify({"error": "Faltan los parámetros 'device_id' y 'series'"}), 400
+
+    fmt = columnar.negotiate_format(request)
+    if fmt not in ('json', 'columns'):
+        return jsonify({"error": "Formato no disponible en /api/batch. Use 'format' = json, columns"}), 406
+
+    etag = device_etag(device_id, datetime.now().strftime("%Y%m%d") + ("" if fmt == 'json' else f"-{fmt}"))
+    cached = not_modified(etag)
+    if cached:
+        return cached
+
+    series = {}
+    cursors = {}
+    try:
+        with get_storage().connection():
+            for spec in specs:
+                series[spec], cursor = load_batch_series(device_id, spec, fmt)
+                if cursor:
+                    cursors[spec] = cursor
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except StorageError as err:
+        print(f"Error de BD en api_batch: {err}")
+        return jsonify({"error": f"Error de base de datos: {err.msg}"}), 500
+    except Exception as e:
+        print("Error en api_batch:", e)
+        return jsonify({"error": "Error al obtener datos"}), 500
+
+    response = with_etag(jsonify({"series": series, "cursors": cursors}), etag)
+    response.vary.add('Accept')
+    return response
+
+# ==================================================================
+# RUTAS DE MONITOREO
+# ==================================================================
+
+@app.route('/api/pool', methods=['GET'])
+def api_pool():
+    """Estadísticas del almacenamiento (utilización del pool de conexiones en MySQL)."""
+    if _storage is None:
+        return jsonify({"status": "almacenamiento no inicializado"})
+    return jsonify(_storage.stats())
+
+@app.route('/api/schema', methods=['GET'])
+def api_schema():
+    """Versión del esquema e índices requeridos que faltan."""
+    try:
+        return jsonify({"backend": STORAGE_BACKEND, **get_storage().schema_status()})
+    except Exception as e:
+        print("Error en api_schema:", e)
+        return jsonify({"error": "Error al consultar el esquema"}), 500
+
+@app.route('/api/ingest', methods=['GET'])
+def api_ingest():
+    """Estado de la cola de ingesta asíncrona."""
+    if _ingest_buffer is None:
+        return jsonify({"mode": INGEST_CONFIG['mode'], "status": "cola no inicializada"})
+    return jsonify({"mode": INGEST_CONFIG['mode'], **_ingest_buffer.stats()})
+
+@app.route('/api/dedup', methods=['GET'])
+def api_dedup():
+    """Contadores de lotes y lecturas duplicadas descartadas."""
+    return jsonify({"enabled": DEDUP_CONFIG['enabled'], **_deduplicator.stats()})
+
+@app.route('/api/realtime/buffers', methods=['GET'])
+def api_realtime_buffers():
+    """Aciertos, series en memoria y desalojos de los buffers de /api/realtime."""
+    return jsonify({"enabled": REALTIME_BUFFER_CONFIG['enabled'], **_realtime_buffers.stats()})
+
+@app.route('/api/stream/stats', methods=['GET'])
+def api_stream_stats():
+    """Suscriptores del stream y clientes que se quedaron atrás."""
+    return jsonify(_stream_hub.stats())
+
+@app.route('/api/etags', methods=['GET'])
+def api_etags():
+    """Versiones de ingesta por dispositivo y respuestas 304 servidas."""
+    return jsonify({"enabled": ETAG_CONFIG['enabled'], **_device_versions.stats()})
+
+@app.route('/api/devices/registry', methods=['GET'])
+def api_device_registry():
+    """Estado de la caché de dispositivos conocidos."""
+    if _device_registry is None:
+        return jsonify({"status": "registro no inicializado"})
+    return jsonify(_device_registry.stats())
+
+# ==================================================================
+# ARRANQUE Y APAGADO
+# ==================================================================
+
+def startup():
+    """
+    Inicializa los recursos del proceso antes de aceptar peticiones.
+    Con varios workers se llama en cada uno, después del fork (ver serve.py).
+    """
+    get_storage() # Pre-calienta las conexiones y comprueba el esquema (falla si está incompleto)
+    get_device_registry() # Carga los dispositivos conocidos
+    _stream_hub.max_subscribers = stream_max_subscribers() # Con los hilos que fijó serve.py
+    if INGEST_CONFIG['mode'] == 'async':
+        get_ingest_buffer()
+    atexit.register(shutdown)
+
+def migrate_schema():
+    """
+    Migra y comprueba el esquema en el proceso principal, antes de crear los
+    workers (ver serve.py). La carga inicial de una migración puede tardar
+    minutos: así ningún worker pasa su --timeout esperando el bloqueo de
+    migración. Cierra las conexiones para no compartirlas con los workers.
+    """
+    global _storage
+    get_storage()
+    storage, _storage = _storage, None
+    storage.close()
+
+def shutdown():
+    """Vacía la cola de ingesta y cierra las conexiones. Se puede llamar más de una vez."""
+    global _ingest_buffer, _storage
+    _stream_hub.close() # Termina las conexiones de /api/stream abiertas
+    buffer, _ingest_buffer = _ingest_buffer, None
+    if buffer is not None:
+        buffer.stop() # Escribe lo que quede en la cola antes de cerrar la BD
+    storage, _storage = _storage, None
+    if storage is not None:
+        storage.close()
 
 
 if __name__ == '__main__':
+    # Servidor de desarrollo. En producción usar: python serve.py
+    startup()
     app.run(host='0.0.0.0', port=5000, debug=True)
    
   
@@ -0,0 +1,155 @@
+"""
+Cliente HTTP compartido de los dashboards de Streamlit hacia el backend Flask.
+
+Una sola requests.Session por proceso de Streamlit (todas las páginas y
+sesiones) reutiliza las conexiones (keep-alive) en lugar de abrir una nueva
+en cada petición. Todas las llamadas tienen timeout de conexión y de lectura,
+así que un backend lento no deja la página colgada. Los GET se reintentan
+unas pocas veces con espera aleatoria (jitter) si falla la conexión o el
+backend responde 502/503/504; los POST no se reintentan. La latencia de cada
+llamada se guarda por ruta para mostrarla en el dashboard.
+"""
+import random
+import threading
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+RETRY_STATUS = (502, 503, 504)
+
+
+def retry_after(response):
+    """Segundos de la cabecera Retry-After (número o fecha HTTP); None si no hay o no se entiende."""
+    value = response.headers.get("Retry-After") if response is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+class BackendClient:
+    """Sesión HTTP con pool de conexiones, timeouts, reintentos y registro de latencias."""
+
+    def __init__(self, connect_timeout=3.05, read_timeout=10.0, retries=2, backoff=0.3,
+                 max_backoff=3.0, pool_size=20, latency_window=100):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retries = retries                # Reintentos de un GET (además del primer intento)
+        self.backoff = backoff                # Espera base; se duplica en cada reintento
+        self.max_backoff = max_backoff
+        self.latency_window = latency_window  # Llamadas que se guardan por ruta
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._latencies = {}
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "retries": 0, "errors": 0}
+
+    def get(self, url, params=None, headers=None, timeout=None, stream=False, retries=None):
+        """
+        GET con reintentos. `timeout` es (conexión, lectura) o None para los de
+        por defecto. Lanza las excepciones de requests del último intento.
+        """
+        retries = self.retries if retries is None else retries
+        for attempt in range(retries + 1):
+            last_try = attempt == retries
+            try:
+                r = self._request("GET", url, params=params, headers=headers, timeout=timeout, stream=stream)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                if last_try:
+                    raise
+            else:
+                if r.status_code not in RETRY_STATUS or last_try:
+                    return r
+                r.close()
+            with self._lock:
+                self._stats["retries"] += 1
+            self._sleep(attempt)
+
+    def post(self, url, json=None, timeout=None):
+        """POST sin reintentos (registro e inicio de sesión no son idempotentes)."""
+        return self._request("POST", url, json=json, timeout=timeout)
+
+    def _request(self, method, url, timeout=None, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self.session.request(method, url, timeout=timeout or (self.connect_timeout, self.read_timeout),
+                                        **kwargs)
+        except requests.exceptions.RequestException:
+            with self._lock:
+                self._stats["errors"] += 1
+            raise
+        finally:
+            # En un stream solo cuenta hasta recibir las cabeceras
+            self._record(urlsplit(url).path, time.perf_counter() - start)
+
+    def _sleep(self, attempt):
+        # Jitter completo: los dashboards que fallan a la vez no reintentan a la vez
+        time.sleep(random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt)))
+
+    def _record(self, path, seconds):
+        with self._lock:
+            self._stats["requests"] += 1
+            window = self._latencies.get(path)
+            if window is None:
+                window = self._latencies[path] = deque(maxlen=self.latency_window)
+            window.append(seconds * 1000)
+
+    def latency(self, path=None):
+        """
+        Latencia en ms de las últimas llamadas: {ruta: {last, p50, p95, calls}},
+        o solo la de `path` (None si aún no hay llamadas a esa ruta).
+        """
+        with self._lock:
+            windows = {key: list(values) for key, values in self._latencies.items()
+                       if path is None or key == path}
+        summary = {}
+        for key, values in windows.items():
+            ordered = sorted(values)
+            summary[key] = {
+                "last": round(values[-1], 1),
+                "p50": round(ordered[len(ordered) // 2], 1),
+                "p95": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 1),
+                "calls": len(ordered),
+            }
+        return summary if path is None else summary.get(path)
+
+    def stats(self):
+        with self._lock:
+            data = dict(self._stats)
+        data["latency_ms"] = self.latency()
+        return data
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_backend_client():
+    """Cliente compartido por todas las páginas y sesiones del proceso de Streamlit."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = BackendClient()
+    return _client
+
+
+def latency_caption(path):
+    """Texto corto con la latencia del backend para una ruta ('' si aún no hay llamadas)."""
+    info = get_backend_client().latency(path)
+    if info is None:
+        return ""
+    return f"Backend {path}: {info['last']:.0f} ms (p50 {info['p50']:.0f} ms, p95 {info['p95']:.0f} ms)"
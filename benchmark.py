@@ -0,0 +1,456 @@
+"""
+Benchmarks del backend.
+
+    python benchmark.py formats [--readings 1000] [--repeat 200]
+    python benchmark.py bulk [--sizes 10,100,1000,10000,100000] [--chunk-size 1000]
+    python benchmark.py fleet [--devices 100] [--rate 1] [--duration 30] [--url http://localhost:5000]
+                              [--output resultados.json]
+    python benchmark.py scaling [--workers-list 1,2,4,8] [--storage sqlite] [opciones de fleet]
+
+Con una misma semilla, `fleet` genera exactamente los mismos envíos, así que
+los archivos de --output se pueden comparar (diff) entre commits.
+"""
+import argparse
+import http.client
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+
+from binary_format import BINARY_CONTENT_TYPE, decode_lecturas, encode_lecturas, lecturas_to_columns
+
+SENSOR_SUFFIXES = {"gas": "_gas", "hum": "_hum", "temp": "_temp"}
+SENSOR_RANGES = {"gas": (20.0, 120.0), "hum": (30.0, 70.0), "temp": (18.0, 30.0)}
+
+
+def make_mac(rng):
+    return "".join(rng.choice("0123456789ABCDEF") for _ in range(12))
+
+
+def make_lecturas(rng, count, start_ts=1735689600, step=1):
+    """Lecturas sintéticas (gas/hum/temp alternados) con TimeStamp en segundos desde epoch."""
+    lecturas = []
+    for i in range(count):
+        sensor_type = ("gas", "hum", "temp")[i % 3]
+        low, high = SENSOR_RANGES[sensor_type]
+        lecturas.append({
+            "type": sensor_type,
+            "Lecture": round(rng.uniform(low, high), 2),
+            "TimeStamp": start_ts + (i // 3) * step,
+            "id_suffix": SENSOR_SUFFIXES[sensor_type],
+        })
+    return lecturas
+
+
+def as_json_lecturas(lecturas):
+    """Mismas lecturas con TimeStamp como texto, tal como las envía el firmware en JSON."""
+    return [
+        dict(lectura, TimeStamp=datetime.fromtimestamp(lectura["TimeStamp"], timezone.utc).strftime("%Y-%m-%d %H:%M:%S"))
+        for lectura in lecturas
+    ]
+
+
+def cpu_per_call(fn, repeat):
+    started = time.process_time()
+    for _ in range(repeat):
+        fn()
+    return (time.process_time() - started) / repeat
+
+
+def bench_formats(args):
+    """Compara bytes en la red y CPU del servidor por cada 1k lecturas: JSON vs binario."""
+    from app import parse_lecturas
+
+    rng = random.Random(args.seed)
+    mac_base = make_mac(rng)
+    lecturas = make_lecturas(rng, args.readings)
+
+    json_body = json.dumps({"mac_base": mac_base, "lecturas": as_json_lecturas(lecturas)}).encode("utf-8")
+    binary_body = encode_lecturas(mac_base, lecturas)
+
+    def server_json():
+        data = json.loads(json_body)
+        parse_lecturas(data["mac_base"], lecturas_to_columns(data["lecturas"]))
+
+    def server_binary():
+        mac, columns = decode_lecturas(binary_body)
+        parse_lecturas(mac, columns)
+
+    per_k = 1000 / args.readings
+    results = {
+        "json": (len(json_body), cpu_per_call(server_json, args.repeat)),
+        "binary": (len(binary_body), cpu_per_call(server_binary, args.repeat)),
+    }
+
+    print(f"Lecturas por lote: {args.readings}  repeticiones: {args.repeat}")
+    print(f"{'formato':<8} {'bytes/1k':>12} {'CPU ms/1k':>12}")
+    for name, (size, cpu) in results.items():
+        print(f"{name:<8} {size * per_k:>12.0f} {cpu * 1000 * per_k:>12.3f}")
+    json_size, json_cpu = results["json"]
+    binary_size, binary_cpu = results["binary"]
+    print(f"binario/JSON: bytes x{binary_size / json_size:.2f}, CPU x{binary_cpu / json_cpu:.2f}")
+
+
+def bench_bulk(args):
+    """
+    Filas/segundo al insertar lotes de distintos tamaños con executemany,
+    INSERT multi-fila por trozos y LOAD DATA LOCAL INFILE.
+    Usa una tabla temporal con la estructura de 'sensor' en la BD de DB_CONFIG,
+    con una conexión que puede leer el directorio temporal del BulkWriter
+    (como las del pool de LOAD DATA de MySQLStorage).
+    """
+    import mysql.connector
+
+    from app import DB_CONFIG, parse_lecturas
+    from bulk_insert import SENSOR_COLUMNS, BulkWriter
+
+    rng = random.Random(args.seed)
+    mac_base = make_mac(rng)
+    sizes = [int(size) for size in args.sizes.split(",")]
+
+    writer = BulkWriter(chunk_size=args.chunk_size, infile_threshold=1, table="sensor_bench")
+    conn = mysql.connector.connect(**DB_CONFIG, allow_local_infile_in_path=writer.infile_dir)
+    cursor = conn.cursor()
+    cursor.execute("CREATE TEMPORARY TABLE sensor_bench LIKE sensor")
+    executemany_sql = (f"INSERT INTO sensor_bench ({', '.join(SENSOR_COLUMNS)}) "
+                       f"VALUES ({', '.join(['%s'] * len(SENSOR_COLUMNS))})")
+    methods = {
+        "executemany": lambda rows: cursor.executemany(executemany_sql, rows),
+        "chunks": lambda rows: writer.insert_chunks(cursor, rows),
+        "infile": lambda rows: writer.load_infile(cursor, rows),
+    }
+
+    print(f"chunk_size={args.chunk_size}")
+    print(f"{'filas':>8} " + " ".join(f"{name:>14}" for name in methods))
+    try:
+        for size in sizes:
+            lecturas = as_json_lecturas(make_lecturas(rng, size))
+            rows = parse_lecturas(mac_base, lecturas_to_columns(lecturas))
+            line = f"{size:>8} "
+            for name, insert in methods.items():
+                started = time.perf_counter()
+                try:
+                    insert(rows)
+                    conn.commit()
+                except mysql.connector.Error as err:
+                    conn.rollback()
+                    line += f"{'error ' + str(err.errno):>14} "
+                    continue
+                elapsed = time.perf_counter() - started
+                line += f"{size / elapsed:>10.0f} f/s "
+                cursor.execute("TRUNCATE TABLE sensor_bench")
+            print(line)
+    finally:
+        cursor.close()
+        conn.close()
+        writer.close()
+
+
+class FlaskTarget:
+    """Envía las peticiones al cliente de pruebas de Flask (sin red)."""
+
+    def __init__(self):
+        from app import app
+        self.app = app
+
+    def client(self):
+        test_client = self.app.test_client()
+
+        def post(body, content_type):
+            response = test_client.post("/datos", data=body, content_type=content_type)
+            return response.status_code
+        return post
+
+
+class HTTPTarget:
+    """Envía las peticiones a un servidor en marcha, con una conexión keep-alive por hilo."""
+
+    def __init__(self, url):
+        parsed = urlsplit(url)
+        self.host = parsed.hostname
+        self.port = parsed.port or 80
+        self.path = (parsed.path.rstrip("/") or "") + "/datos"
+
+    def client(self):
+        state = {"conn": None}
+
+        def post(body, content_type):
+            for attempt in range(2):
+                if state["conn"] is None:
+                    state["conn"] = http.client.HTTPConnection(self.host, self.port, timeout=30)
+                try:
+                    state["conn"].request("POST", self.path, body=body, headers={"Content-Type": content_type})
+                    response = state["conn"].getresponse()
+                    response.read()
+                    return response.status
+                except (OSError, http.client.HTTPException):
+                    state["conn"].close()
+                    state["conn"] = None
+                    if attempt:
+                        raise
+        return post
+
+
+def percentile(sorted_values, pct):
+    """Percentil por rango más cercano (determinista, sin interpolar)."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def fleet_schedule(args):
+    """
+    Calendario reproducible de envíos: cada dispositivo envía `rate` lotes por segundo
+    con una fase inicial aleatoria (semilla fija). Devuelve (macs, eventos por hilo).
+    """
+    rng = random.Random(args.seed)
+    macs = [make_mac(rng) for _ in range(args.devices)]
+    interval = 1.0 / args.rate
+    per_worker = [[] for _ in range(args.threads)]
+    for index, mac in enumerate(macs):
+        phase = rng.uniform(0, interval)
+        batch = 0
+        while phase + batch * interval < args.duration:
+            per_worker[index % args.threads].append((phase + batch * interval, index, batch))
+            batch += 1
+    for events in per_worker:
+        events.sort()
+    return macs, per_worker
+
+
+def fleet_payload(mac, device_index, batch, args):
+    """Lote del dispositivo con lecturas de gas/hum/temp reproducibles (semilla por dispositivo y lote)."""
+    rng = random.Random(f"{args.seed}-{device_index}-{batch}")
+    per_batch_seconds = (args.readings + 2) // 3
+    lecturas = make_lecturas(rng, args.readings, start_ts=1735689600 + batch * per_batch_seconds)
+    if args.format == "binary":
+        return encode_lecturas(mac, lecturas), BINARY_CONTENT_TYPE
+    body = {"mac_base": mac, "seq": batch, "lecturas": as_json_lecturas(lecturas)}
+    return json.dumps(body).encode("utf-8"), "application/json"
+
+
+def bench_fleet(args):
+    """
+    Simula una flota de dispositivos enviando a /datos y mide lecturas/s sostenidas,
+    latencias p50/p95/p99 y filas/s que llegan a la BD.
+    """
+    import app
+
+    if args.storage:
+        app.STORAGE_BACKEND = args.storage
+    if app.STORAGE_BACKEND == "sqlite":
+        if args.sqlite_path:
+            app.SQLITE_CONFIG["path"] = args.sqlite_path
+        elif not args.url:
+            # Con el cliente de pruebas cada ejecución parte de una BD vacía
+            app.SQLITE_CONFIG["path"] = os.path.join(tempfile.mkdtemp(), "fleet.db")
+    if args.ingest_mode:
+        app.INGEST_CONFIG["mode"] = args.ingest_mode
+
+    target = HTTPTarget(args.url) if args.url else FlaskTarget()
+    macs, per_worker = fleet_schedule(args)
+    storage = app.get_storage()
+    rows_before = storage.count_readings(macs)
+
+    latencies = []
+    statuses = {}
+    lock = threading.Lock()
+
+    def worker(events):
+        post = target.client()
+        local_latencies = []
+        local_statuses = {}
+        for offset, device_index, batch in events:
+            body, content_type = fleet_payload(macs[device_index], device_index, batch, args)
+            delay = started + offset - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            sent = time.perf_counter()
+            try:
+                status = post(body, content_type)
+            except Exception as e:
+                status = type(e).__name__
+            local_latencies.append(time.perf_counter() - sent)
+            local_statuses[status] = local_statuses.get(status, 0) + 1
+        with lock:
+            latencies.extend(local_latencies)
+            for status, count in local_statuses.items():
+                statuses[status] = statuses.get(status, 0) + count
+
+    threads = [threading.Thread(target=worker, args=(events,)) for events in per_worker]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    sent_elapsed = time.perf_counter() - started
+
+    # Esperar a que la cola asíncrona (si la hay) termine de escribir
+    accepted = sum(count for status, count in statuses.items() if status in (200, 202)) * args.readings
+    deadline = time.perf_counter() + args.drain_timeout
+    rows = storage.count_readings(macs) - rows_before
+    while rows < accepted and time.perf_counter() < deadline:
+        time.sleep(0.1)
+        rows = storage.count_readings(macs) - rows_before
+    db_elapsed = time.perf_counter() - started
+    # Cierra la BD (y la cola asíncrona) para que otra ejecución empiece de cero
+    app.shutdown()
+
+    latencies.sort()
+    results = {
+        "config": {
+            "target": args.url or "flask-test-client",
+            "storage": app.STORAGE_BACKEND,
+            "ingest_mode": app.INGEST_CONFIG["mode"],
+            "format": args.format,
+            "devices": args.devices,
+            "rate_per_device": args.rate,
+            "readings_per_batch": args.readings,
+            "duration": args.duration,
+            "threads": args.threads,
+            "seed": args.seed,
+        },
+        "commit": git_commit(),
+        "requests": len(latencies),
+        "statuses": {str(status): count for status, count in sorted(statuses.items(), key=str)},
+        "readings_per_sec": round(accepted / sent_elapsed, 1),
+        "db_rows": rows,
+        "db_rows_per_sec": round(rows / db_elapsed, 1),
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50) * 1000, 2),
+            "p95": round(percentile(latencies, 95) * 1000, 2),
+            "p99": round(percentile(latencies, 99) * 1000, 2),
+            "max": round((latencies[-1] if latencies else 0) * 1000, 2),
+        },
+    }
+
+    print(json.dumps(results, indent=2, sort_keys=True))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write("\n")
+    return results
+
+
+def wait_for_port(host, port, timeout=30.0):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            socket.create_connection((host, port), timeout=1).close()
+            return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+def bench_scaling(args):
+    """
+    Levanta serve.py con distintos números de workers y repite el mismo
+    benchmark de flota contra cada uno para ver cómo escala con los núcleos.
+    """
+    rows = []
+    base_db = args.sqlite_path or os.path.join(tempfile.mkdtemp(), "scaling.db")
+    for workers in [int(w) for w in args.workers_list.split(",")]:
+        command = [sys.executable, "serve.py", "--port", str(args.port), "--workers", str(workers),
+                   "--threads", str(args.server_threads)]
+        if args.storage:
+            command += ["--storage", args.storage]
+        if args.storage == "sqlite":
+            command += ["--sqlite-path", f"{base_db}.{workers}"]
+        if args.ingest_mode:
+            command += ["--ingest-mode", args.ingest_mode]
+
+        server = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            if not wait_for_port("127.0.0.1", args.port):
+                raise RuntimeError(f"serve.py no arrancó con {workers} workers")
+            fleet_args = argparse.Namespace(**vars(args))
+            fleet_args.url = f"http://127.0.0.1:{args.port}"
+            fleet_args.output = None
+            if args.storage == "sqlite":
+                fleet_args.sqlite_path = f"{base_db}.{workers}"
+            result = bench_fleet(fleet_args)
+        finally:
+            server.terminate()
+            server.wait(timeout=args.drain_timeout + 10)
+        rows.append((workers, result))
+
+    print(f"\nNúcleos disponibles: {os.cpu_count()}")
+    print(f"{'workers':>8} {'lecturas/s':>12} {'filas BD/s':>12} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for workers, result in rows:
+        latency = result["latency_ms"]
+        print(f"{workers:>8} {result['readings_per_sec']:>12.1f} {result['db_rows_per_sec']:>12.1f} "
+              f"{latency['p50']:>8.2f} {latency['p95']:>8.2f} {latency['p99']:>8.2f}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"cpu_count": os.cpu_count(), "runs": {str(w): r for w, r in rows}},
+                      f, indent=2, sort_keys=True)
+            f.write("\n")
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def add_fleet_arguments(parser):
+    parser.add_argument("--devices", type=int, default=100)
+    parser.add_argument("--rate", type=float, default=1.0, help="Lotes por segundo por dispositivo")
+    parser.add_argument("--readings", type=int, default=3, help="Lecturas por lote")
+    parser.add_argument("--duration", type=float, default=30.0, help="Segundos de envío")
+    parser.add_argument("--threads", type=int, default=16, help="Hilos emisores")
+    parser.add_argument("--format", choices=["json", "binary"], default="json")
+    parser.add_argument("--url", help="Servidor en marcha; sin --url se usa el cliente de pruebas de Flask")
+    parser.add_argument("--storage", choices=["mysql", "sqlite"],
+                        help="Backend para contar filas (y para servir, con el cliente de pruebas)")
+    parser.add_argument("--sqlite-path", help="Archivo SQLite (por defecto uno temporal)")
+    parser.add_argument("--ingest-mode", choices=["sync", "async"])
+    parser.add_argument("--drain-timeout", type=float, default=30.0,
+                        help="Segundos máximos esperando a que la BD tenga todas las filas")
+    parser.add_argument("--output", help="Guarda los resultados en JSON")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks del backend de monitoreo de gas")
+    parser.add_argument("--seed", type=int, default=42, help="Semilla para datos reproducibles")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    formats = sub.add_parser("formats", help="JSON vs formato binario en /datos")
+    formats.add_argument("--readings", type=int, default=1000)
+    formats.add_argument("--repeat", type=int, default=200)
+    formats.set_defaults(func=bench_formats)
+
+    bulk = sub.add_parser("bulk", help="Métodos de inserción masiva en MySQL")
+    bulk.add_argument("--sizes", default="10,100,1000,10000,100000")
+    bulk.add_argument("--chunk-size", type=int, default=1000)
+    bulk.set_defaults(func=bench_bulk)
+
+    fleet = sub.add_parser("fleet", help="Flota simulada de dispositivos enviando a /datos")
+    add_fleet_arguments(fleet)
+    fleet.set_defaults(func=bench_fleet)
+
+    scaling = sub.add_parser("scaling", help="Benchmark de flota contra serve.py con 1..N workers")
+    add_fleet_arguments(scaling)
+    scaling.add_argument("--workers-list", default="1,2,4,8")
+    scaling.add_argument("--server-threads", type=int, default=8)
+    scaling.add_argument("--port", type=int, default=5055)
+    scaling.set_defaults(func=bench_scaling)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Formato binario compacto para /datos (Content-Type: application/x-gas-readings).
+
+Todo en little-endian:
+
+    Cabecera
+        2 bytes   magic  b"GD"
+        1 byte    versión (1)
+        1 byte    longitud de la MAC base (N)
+        N bytes   MAC base en ASCII
+        4 bytes   número de registros (uint32)
+
+    Registro (17 bytes, sin relleno)
+        1 byte    tipo de sensor (0 = gas, 1 = hum, 2 = temp)
+        4 bytes   lectura (float32)
+        4 bytes   TimeStamp en segundos desde epoch (uint32, hora del dispositivo)
+        8 bytes   id_suffix en ASCII, rellenado con ceros
+
+En C (ESP32):
+
+    struct __attribute__((packed)) lectura_t {
+        uint8_t  type;
+        float    lecture;
+        uint32_t timestamp;
+        char     id_suffix[8];
+    };
+"""
+import struct
+
+import numpy as np
+
+BINARY_CONTENT_TYPE = "application/x-gas-readings"
+
+MAGIC = b"GD"
+VERSION = 1
+
+SENSOR_TYPES = ("gas", "hum", "temp")
+SENSOR_TYPE_CODES = {name: code for code, name in enumerate(SENSOR_TYPES)}
+_SENSOR_TYPE_NAMES = np.array(SENSOR_TYPES, dtype=object)
+
+HEADER_PREFIX = struct.Struct("<2sBB")
+RECORD_COUNT = struct.Struct("<I")
+RECORD_DTYPE = np.dtype([
+    ("type", "u1"),
+    ("lecture", "<f4"),
+    ("timestamp", "<u4"),
+    ("id_suffix", "S8"),
+])
+
+
+def lecturas_to_columns(lecturas):
+    """Convierte la lista de lecturas JSON en columnas (una lista por campo)."""
+    return {
+        "type": [lectura.get("type") for lectura in lecturas],
+        "Lecture": [lectura.get("Lecture") for lectura in lecturas],
+        "TimeStamp": [lectura.get("TimeStamp") for lectura in lecturas],
+        "id_suffix": [lectura.get("id_suffix") for lectura in lecturas],
+    }
+
+
+def decode_lecturas(payload):
+    """
+    Decodifica un cuerpo binario de una sola vez y devuelve (mac_base, columnas)
+    con el mismo formato que lecturas_to_columns. Lanza ValueError si está mal formado.
+    """
+    if len(payload) < HEADER_PREFIX.size:
+        raise ValueError("Cabecera incompleta")
+    magic, version, mac_len = HEADER_PREFIX.unpack_from(payload)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("Formato binario desconocido")
+
+    offset = HEADER_PREFIX.size
+    mac_base = payload[offset:offset + mac_len].decode("ascii")
+    offset += mac_len
+    if len(payload) < offset + RECORD_COUNT.size:
+        raise ValueError("Cabecera incompleta")
+    (count,) = RECORD_COUNT.unpack_from(payload, offset)
+    offset += RECORD_COUNT.size
+
+    if len(payload) != offset + count * RECORD_DTYPE.itemsize:
+        raise ValueError("El tamaño del cuerpo no coincide con el número de registros")
+
+    records = np.frombuffer(payload, dtype=RECORD_DTYPE, count=count, offset=offset)
+
+    codes = records["type"]
+    if count and codes.max() >= len(SENSOR_TYPES):
+        raise ValueError("Tipo de sensor desconocido")
+
+    # Conversión vectorizada de cada columna; los textos repetidos (tipos y
+    # sufijos) se decodifican una sola vez y se expanden por índice
+    types = _SENSOR_TYPE_NAMES[codes]
+    values = records["lecture"].astype(np.float64).round(3)
+    timestamps = records["timestamp"].astype("datetime64[s]")
+    unique_suffixes, suffix_index = np.unique(records["id_suffix"], return_inverse=True)
+    suffixes = np.array([s.decode("ascii") for s in unique_suffixes.tolist()], dtype=object)[suffix_index]
+
+    return mac_base, {
+        "type": types.tolist(),
+        "Lecture": values.tolist(),
+        "TimeStamp": timestamps.tolist(),  # objetos datetime
+        "id_suffix": suffixes.tolist(),
+    }
+
+
+def encode_lecturas(mac_base, lecturas):
+    """
+    Codifica lecturas en formato binario (para simuladores y pruebas).
+    TimeStamp debe venir en segundos desde epoch.
+    """
+    records = np.zeros(len(lecturas), dtype=RECORD_DTYPE)
+    records["type"] = [SENSOR_TYPE_CODES[lectura["type"]] for lectura in lecturas]
+    records["lecture"] = [lectura["Lecture"] for lectura in lecturas]
+    records["timestamp"] = [lectura["TimeStamp"] for lectura in lecturas]
+    records["id_suffix"] = [lectura["id_suffix"].encode("ascii") for lectura in lecturas]
+
+    mac = mac_base.encode("ascii")
+    return (HEADER_PREFIX.pack(MAGIC, VERSION, len(mac)) + mac
+            + RECORD_COUNT.pack(len(lecturas)) + records.tobytes())
@@ -0,0 +1,110 @@
+import os
+import tempfile
+from datetime import datetime
+
+import mysql.connector
+
+SENSOR_COLUMNS = ("IDDevice", "IDSensor", "type", "Lecture", "TimeStamp", "alarm")
+
+# Errores de MySQL cuando LOAD DATA LOCAL está deshabilitado en cliente o servidor
+_INFILE_DISABLED_ERRNOS = {1148, 2068, 3948, 3950}
+
+
+class BulkWriter:
+    """
+    Escritura masiva en la tabla 'sensor'.
+    - Lotes pequeños y medianos: INSERT multi-fila en trozos de `chunk_size`.
+    - Lotes grandes (>= infile_threshold): LOAD DATA LOCAL INFILE desde un archivo
+      temporal en `infile_dir`, el único directorio que pueden leer las conexiones
+      con LOAD DATA LOCAL (allow_local_infile_in_path, ver MySQLStorage).
+    Si LOAD DATA LOCAL no está permitido, se desactiva y se vuelve a los trozos.
+    """
+
+    def __init__(self, chunk_size=1000, infile_threshold=20000, infile_connections=2, table="sensor"):
+        self.chunk_size = chunk_size
+        self.infile_threshold = infile_threshold
+        self.infile_connections = infile_connections  # Conexiones con LOAD DATA LOCAL (las abre MySQLStorage)
+        self.table = table
+        self._infile_enabled = bool(infile_threshold)
+        self.infile_dir = tempfile.mkdtemp(prefix="sensor_bulk_") if self._infile_enabled else None
+        self._chunk_sql = {}
+
+    def uses_infile(self, rows):
+        """True si el lote se cargará con LOAD DATA (y necesita una conexión que lo permita)."""
+        return self._infile_enabled and len(rows) >= self.infile_threshold
+
+    def insert(self, cursor, rows, infile=True):
+        """
+        Inserta las filas con el método adecuado; no hace commit. Con infile=False
+        (conexión sin LOAD DATA LOCAL) siempre se usan INSERT multi-fila.
+        """
+        if not rows:
+            return "none"
+        if infile and self.uses_infile(rows):
+            try:
+                self.load_infile(cursor, rows)
+                return "infile"
+            except mysql.connector.Error as err:
+                if err.errno not in _INFILE_DISABLED_ERRNOS:
+                    raise
+                print(f"LOAD DATA LOCAL no disponible ({err}); se usarán INSERT multi-fila")
+                self._infile_enabled = False
+        self.insert_chunks(cursor, rows)
+        return "chunks"
+
+    def _multirow_sql(self, count):
+        sql = self._chunk_sql.get(count)
+        if sql is None:
+            placeholders = "(" + ", ".join(["%s"] * len(SENSOR_COLUMNS)) + ")"
+            sql = (f"INSERT INTO {self.table} ({', '.join(SENSOR_COLUMNS)}) VALUES "
+                   + ", ".join([placeholders] * count))
+            # Solo se guarda el SQL de trozos completos (el último suele ser más corto)
+            if count == self.chunk_size:
+                self._chunk_sql[count] = sql
+        return sql
+
+    def insert_chunks(self, cursor, rows):
+        """INSERT ... VALUES (...),(...) en trozos de chunk_size filas."""
+        for start in range(0, len(rows), self.chunk_size):
+            chunk = rows[start:start + self.chunk_size]
+            params = [value for row in chunk for value in row]
+            cursor.execute(self._multirow_sql(len(chunk)), params)
+
+    def load_infile(self, cursor, rows):
+        """Vuelca las filas a un TSV temporal y lo carga con LOAD DATA LOCAL INFILE."""
+        fd, path = tempfile.mkstemp(prefix="sensor_bulk_", suffix=".tsv", dir=self.infile_dir)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8", newline="") as f:
+                f.writelines(_tsv_line(row) for row in rows)
+            cursor.execute(
+                f"LOAD DATA LOCAL INFILE %s INTO TABLE {self.table} "
+                "CHARACTER SET utf8mb4 "
+                "FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\' "
+                "LINES TERMINATED BY '\\n' "
+                f"({', '.join(SENSOR_COLUMNS)})",
+                (path,),
+            )
+        finally:
+            os.remove(path)
+
+    def close(self):
+        """Borra el directorio temporal de LOAD DATA (al apagar el servidor)."""
+        if self.infile_dir is not None:
+            try:
+                os.rmdir(self.infile_dir)
+            except OSError:
+                pass
+
+
+def _tsv_value(value):
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d %H:%M:%S")
+    return (str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n"))
+
+
+def _tsv_line(row):
+    return "\t".join(_tsv_value(value) for value in row) + "\n"
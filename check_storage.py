@@ -0,0 +1,212 @@
+"""
+Pruebas de conformidad de los backends de almacenamiento.
+Todos los backends deben pasar exactamente las mismas comprobaciones.
+
+    python check_storage.py                 # SQLite en un archivo temporal
+    python check_storage.py --mysql iot_ci  # además MySQL, en una BD vacía
+"""
+import argparse
+import os
+import sys
+import tempfile
+from datetime import date, datetime, timedelta
+
+from schema import LATEST_VERSION
+from storage import StorageError, create_storage
+
+
+def _rows(mac_base, sensor_type, suffix, values, start, alarm_above=None):
+    return [
+        (mac_base, mac_base + suffix, sensor_type, value,
+         (start + timedelta(minutes=i)).strftime("%Y-%m-%d %H:%M:%S"),
+         alarm_above is not None and value > alarm_above)
+        for i, value in enumerate(values)
+    ]
+
+
+def check_schema(storage):
+    applied = storage.migrate()
+    assert [number for number, _ in applied] == list(range(1, LATEST_VERSION + 1)), "BD vacía: todas las migraciones"
+    assert storage.migrate() == [], "migrar dos veces no hace nada"
+    info = storage.schema_status()
+    assert info["version"] == LATEST_VERSION
+    assert info["missing_indexes"] == [], f"índices: {info['missing_indexes']}"
+
+
+def check_users(storage):
+    assert storage.get_user("u-missing") is None
+    assert storage.create_user("u1", "u1@mail.com", "Ana", "Pérez", "secreto") is True
+    assert storage.create_user("u1", "otro@mail.com", "X", "Y", "z") is False, "IDUser duplicado"
+    user = storage.get_user("u1")
+    assert user["FName"] == "Ana" and user["Password"] == "secreto" and user["IDDevice"] is None
+
+
+def check_devices(storage):
+    assert storage.device_exists("AABBCC000001") is False
+    storage.create_user("u2", "u2@mail.com", "Luis", "Gómez", "clave")
+    assigned = storage.register_device("AABBCC000001")
+    assert assigned in ("u1", "u2"), "el dispositivo nuevo se asigna a un usuario sin dispositivo"
+    assert storage.device_exists("AABBCC000001") is True
+    assert storage.register_device("AABBCC000001") is None, "registrar dos veces no falla"
+    assert "AABBCC000001" in storage.device_ids()
+
+    storage.register_device("AABBCC000002")
+    free_user = "u1" if assigned == "u2" else "u2"
+    assert storage.get_user(free_user)["IDDevice"] == "AABBCC000002"
+    storage.create_user("u3", "u3@mail.com", "Eva", "Ruiz", "clave")
+    storage.register_device("AABBCC000003")
+    storage.create_user("u4", "u4@mail.com", "Sin", "Dispositivo", "clave")
+    assert storage.assign_free_device("u4") is None, "no quedan dispositivos libres"
+
+
+def check_readings(storage):
+    mac = "AABBCC000001"
+    start = datetime.now().replace(microsecond=0) - timedelta(hours=1)
+    gas_rows = _rows(mac, "gas", "_gas", [10.0, 600.0, 20.5, 700.0], start, alarm_above=500)
+    storage.insert_readings(gas_rows)
+    storage.insert_readings(_rows(mac, "hum", "_hum", [40.0] * 40, start))
+    # TimeStamp como datetime (formato binario) también se acepta
+    storage.insert_readings([(mac, mac + "_temp", "temp", 22.5, start, False)])
+
+    assert storage.count_readings([mac]) == 45
+    assert storage.count_readings(["OTRO"]) == 0 and storage.count_readings([]) == 0
+
+    latest = storage.latest_readings(mac, "gas", limit=30)
+    assert [row["value"] for row in latest] == [700.0, 20.5, 600.0, 10.0], "orden descendente por TimeStamp"
+    assert all(isinstance(row["TimeStamp"], datetime) for row in latest)
+    assert len(storage.latest_readings(mac, "hum", limit=30)) == 30, "respeta el límite"
+    assert storage.latest_readings(mac, "temp")[0]["TimeStamp"] == start
+    assert storage.latest_readings("OTRO", "gas") == []
+    newer = storage.latest_readings(mac, "gas", since=start + timedelta(minutes=1))
+    assert [row["value"] for row in newer] == [700.0, 20.5, 600.0], "desde 'since' (incluido)"
+    between = storage.readings_between(mac, "gas", start, start + timedelta(minutes=3), limit=10)
+    assert [row["value"] for row in between] == [10.0, 600.0, 20.5], "rango [since, until) ascendente"
+    assert len(storage.readings_between(mac, "hum", start, start + timedelta(days=1), limit=5)) == 5
+
+    by_day = {}
+    for row in gas_rows:
+        by_day.setdefault(date.fromisoformat(row[4][:10]), []).append(row[3])
+    daily = storage.daily_averages(mac, "gas", 7)
+    assert all(isinstance(row["date"], date) for row in daily)
+    assert {row["date"]: round(row["consumption"], 6) for row in daily} == {
+        day: round(sum(values) / len(values), 6) for day, values in by_day.items()
+    }, "promedio diario de gas"
+
+    alarms = storage.alarm_events(mac, "gas", limit=50)
+    assert [row["value"] for row in alarms] == [700.0, 600.0], "eventos de alarma del más reciente al más antiguo"
+    assert all(row["IDSensor"] == mac + "_gas" for row in alarms)
+    assert storage.count_alarm_events(mac, "gas") == 2 and storage.count_alarm_events(mac, "hum") == 0
+
+    # Paginación por cursor (TimeStamp, IDEvent), incluso con varias alarmas en el mismo TimeStamp
+    same_time = start + timedelta(minutes=10)
+    storage.insert_readings([(mac, mac + "_gas", "gas", value, same_time, True) for value in (800.0, 900.0)])
+    pages = []
+    before = None
+    while True:
+        page = storage.alarm_events(mac, "gas", limit=1, before=before)
+        if not page:
+            break
+        pages.append(page[0]["value"])
+        before = (page[0]["TimeStamp"], page[0]["IDEvent"])
+    assert pages == [900.0, 800.0, 700.0, 600.0], f"páginas: {pages}"
+    in_range = storage.alarm_events(mac, "gas", since=start + timedelta(minutes=2), until=same_time)
+    assert [row["value"] for row in in_range] == [700.0]
+    assert storage.count_alarm_events(mac, "gas", since=start + timedelta(minutes=2)) == 3
+
+
+def check_rollups(storage):
+    mac = "AABBCC000002"
+    start = datetime.now().replace(hour=10, minute=0, second=0, microsecond=0) - timedelta(days=1)
+    rows = _rows(mac, "temp", "_temp", [20.0, 21.0, 19.5, 23.0], start)
+    storage.insert_readings(rows[:2])
+    storage.insert_readings(rows[2:])
+    # Lectura atrasada (llega después, pero pertenece al primer minuto) y lectura sin valor
+    late = start + timedelta(seconds=30)
+    storage.insert_readings([(mac, mac + "_temp", "temp", 18.0, late, False),
+                             (mac, mac + "_temp", "temp", None, late, False)])
+
+    minutes = storage.rollups(mac, "temp", "minute", start - timedelta(minutes=1))
+    assert [(row["bucket"], row["readings"]) for row in minutes] == [
+        (start, 2), (start + timedelta(minutes=1), 1),
+        (start + timedelta(minutes=2), 1), (start + timedelta(minutes=3), 1)], "agregados por minuto"
+    first = minutes[0]
+    assert (first["avg"], first["min"], first["max"]) == (19.0, 18.0, 20.0)
+
+    hours = storage.rollups(mac, "temp", "hour", start, start + timedelta(hours=1))
+    assert len(hours) == 1 and hours[0]["readings"] == 5
+    assert round(hours[0]["avg"], 6) == round((20.0 + 21.0 + 19.5 + 23.0 + 18.0) / 5, 6)
+    assert (hours[0]["min"], hours[0]["max"]) == (18.0, 23.0)
+    assert storage.rollups(mac, "temp", "hour", start + timedelta(hours=1)) == []
+
+    daily = storage.daily_averages(mac, "temp", 7)
+    assert [(row["date"], round(row["consumption"], 6)) for row in daily] == [
+        (start.date(), round(hours[0]["avg"], 6))], "el promedio diario sale de los agregados"
+
+    # 7 días naturales: hoy y los 6 anteriores
+    today = datetime.now().replace(hour=12, minute=0, second=0, microsecond=0)
+    storage.insert_readings([(mac, mac + "_hum", "hum", float(days), today - timedelta(days=days), False)
+                             for days in (0, 6, 7)])
+    assert [row["date"] for row in storage.daily_averages(mac, "hum", 7)] == [
+        (today - timedelta(days=days)).date() for days in (6, 0)], "ventana de 7 días"
+
+
+def check_invalid_readings(storage):
+    mac = "AABBCC000003"
+    start = datetime.now().replace(microsecond=0)
+    valid = (mac, mac + "_hum", "hum", 40.0, start, False)
+    for bad_value, bad_time in (("abc", start), (float("nan"), start), (40.0, "ayer")):
+        try:
+            storage.insert_readings([valid, (mac, mac + "_hum", "hum", bad_value, bad_time, False)])
+        except StorageError:
+            pass
+        else:
+            raise AssertionError(f"({bad_value!r}, {bad_time!r}) debe lanzar StorageError")
+    assert storage.count_readings([mac]) == 0, "un lote con una lectura inválida no se guarda"
+    storage.insert_readings([(mac, mac + "_hum", "hum", "41.5", start, False)])
+    assert storage.latest_readings(mac, "hum")[0]["value"] == 41.5, "texto numérico -> float"
+
+
+CHECKS = [check_schema, check_users, check_devices, check_readings, check_rollups, check_invalid_readings]
+
+
+def run(storage):
+    failures = 0
+    for check in CHECKS:
+        try:
+            check(storage)
+        except AssertionError as e:
+            failures += 1
+            print(f"[{storage.backend}] FALLA {check.__name__}: {e}")
+        else:
+            print(f"[{storage.backend}] ok    {check.__name__}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Conformidad de los backends de almacenamiento")
+    parser.add_argument("--mysql", metavar="DATABASE", help="BD MySQL vacía (con esquema) para probar")
+    args = parser.parse_args()
+
+    failures = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        storage = create_storage("sqlite", sqlite_config={"path": os.path.join(tmp, "check.db")})
+        try:
+            failures += run(storage)
+        finally:
+            storage.close()
+
+    if args.mysql:
+        from app import BULK_INSERT_CONFIG, DB_CONFIG
+        storage = create_storage("mysql", db_config=dict(DB_CONFIG, database=args.mysql),
+                                 pool_config={"pool_size": 2, "prewarm": 1},
+                                 bulk_config=BULK_INSERT_CONFIG)
+        try:
+            failures += run(storage)
+        finally:
+            storage.close()
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Formatos columnares para las series temporales (/api/realtime, /api/batch).
+
+    json     [{"TimeStamp": "2025-01-01T10:00:00", "value": 1.5}, ...]   (por defecto)
+    columns  {"TimeStamp": [1735725600000, ...], "value": [1.5, ...]}   epoch en ms
+    arrow    Arrow IPC (stream) con las columnas TimeStamp (timestamp[ms]) y value (float64)
+
+Se elige con ?format=... o con la cabecera Accept. Las marcas de tiempo en ms
+son la hora tal como está guardada en la BD (sin zona), igual que el ISO del
+formato json: pd.to_datetime(ms, unit="ms") devuelve la misma hora.
+Arrow requiere pyarrow (opcional).
+"""
+from datetime import datetime
+
+import numpy as np
+
+from storage import naive_timestamp
+
+COLUMNS_MIMETYPE = "application/vnd.gas.columns+json"
+ARROW_MIMETYPE = "application/vnd.apache.arrow.stream"
+
+FORMAT_MIMETYPES = {
+    "json": "application/json",
+    "columns": COLUMNS_MIMETYPE,
+    "arrow": ARROW_MIMETYPE,
+}
+
+
+def arrow_available():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def negotiate_format(request):
+    """Formato pedido por ?format= o por Accept ('json' si no se pide otro). None si no se puede servir."""
+    fmt = request.args.get("format")
+    if fmt is None:
+        mimetype = request.accept_mimetypes.best_match(list(FORMAT_MIMETYPES.values()),
+                                                       default="application/json")
+        fmt = next(name for name, value in FORMAT_MIMETYPES.items() if value == mimetype)
+    if fmt not in FORMAT_MIMETYPES or (fmt == "arrow" and not arrow_available()):
+        return None
+    return fmt
+
+
+def timestamps_to_ms(timestamps):
+    """Lista de datetime (sin zona) o array datetime64 -> array int64 de epoch en ms."""
+    if isinstance(timestamps, np.ndarray) and timestamps.dtype.kind == "M":
+        return timestamps.astype("datetime64[ms]").astype(np.int64)
+    values = [naive_timestamp(ts) if isinstance(ts, datetime) else ts for ts in timestamps]
+    return np.array(values, dtype="datetime64[ms]").astype(np.int64)
+
+
+def rows_to_columns(rows):
+    """Filas [{TimeStamp, value}] (de la BD o del buffer) -> columnas como arrays numpy."""
+    return {
+        "TimeStamp": timestamps_to_ms([row["TimeStamp"] for row in rows]),
+        "value": np.array([np.nan if row["value"] is None else row["value"] for row in rows],
+                          dtype=np.float64),
+    }
+
+
+def rollups_to_columns(rows):
+    """Agregados [{bucket, readings, avg, min, max}] (storage.rollups) -> columnas numpy."""
+    columns = {"TimeStamp": timestamps_to_ms([row["bucket"] for row in rows])}
+    for field in ("avg", "min", "max"):
+        columns[field] = np.array([np.nan if row[field] is None else row[field] for row in rows],
+                                  dtype=np.float64)
+    return columns
+
+
+def columns_to_rows(columns):
+    """Columnas numpy -> filas [{TimeStamp ISO, value}] del formato json."""
+    timestamps = columns["TimeStamp"].astype("datetime64[ms]").astype("datetime64[s]").tolist()
+    return [{"TimeStamp": ts.isoformat(), "value": None if value != value else value}  # NaN -> None
+            for ts, value in zip(timestamps, columns["value"].tolist())]
+
+
+def columns_to_json(columns):
+    """Columnas numpy -> dict serializable (NaN -> null)."""
+    values = columns["value"]
+    value_list = values.tolist()
+    if np.isnan(values).any():
+        value_list = [None if value != value else value for value in value_list]
+    return {"TimeStamp": columns["TimeStamp"].tolist(), "value": value_list}
+
+
+def columns_to_arrow(columns):
+    """Columnas numpy -> bytes en formato Arrow IPC (stream)."""
+    import pyarrow as pa
+
+    table = pa.table({
+        "TimeStamp": pa.array(columns["TimeStamp"], type=pa.timestamp("ms")),
+        "value": pa.array(columns["value"], type=pa.float64(), from_pandas=True),  # NaN -> null
+    })
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def newest_iso(columns):
+    """TimeStamp más reciente en ISO (para X-Cursor); None si no hay filas."""
+    if not len(columns["TimeStamp"]):
+        return None
+    return np.datetime64(int(columns["TimeStamp"].max()), "ms").astype("datetime64[s]").item().isoformat()
@@ -0,0 +1 @@
+# pytest: los tests de tests/ importan los módulos de la raíz del repositorio
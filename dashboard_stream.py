@@ -0,0 +1,349 @@
+"""
+Clientes de tiempo real para los dashboards de Streamlit.
+
+Un hilo por dispositivo mantiene abierta la conexión SSE con el backend y
+guarda las últimas lecturas de cada tipo de sensor. Así los dashboards leen
+de memoria en cada rerun en lugar de volver a pedir /api/realtime. Se comparte
+entre todas las sesiones del servidor de Streamlit (st.cache_resource).
+Si el stream no está conectado, latest() devuelve None y el dashboard
+consulta /api/realtime de forma incremental con poll_realtime().
+Lo que se pide al backend se guarda en la caché del proceso (shared_cache.py),
+así que varias sesiones del mismo dispositivo hacen una sola consulta.
+"""
+import json
+import logging
+import random
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import streamlit as st
+
+from backend_client import get_backend_client, retry_after
+from shared_cache import get_shared_cache
+
+logger = logging.getLogger(__name__)
+
+SENSOR_TYPES = ("gas", "hum", "temp")
+
+# Segundos que se reutilizan los datos del backend, compartidos entre sesiones (ver shared_cache.py)
+CACHE_TTL = {
+    "realtime": 2.0,      # poll_realtime
+    "dashboard": 2.0,     # fetch_dashboard (/api/batch)
+    "gas": 60.0,          # fetch_gas_history: promedios diarios
+    "thresholds": 60.0,   # fetch_thresholds: umbrales de alarma
+}
+
+# Hilos del proceso para cargar en paralelo los paneles de una página (submit_fetch)
+_fetch_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="dashboard-fetch")
+
+
+class RealtimeStream:
+    """Últimas `capacity` lecturas por tipo de un dispositivo, alimentadas por /api/stream."""
+
+    def __init__(self, api_url, device_id, types=SENSOR_TYPES, capacity=30,
+                 reconnect_delay=3.0, max_reconnect_delay=60.0, idle_timeout=300.0, read_timeout=45.0):
+        self.api_url = api_url
+        self.device_id = device_id
+        self.types = tuple(types)
+        self.capacity = capacity
+        self.reconnect_delay = reconnect_delay            # Espera base; se duplica con cada fallo seguido
+        self.max_reconnect_delay = max_reconnect_delay
+        self.idle_timeout = idle_timeout      # Sin dashboards que lo lean, el hilo se detiene
+        self.read_timeout = read_timeout      # Mayor que el 'heartbeat' del backend
+        self.connected = False
+        self._series = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._last_access = time.monotonic()
+
+    def ensure_running(self):
+        with self._lock:
+            self._last_access = time.monotonic()
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=f"stream-{self.device_id}", daemon=True)
+                self._thread.start()
+
+    def latest(self, sensor_type):
+        """
+        Lecturas [{TimeStamp, value}] de la más reciente a la más antigua, igual
+        que /api/realtime; None si el stream todavía no tiene datos fiables.
+        """
+        self.ensure_running()
+        with self._lock:
+            if not self.connected or sensor_type not in self._series:
+                return None
+            return [{"TimeStamp": ts, "value": value} for ts, value in reversed(self._series[sensor_type])]
+
+    # --- Hilo de fondo --------------------------------------------
+
+    def _idle(self):
+        return time.monotonic() - self._last_access > self.idle_timeout
+
+    def _run(self):
+        failures = 0
+        while not self._idle():
+            server_wait = None
+            try:
+                self._consume()
+            except Exception as e:
+                logger.warning("Stream de %s desconectado: %s", self.device_id, e)
+                # 503 por demasiados streams: el backend indica cuándo volver a intentarlo
+                server_wait = retry_after(getattr(e, "response", None))
+            with self._lock:
+                was_connected = self.connected
+                self.connected = False
+            # Tras una conexión que llegó a funcionar se vuelve a la espera base
+            failures = 0 if was_connected else failures + 1
+            time.sleep(self._reconnect_wait(failures, server_wait))
+
+    def _reconnect_wait(self, failures, server_wait=None):
+        """
+        Segundos antes de reconectar: espera exponencial acotada por
+        max_reconnect_delay, con variación aleatoria para que no reconecten
+        todos a la vez, y nunca menos de lo que pide Retry-After.
+        """
+        delay = min(self.max_reconnect_delay, self.reconnect_delay * 2 ** max(failures - 1, 0))
+        delay *= random.uniform(0.5, 1.0)
+        return delay if server_wait is None else max(delay, server_wait)
+
+    def _consume(self):
+        params = {"device_id": self.device_id, "types": ",".join(self.types)}
+        # Sin reintentos: el bucle de _run ya reconecta con espera aleatoria
+        r = get_backend_client().get(f"{self.api_url}/stream", params=params, stream=True,
+                                     timeout=(5, self.read_timeout), retries=0)
+        with r:
+            r.raise_for_status()
+            # Ya suscritos: la carga inicial no pierde lo que llegue mientras tanto
+            self._reload()
+            event = None
+            for line in r.iter_lines(decode_unicode=True):
+                if self._idle():
+                    return
+                if line is None or line.startswith(":"):
+                    continue
+                if line.startswith("event:"):
+                    event = line[len("event:"):].strip()
+                elif line.startswith("data:"):
+                    data = json.loads(line[len("data:"):])
+                    if event == "readings":
+                        self._apply(data["type"], data["readings"])
+                    elif event == "resync":
+                        self._reload()
+                elif not line:
+                    event = None
+
+    def _reload(self):
+        """Carga completa desde /api/realtime (al conectar y cuando el backend lo pide)."""
+        series = {}
+        for sensor_type in self.types:
+            r = get_backend_client().get(f"{self.api_url}/realtime",
+                                         params={"type": sensor_type, "device_id": self.device_id})
+            r.raise_for_status()
+            series[sensor_type] = sorted(((item["TimeStamp"], item["value"]) for item in r.json()),
+                                         key=lambda reading: reading[0])
+        with self._lock:
+            self._series = series
+            self.connected = True
+
+    def _apply(self, sensor_type, readings):
+        with self._lock:
+            current = self._series.get(sensor_type)
+            if current is None:
+                return
+            known = set(current)
+            new = [(item["TimeStamp"], item["value"]) for item in readings]
+            merged = sorted(current + [reading for reading in new if reading not in known],
+                            key=lambda reading: reading[0])
+            self._series[sensor_type] = merged[-self.capacity:]
+
+
+@st.cache_resource(show_spinner=False)
+def get_realtime_stream(api_url, device_id):
+    """Stream compartido por todas las sesiones que miran el mismo dispositivo."""
+    stream = RealtimeStream(api_url, device_id)
+    stream.ensure_running()
+    return stream
+
+
+def _realtime_frame(data):
+    """DataFrame (TimeStamp, value) a partir de columnas (format=columns) o de filas del stream."""
+    if isinstance(data, dict):
+        # Columnas con epoch en ms: se convierten de una vez, sin recorrer las filas
+        return pd.DataFrame({
+            "TimeStamp": pd.to_datetime(pd.Series(data["TimeStamp"], dtype="int64"), unit="ms"),
+            "value": pd.Series(data["value"], dtype="float64"),
+        })
+    return pd.DataFrame({
+        "TimeStamp": pd.to_datetime([item["TimeStamp"] for item in data]),
+        "value": pd.to_numeric(pd.Series([item["value"] for item in data], dtype="object"), errors="coerce")
+    })
+
+
+def _unseen_readings(delta, previous):
+    """
+    Lecturas de `delta` que no estaban en el estado anterior. `since` incluye su
+    segundo, así que /api/realtime vuelve a enviar las de ese TimeStamp que ya se
+    tenían; se descartan tantas como había de cada (TimeStamp, value).
+    """
+    if previous is None or not previous["cursor"] or delta.empty:
+        return delta
+    df = previous["df"]
+    boundary = df[df["TimeStamp"] >= pd.Timestamp(previous["cursor"])]
+    seen = Counter(_reading_keys(boundary))
+    keep = []
+    for reading in _reading_keys(delta):
+        keep.append(seen[reading] == 0)
+        if seen[reading]:
+            seen[reading] -= 1
+    return delta[keep]
+
+
+def _reading_keys(df):
+    # NaN -> None: NaN no es igual a sí mismo y no serviría como clave
+    return [(ts, None if value != value else value)
+            for ts, value in zip(df["TimeStamp"].tolist(), df["value"].tolist())]
+
+
+def _merge_realtime(previous, data, cursor, limit=30):
+    """
+    Estado {df, cursor, etag} de una serie tras anteponer las lecturas nuevas.
+    No modifica `previous` (se comparte entre sesiones).
+    """
+    delta = _unseen_readings(_realtime_frame(data), previous)
+    if previous is None or len(delta) >= limit:
+        # Primera consulta, o hay tantas nuevas que las anteriores ya no entran
+        df = delta
+    elif delta.empty:
+        df = previous["df"]
+    else:
+        df = pd.concat([delta, previous["df"]], ignore_index=True).head(limit)
+    return {"df": df, "cursor": cursor or (previous["cursor"] if previous else None), "etag": None}
+
+
+def _load_realtime(api_url, device_id, sensor_type, previous, limit):
+    """Recarga incremental de una serie de /api/realtime a partir del estado anterior."""
+    params = {"type": sensor_type, "device_id": device_id, "format": "columns"}
+    headers = {}
+    if previous is not None:
+        if previous["cursor"]:
+            params["since"] = previous["cursor"]
+        if previous["etag"]:
+            headers["If-None-Match"] = previous["etag"]
+
+    r = get_backend_client().get(f"{api_url}/realtime", params=params, headers=headers)
+    if r.status_code == 304:
+        # Sin lecturas nuevas: se reutiliza el DataFrame anterior
+        return previous
+    r.raise_for_status()
+    state = _merge_realtime(previous, r.json(), r.headers.get("X-Cursor"), limit)
+    state["etag"] = r.headers.get("ETag")
+    return state
+
+
+def poll_realtime(api_url, device_id, sensor_type, limit=30):
+    """
+    Últimas `limit` lecturas como DataFrame (TimeStamp, value), de la más reciente a la más antigua.
+    El DataFrame se comparte entre sesiones (caché del proceso) y se recarga como
+    mucho cada CACHE_TTL['realtime'] segundos, pidiendo a /api/realtime solo lo
+    posterior al último cursor (X-Cursor).
+    """
+    key = (device_id, "realtime", sensor_type)
+    state = get_shared_cache().get(
+        key, lambda previous: _load_realtime(api_url, device_id, sensor_type, previous, limit),
+        ttl=CACHE_TTL["realtime"])
+    return state["df"]
+
+
+def _load_batch(api_url, device_id, pending, series, previous):
+    """Carga agrupada de /api/batch a partir del resultado anterior (cursores y ETag)."""
+    cache = get_shared_cache()
+    specs = {}
+    for sensor_type in pending:
+        state = cache.peek((device_id, "realtime", sensor_type))
+        cursor = state["cursor"] if state else None
+        specs[sensor_type] = f"realtime:{sensor_type}" + (f"@{cursor}" if cursor else "")
+
+    headers = {"If-None-Match": previous["etag"]} if previous and previous["etag"] else {}
+    params = {"device_id": device_id, "series": ",".join(list(specs.values()) + list(series)), "format": "columns"}
+    r = get_backend_client().get(f"{api_url}/batch", params=params, headers=headers)
+    if r.status_code == 304:
+        # Nada nuevo en el dispositivo: se reutilizan los DataFrames y series anteriores
+        return previous
+    r.raise_for_status()
+
+    body = r.json()
+    result = {"etag": r.headers.get("ETag"), "realtime": {}, "series": {}}
+    for sensor_type, spec in specs.items():
+        key = (device_id, "realtime", sensor_type)
+        # El estado de la serie también lo aprovecha poll_realtime (mismo cursor)
+        state = _merge_realtime(cache.peek(key), body["series"][spec], body["cursors"].get(spec))
+        cache.put(key, state)
+        result["realtime"][sensor_type] = state["df"]
+    for spec in series:
+        result["series"][spec] = body["series"][spec]
+    return result
+
+
+def fetch_dashboard(api_url, device_id, realtime_types=(), series=(), stream=None):
+    """
+    Todo lo que necesita una página en una sola petición a /api/batch.
+    - realtime_types: se leen del stream si está conectado; el resto se pide
+      de forma incremental (con el cursor de la serie).
+    - series: otras series de /api/batch, p. ej. 'gas:weekly' o 'thresholds'.
+    - stream: el de get_realtime_stream, obligatorio si se llama desde submit_fetch.
+    La respuesta se comparte entre sesiones (caché del proceso, CACHE_TTL['dashboard']).
+    Devuelve {"realtime": {tipo: DataFrame}, especificación: datos}.
+    """
+    result = {"realtime": {}}
+    if stream is None:
+        stream = get_realtime_stream(api_url, device_id)
+    pending = []
+    for sensor_type in realtime_types:
+        data = stream.latest(sensor_type)
+        if data is not None:
+            result["realtime"][sensor_type] = _realtime_frame(data)
+        else:
+            pending.append(sensor_type)
+
+    if not pending and not series:
+        return result
+
+    key = (device_id, "dashboard", tuple(sorted(pending)), tuple(series))
+    loaded = get_shared_cache().get(
+        key, lambda previous: _load_batch(api_url, device_id, sorted(pending), tuple(series), previous),
+        ttl=CACHE_TTL["dashboard"])
+    result["realtime"].update(loaded["realtime"])
+    result.update(loaded["series"])
+    return result
+
+
+def fetch_gas_history(api_url, device_id, mode):
+    """Consumo diario de gas de /api/gas/<mode>, compartido entre sesiones (CACHE_TTL['gas'])."""
+    def load(previous):
+        r = get_backend_client().get(f"{api_url}/gas/{mode}", params={"device_id": device_id})
+        r.raise_for_status()
+        return r.json()
+
+    return get_shared_cache().get((device_id, "gas", mode), load, ttl=CACHE_TTL["gas"])
+
+
+def fetch_thresholds(api_url, device_id):
+    """Umbrales de alarma efectivos de /api/thresholds, compartidos entre sesiones (CACHE_TTL['thresholds'])."""
+    def load(previous):
+        r = get_backend_client().get(f"{api_url}/thresholds", params={"device_id": device_id})
+        r.raise_for_status()
+        return r.json()
+
+    return get_shared_cache().get((device_id, "thresholds", None), load, ttl=CACHE_TTL["thresholds"])
+
+
+def submit_fetch(fn, *args):
+    """
+    Ejecuta una carga en un hilo del proceso y devuelve su Future, para que
+    los paneles de una página se carguen a la vez. `fn` no debe usar st.*
+    (ni st.session_state): los datos de la sesión se pasan como argumentos.
+    """
+    return _fetch_executor.submit(fn, *args)
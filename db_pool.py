@@ -0,0 +1,187 @@
+import queue
+import threading
+import time
+
+import mysql.connector
+from mysql.connector.errors import PoolError
+
+
+class PooledConnection:
+    """
+    Envoltura de una conexión prestada por el pool.
+    Se usa igual que una conexión normal, pero close() la devuelve al pool.
+    """
+
+    def __init__(self, pool, raw):
+        self._pool = pool
+        self._raw = raw
+
+    def close(self):
+        # Devuelve la conexión al pool (solo la primera vez)
+        raw, self._raw = self._raw, None
+        if raw is not None:
+            self._pool._return(raw)
+
+    def is_connected(self):
+        return self._raw is not None and self._raw.is_connected()
+
+    def __getattr__(self, name):
+        if self._raw is None:
+            raise PoolError(msg="La conexión ya fue devuelta al pool")
+        return getattr(self._raw, name)
+
+
+class ConnectionPool:
+    """
+    Pool de conexiones MySQL con conexiones pre-calentadas, chequeo de salud
+    al prestar y estadísticas de uso.
+    """
+
+    def __init__(self, db_config, pool_size=10, prewarm=4, checkout_timeout=5.0,
+                 health_check_interval=30.0):
+        self.db_config = dict(db_config)
+        self.pool_size = pool_size
+        self.checkout_timeout = checkout_timeout
+        self.health_check_interval = health_check_interval
+
+        self._idle = queue.LifoQueue()  # (conexión, último uso)
+        self._lock = threading.Lock()
+        self._open = 0
+        self._in_use = 0
+        self._stats = {
+            "created": 0,
+            "discarded": 0,
+            "checkouts": 0,
+            "waits": 0,
+            "wait_seconds": 0.0,
+            "timeouts": 0,
+            "health_check_failures": 0,
+            "peak_in_use": 0,
+        }
+
+        # Pre-calentar conexiones para no pagar el handshake en las primeras peticiones
+        for _ in range(min(prewarm, pool_size)):
+            with self._lock:
+                self._open += 1
+            try:
+                raw = self._connect()
+            except mysql.connector.Error as err:
+                with self._lock:
+                    self._open -= 1
+                print(f"Error al pre-calentar el pool de conexiones: {err}")
+                break
+            self._idle.put((raw, time.monotonic()))
+
+    def _connect(self):
+        raw = mysql.connector.connect(**self.db_config)
+        with self._lock:
+            self._stats["created"] += 1
+        return raw
+
+    def _discard(self, raw):
+        with self._lock:
+            self._open -= 1
+            self._stats["discarded"] += 1
+        try:
+            raw.close()
+        except mysql.connector.Error:
+            pass
+
+    def _healthy(self, raw, last_used):
+        """
+        Hace ping solo si la conexión lleva ociosa más de health_check_interval;
+        si se usó hace poco se presta sin consultar al servidor.
+        """
+        if time.monotonic() - last_used < self.health_check_interval:
+            return True
+        try:
+            raw.ping(reconnect=False)
+            return True
+        except mysql.connector.Error:
+            return False
+
+    def get_connection(self):
+        """Presta una conexión. Espera hasta checkout_timeout si el pool está lleno."""
+        deadline = time.monotonic() + self.checkout_timeout
+        waited = False
+        while True:
+            try:
+                raw, last_used = self._idle.get_nowait()
+            except queue.Empty:
+                with self._lock:
+                    can_open = self._open < self.pool_size
+                    if can_open:
+                        self._open += 1
+                if can_open:
+                    try:
+                        raw = self._connect()
+                    except mysql.connector.Error:
+                        with self._lock:
+                            self._open -= 1
+                        raise
+                    last_used = time.monotonic()
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        with self._lock:
+                            self._stats["timeouts"] += 1
+                        raise PoolError(msg="No hay conexiones disponibles en el pool")
+                    if not waited:
+                        waited = True
+                        with self._lock:
+                            self._stats["waits"] += 1
+                    started = time.monotonic()
+                    try:
+                        raw, last_used = self._idle.get(timeout=remaining)
+                    except queue.Empty:
+                        continue
+                    finally:
+                        with self._lock:
+                            self._stats["wait_seconds"] += time.monotonic() - started
+
+                if not self._healthy(raw, last_used):
+                    with self._lock:
+                        self._stats["health_check_failures"] += 1
+                    self._discard(raw)
+                    continue
+
+            with self._lock:
+                self._in_use += 1
+                self._stats["checkouts"] += 1
+                self._stats["peak_in_use"] = max(self._stats["peak_in_use"], self._in_use)
+            return PooledConnection(self, raw)
+
+    def _return(self, raw):
+        with self._lock:
+            self._in_use -= 1
+        try:
+            # Deshacer cualquier transacción pendiente antes de reutilizarla.
+            # Sin ping al devolverla: una conexión caída la descarta _healthy al
+            # prestarla tras health_check_interval, o la propia consulta falla.
+            if raw.in_transaction:
+                raw.rollback()
+        except mysql.connector.Error:
+            self._discard(raw)
+            return
+        self._idle.put((raw, time.monotonic()))
+
+    def close_all(self):
+        """Cierra las conexiones ociosas (al apagar el servidor)."""
+        while True:
+            try:
+                raw, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(raw)
+
+    def stats(self):
+        """Estadísticas de utilización del pool."""
+        with self._lock:
+            data = dict(self._stats)
+            data["pool_size"] = self.pool_size
+            data["open"] = self._open
+            data["in_use"] = self._in_use
+        data["idle"] = self._idle.qsize()
+        data["utilization"] = round(data["in_use"] / self.pool_size, 3) if self.pool_size else 0.0
+        data["wait_seconds"] = round(data["wait_seconds"], 4)
+        return data
@@ -0,0 +1,135 @@
+import threading
+from collections import OrderedDict
+
+
+class RecentKeys:
+    """Conjunto LRU acotado: al superar `capacity` se olvidan las claves más antiguas."""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._keys = OrderedDict()
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def __len__(self):
+        return len(self._keys)
+
+    def add(self, key):
+        self._keys[key] = None
+        self._keys.move_to_end(key)
+        while len(self._keys) > self.capacity:
+            self._keys.popitem(last=False)
+
+    def discard(self, key):
+        self._keys.pop(key, None)
+
+
+class BatchInFlight(Exception):
+    """Otra copia del lote se está guardando todavía; el dispositivo debe reintentar más tarde."""
+
+
+class IngestDeduplicator:
+    """
+    Descarta reintentos de /datos sin consultar la BD:
+    - por número de secuencia de lote (si el dispositivo lo envía): se recuerda
+      el último 'seq' de cada dispositivo. El mismo 'seq' es un reintento; uno
+      menor, un dispositivo que se reinició y volvió a contar desde 0, así que
+      se acepta,
+    - por (IDSensor, TimeStamp) de cada lectura (si check_readings está activo;
+      descarta también lecturas distintas del mismo sensor en el mismo segundo).
+    Las claves se reservan antes de insertar. Un reintento que llega mientras la
+    primera copia aún se está guardando lanza BatchInFlight, porque todavía no
+    se sabe si se guardará. Al guardar el lote se confirman con commit(); si la
+    inserción falla se liberan con release(), para que el reintento sí se guarde.
+    Las claves viven en la memoria del proceso: con varios workers de gunicorn
+    cada uno tiene las suyas y un reintento que llega a otro worker se guarda.
+    """
+
+    def __init__(self, capacity=100000, check_readings=False):
+        self.check_readings = check_readings
+        self._recent = RecentKeys(capacity)
+        # mac_base -> {"last": último seq aceptado, "pending": seqs sin confirmar}
+        self._devices = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"duplicate_batches": 0, "duplicate_readings": 0,
+                       "in_flight_batches": 0, "restarts": 0}
+
+    def claim(self, mac_base, seq, rows):
+        """
+        Devuelve (filas_nuevas, claves_reservadas).
+        Un lote repetido devuelve ([], []); uno que se está guardando lanza BatchInFlight.
+        """
+        with self._lock:
+            claimed = []
+            if seq is not None:
+                state = self._device(mac_base)
+                if seq in state["pending"]:
+                    self._stats["in_flight_batches"] += 1
+                    raise BatchInFlight()
+                if seq == state["last"]:
+                    self._stats["duplicate_batches"] += 1
+                    return [], []
+                if state["last"] is not None and seq < state["last"]:
+                    self._stats["restarts"] += 1
+                state["last"] = seq
+                state["pending"].add(seq)
+                claimed.append(("seq", mac_base, seq))
+
+            if not self.check_readings:
+                return rows, claimed
+
+            new_rows = []
+            for row in rows:
+                # row = (IDDevice, IDSensor, type, Lecture, TimeStamp, alarm)
+                key = (row[1], str(row[4]))
+                if key in self._recent:
+                    self._stats["duplicate_readings"] += 1
+                    continue
+                self._recent.add(key)
+                claimed.append(key)
+                new_rows.append(row)
+            return new_rows, claimed
+
+    def _device(self, mac_base):
+        state = self._devices.get(mac_base)
+        if state is None:
+            state = self._devices[mac_base] = {"last": None, "pending": set()}
+            while len(self._devices) > self._recent.capacity:
+                self._devices.popitem(last=False)
+        self._devices.move_to_end(mac_base)
+        return state
+
+    def commit(self, keys):
+        """Confirma las claves de un lote ya guardado: sus reintentos son duplicados."""
+        with self._lock:
+            for key in keys:
+                if key[0] == "seq":
+                    state = self._devices.get(key[1])
+                    if state is not None:
+                        state["pending"].discard(key[2])
+
+    def release(self, keys):
+        """Libera claves reservadas de un lote que no se llegó a guardar."""
+        with self._lock:
+            for key in keys:
+                if key[0] != "seq":
+                    self._recent.discard(key)
+                    continue
+                _, mac_base, seq = key
+                state = self._devices.get(mac_base)
+                if state is None:
+                    continue
+                state["pending"].discard(seq)
+                if state["last"] == seq:
+                    # El reintento del mismo seq debe aceptarse
+                    state["last"] = seq - 1
+
+    def stats(self):
+        with self._lock:
+            data = dict(self._stats)
+            data["tracked_keys"] = len(self._recent)
+            data["tracked_devices"] = len(self._devices)
+            data["in_flight"] = sum(len(state["pending"]) for state in self._devices.values())
+            data["capacity"] = self._recent.capacity
+        return data
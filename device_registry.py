@@ -0,0 +1,66 @@
+import threading
+import time
+
+
+class DeviceRegistry:
+    """
+    Caché en memoria de los IDDevice ya registrados.
+    Se recarga completa cada `ttl` segundos para seguir siendo correcta cuando
+    hay varios procesos (otro worker puede registrar o borrar dispositivos).
+    """
+
+    def __init__(self, load_fn, ttl=30.0):
+        # load_fn devuelve un iterable con todos los IDDevice de la tabla 'device'
+        self.load_fn = load_fn
+        self.ttl = ttl
+        self._known = frozenset()
+        self._loaded_at = None
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "reloads": 0, "reload_errors": 0}
+
+    def reload(self, only_if_stale=False):
+        """Vuelve a leer todos los dispositivos de la BD."""
+        with self._lock:
+            if only_if_stale and not self._is_stale():
+                # Otro hilo ya la recargó mientras esperábamos el lock
+                return True
+            try:
+                known = frozenset(self.load_fn())
+            except Exception as e:
+                self._stats["reload_errors"] += 1
+                print(f"Error al recargar el registro de dispositivos: {e}")
+                return False
+            self._known = known
+            self._loaded_at = time.monotonic()
+            self._stats["reloads"] += 1
+            return True
+
+    def _is_stale(self):
+        return self._loaded_at is None or time.monotonic() - self._loaded_at > self.ttl
+
+    def is_known(self, mac_base):
+        """True si el dispositivo está registrado según la caché vigente."""
+        if self._is_stale() and not self.reload(only_if_stale=True):
+            # Sin caché válida se consulta la BD como antes
+            self._stats["misses"] += 1
+            return False
+        known = mac_base in self._known
+        self._stats["hits" if known else "misses"] += 1
+        return known
+
+    def add(self, mac_base):
+        """Marca un dispositivo como registrado (tras encontrarlo o insertarlo en la BD)."""
+        with self._lock:
+            self._known = self._known | {mac_base}
+
+    def invalidate(self):
+        """Fuerza la recarga completa en la próxima consulta."""
+        with self._lock:
+            self._loaded_at = None
+
+    def stats(self):
+        data = dict(self._stats)
+        data["devices"] = len(self._known)
+        data["ttl"] = self.ttl
+        data["age_seconds"] = None if self._loaded_at is None else round(time.monotonic() - self._loaded_at, 1)
+        return data
@@ -0,0 +1,52 @@
+import threading
+import time
+import uuid
+
+
+class DeviceVersions:
+    """
+    Versión de ingesta por dispositivo: /datos la incrementa cada vez que guarda
+    lecturas y las rutas de lectura la usan como ETag, para responder
+    304 Not Modified sin consultar la BD si nada cambió.
+
+    La versión es de este proceso. Con varios workers un lote guardado por otro
+    worker no la cambia, por eso el ETag incluye además el intervalo de
+    `resync_ttl` segundos en curso: como mucho se sirve un 304 obsoleto durante
+    ese tiempo (None = sin límite, para un único proceso).
+    """
+
+    def __init__(self, resync_ttl=5.0):
+        self.resync_ttl = resync_ttl
+        # Cambia en cada arranque: un ETag de otro proceso o de antes de reiniciar nunca coincide
+        self._boot_id = uuid.uuid4().hex[:8]
+        self._versions = {}
+        self._lock = threading.Lock()
+        self._stats = {"bumps": 0, "not_modified": 0}
+
+    def bump(self, device_ids):
+        """Marca como modificados los dispositivos de un lote recién guardado."""
+        with self._lock:
+            for device_id in set(device_ids):
+                self._versions[device_id] = self._versions.get(device_id, 0) + 1
+            self._stats["bumps"] += 1
+
+    def etag(self, device_id, extra=""):
+        """
+        ETag de los datos del dispositivo. Debe calcularse ANTES de leerlos: si
+        llega un lote entre medias el ETag queda antiguo y el cliente simplemente
+        vuelve a pedir los datos la próxima vez.
+        """
+        version = self._versions.get(device_id, 0)
+        window = 0 if self.resync_ttl is None else int(time.time() // self.resync_ttl)
+        tag = f"{self._boot_id}-{version}-{window}"
+        return f"{tag}-{extra}" if extra else tag
+
+    def count_not_modified(self):
+        self._stats["not_modified"] += 1
+
+    def stats(self):
+        with self._lock:
+            data = dict(self._stats)
+            data["devices"] = len(self._versions)
+        data["resync_ttl"] = self.resync_ttl
+        return data
@@ -0,0 +1,99 @@
+"""
+Reducción de series largas a un número fijo de puntos para /api/history.
+
+Las series son arrays numpy ordenados por tiempo: `timestamps` en epoch ms
+(int64) y los valores en float64, sin NaN. El coste es lineal en las filas de
+entrada y la salida tiene como máximo `points` puntos.
+
+    minmax  por cada intervalo de tiempo, el mínimo y el máximo en su orden:
+            conserva los picos (p. ej. una fuga de gas) aunque sean de un solo punto.
+    lttb    Largest-Triangle-Three-Buckets: un punto por intervalo, el que mejor
+            conserva la forma de la curva.
+"""
+import numpy as np
+
+METHODS = ("minmax", "lttb")
+
+
+def drop_missing(timestamps, *columns):
+    """Quita las filas con NaN (lecturas sin valor) en alguna de las columnas."""
+    valid = np.ones(len(timestamps), dtype=bool)
+    for column in columns:
+        valid &= ~np.isnan(column)
+    return (timestamps[valid],) + tuple(column[valid] for column in columns)
+
+
+def _first_match(values, reduced, starts):
+    """Índice de la primera posición de cada intervalo cuyo valor es el reducido (mínimo o máximo)."""
+    counts = np.diff(np.r_[starts, len(values)])
+    matches = np.flatnonzero(values == np.repeat(reduced, counts))
+    return matches[np.searchsorted(matches, starts)]
+
+
+def minmax(timestamps, low, high=None, points=500):
+    """
+    Mínimo y máximo de cada uno de los `points // 2` intervalos de igual duración.
+    Para lecturas crudas se pasa solo `low`; para agregados, las columnas min
+    (`low`) y max (`high`). Devuelve (timestamps, values).
+    """
+    buckets = max(1, points // 2)
+    if high is None:
+        if len(timestamps) <= points:
+            return timestamps, low
+        high = low
+    elif len(timestamps) <= buckets:
+        # Cada agregado aporta su mínimo y su máximo (uno solo si coinciden)
+        keep = np.column_stack((np.ones(len(low), dtype=bool), low != high)).ravel()
+        return np.repeat(timestamps, 2)[keep], np.column_stack((low, high)).ravel()[keep]
+
+    span = int(timestamps[-1] - timestamps[0]) + 1
+    bins = (timestamps - timestamps[0]) * buckets // span
+    starts = np.flatnonzero(np.r_[True, bins[1:] != bins[:-1]])
+    imin = _first_match(low, np.minimum.reduceat(low, starts), starts)
+    imax = _first_match(high, np.maximum.reduceat(high, starts), starts)
+
+    min_first = imin <= imax
+    first = np.where(min_first, imin, imax)
+    second = np.where(min_first, imax, imin)
+    first_values = np.where(min_first, low[imin], high[imax])
+    second_values = np.where(min_first, high[imax], low[imin])
+    # Intervalos con una sola lectura: un único punto
+    single = (imin == imax) & (first_values == second_values)
+
+    out_ts = np.column_stack((timestamps[first], timestamps[second])).ravel()
+    out_values = np.column_stack((first_values, second_values)).ravel()
+    keep = np.column_stack((np.ones_like(single), ~single)).ravel()
+    return out_ts[keep], out_values[keep]
+
+
+def lttb(timestamps, values, points):
+    """
+    Largest-Triangle-Three-Buckets. Devuelve (timestamps, values) con `points`
+    puntos como máximo (pero nunca menos de dos); siempre conserva la primera y
+    la última lectura.
+    """
+    n = len(timestamps)
+    if n <= points:
+        return timestamps, values
+    if points < 3:
+        # Sin intervalos intermedios: solo los extremos
+        return timestamps[[0, -1]], values[[0, -1]]
+
+    x = timestamps.astype(np.float64)
+    y = values
+    every = (n - 2) / (points - 2)
+    selected = np.empty(points, dtype=np.int64)
+    selected[0] = 0
+    a = 0
+    for i in range(points - 2):
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, n)
+        # Vértice C: el promedio del intervalo siguiente (el último punto para el último intervalo)
+        avg_x = x[end:next_end].mean()
+        avg_y = y[end:next_end].mean()
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(area.argmax())
+        selected[i + 1] = a
+    selected[-1] = n - 1
+    return timestamps[selected], values[selected]
@@ -0,0 +1,144 @@
+import queue
+import threading
+import time
+
+
+class IngestQueueFull(Exception):
+    """La cola de ingesta está llena; el dispositivo debe reintentar más tarde."""
+
+
+class IngestBuffer:
+    """
+    Cola acotada de lotes de lecturas con un hilo escritor en segundo plano.
+    El escritor junta lotes de muchos dispositivos y los guarda en una sola
+    transacción (group commit) cuando se alcanza flush_rows o pasa flush_interval.
+    Si esa transacción falla, cada lote se guarda en la suya: un lote que no se
+    puede escribir no arrastra a los de otros dispositivos, ya confirmados con 202.
+    """
+
+    def __init__(self, write_fn, max_queue_batches=1000, flush_rows=5000,
+                 flush_interval=0.5, enqueue_timeout=0.05, max_retries=3, drop_fn=None):
+        # write_fn recibe una lista de (mac_base, filas, claves) y hace el commit;
+        # drop_fn (opcional) recibe cada lote que se descarta tras agotar los intentos
+        self.write_fn = write_fn
+        self.drop_fn = drop_fn
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self.max_retries = max_retries
+
+        self._queue = queue.Queue(maxsize=max_queue_batches)
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stats = {
+            "enqueued_batches": 0,
+            "enqueued_rows": 0,
+            "rejected_batches": 0,
+            "flushes": 0,
+            "flushed_rows": 0,
+            "failed_flushes": 0,
+            "dropped_batches": 0,
+            "dropped_rows": 0,
+            "last_flush_seconds": 0.0,
+        }
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="ingest-writer", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=10.0):
+        """Detiene el escritor después de vaciar la cola."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def enqueue(self, mac_base, rows, keys=()):
+        """
+        Encola un lote; lanza IngestQueueFull si la cola no se libera a tiempo.
+        `keys` son las claves de deduplicación del lote (ver dedup.py), que viajan
+        con él hasta write_fn o drop_fn.
+        """
+        try:
+            self._queue.put((mac_base, rows, keys), timeout=self.enqueue_timeout)
+        except queue.Full:
+            with self._lock:
+                self._stats["rejected_batches"] += 1
+            raise IngestQueueFull()
+        with self._lock:
+            self._stats["enqueued_batches"] += 1
+            self._stats["enqueued_rows"] += len(rows)
+
+    def _collect(self):
+        """Junta lotes hasta flush_rows filas o hasta que venza flush_interval."""
+        try:
+            first = self._queue.get(timeout=self.flush_interval)
+        except queue.Empty:
+            return []
+        batches = [first]
+        total = len(first[1])
+        deadline = time.monotonic() + self.flush_interval
+        while total < self.flush_rows:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batches.append(item)
+            total += len(item[1])
+        return batches
+
+    def _flush(self, batches):
+        """
+        Guarda los lotes en un solo commit; si falla, lote a lote (max_retries
+        intentos en total por lote) y descarta solo los que siguen fallando.
+        No se espera entre intentos para no detener la cola mientras tanto.
+        """
+        if self._write(batches):
+            return
+        print(f"Error en escritura agrupada de {len(batches)} lotes: se guardan por separado")
+        for batch in batches:
+            for _ in range(max(self.max_retries - 1, 1)):
+                if self._write([batch]):
+                    break
+            else:
+                with self._lock:
+                    self._stats["dropped_batches"] += 1
+                    self._stats["dropped_rows"] += len(batch[1])
+                print(f"Se descartaron {len(batch[1])} lecturas de {batch[0]} tras {self.max_retries} intentos fallidos")
+                if self.drop_fn is not None:
+                    self.drop_fn(batch)
+
+    def _write(self, batches):
+        """Un intento de write_fn. Devuelve True si se guardó."""
+        started = time.monotonic()
+        try:
+            self.write_fn(batches)
+        except Exception as e:
+            print(f"Error en escritura de lecturas: {e}")
+            with self._lock:
+                self._stats["failed_flushes"] += 1
+            return False
+        with self._lock:
+            self._stats["flushes"] += 1
+            self._stats["flushed_rows"] += sum(len(b[1]) for b in batches)
+            self._stats["last_flush_seconds"] = round(time.monotonic() - started, 4)
+        return True
+
+    def _run(self):
+        while not (self._stop.is_set() and self._queue.empty()):
+            batches = self._collect()
+            if batches:
+                self._flush(batches)
+
+    def stats(self):
+        with self._lock:
+            data = dict(self._stats)
+        data["queue_depth"] = self._queue.qsize()
+        data["queue_capacity"] = self._queue.maxsize
+        data["running"] = self._thread is not None and self._thread.is_alive()
+        return data
@@ -0,0 +1,228 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+import numpy as np
+
+from columnar import rows_to_columns, timestamps_to_ms
+from storage import naive_timestamp
+
+
+def _to_datetime64(value):
+    """TimeStamp (datetime o texto ISO) a datetime64[s]; None si no se reconoce."""
+    timestamp = naive_timestamp(value)
+    return None if timestamp is None else np.datetime64(timestamp, "s")
+
+
+def _to_float(value):
+    try:
+        return np.nan if value is None else float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class _Series:
+    """Las `capacity` lecturas más recientes de un (IDDevice, type) en dos arrays fijos."""
+
+    __slots__ = ("timestamps", "values", "size", "synced_at", "last_read", "pending")
+
+    def __init__(self, capacity):
+        self.timestamps = np.empty(capacity, dtype="datetime64[s]")
+        self.values = np.empty(capacity, dtype=np.float64)
+        self.size = 0
+        self.synced_at = None      # Última carga desde la BD (None = fría)
+        self.last_read = time.monotonic()
+        self.pending = None        # Lecturas recibidas mientras se carga desde la BD
+
+    def clear(self):
+        self.size = 0
+
+    def extend(self, timestamps, values):
+        """Añade lecturas y conserva solo las más recientes (admite lecturas atrasadas)."""
+        capacity = len(self.timestamps)
+        all_ts = np.concatenate([self.timestamps[:self.size], timestamps])
+        all_values = np.concatenate([self.values[:self.size], values])
+        if len(all_ts) > capacity:
+            keep = np.argsort(all_ts, kind="stable")[-capacity:]
+            all_ts, all_values = all_ts[keep], all_values[keep]
+        self.size = len(all_ts)
+        self.timestamps[:self.size] = all_ts
+        self.values[:self.size] = all_values
+
+    def latest(self, limit, since=None, columns=False):
+        """
+        Lista [{TimeStamp, value}] de la más reciente a la más antigua (de `since` en adelante).
+        Con columns=True, {"TimeStamp": epoch en ms, "value": ...} como arrays, sin recorrer las filas.
+        """
+        order = np.argsort(self.timestamps[:self.size], kind="stable")[::-1]
+        if since is not None:
+            order = order[self.timestamps[order] >= since]
+        order = order[:limit]
+        if columns:
+            return {"TimeStamp": timestamps_to_ms(self.timestamps[order]), "value": self.values[order].copy()}
+        timestamps = self.timestamps[order].tolist()
+        values = self.values[order].tolist()
+        return [{"TimeStamp": ts, "value": None if value != value else value}  # NaN -> None
+                for ts, value in zip(timestamps, values)]
+
+
+class RealtimeBuffers:
+    """
+    Últimas lecturas por (IDDevice, type) en memoria para /api/realtime.
+
+    Solo se guardan las series que algún dashboard está consultando: la primera
+    consulta (buffer frío) va a la BD y carga la serie; desde entonces /datos le
+    añade las lecturas nuevas y las consultas se responden sin tocar la BD.
+    Memoria acotada: `capacity` lecturas por serie y como máximo `max_series`
+    series (se descartan las menos consultadas). Las series sin consultas
+    durante `idle_ttl` segundos se eliminan.
+
+    Con varios workers cada uno solo ve las lecturas que recibe él: cada
+    `resync_ttl` segundos la serie se vuelve a cargar desde la BD
+    (None = nunca, para un único proceso).
+    """
+
+    def __init__(self, capacity=30, max_series=10000, idle_ttl=300.0, resync_ttl=5.0):
+        self.capacity = capacity
+        self.max_series = max_series
+        self.idle_ttl = idle_ttl
+        self.resync_ttl = resync_ttl
+        self._series = OrderedDict()
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+        self._stats = {"hits": 0, "misses": 0, "resyncs": 0, "evictions": 0, "load_errors": 0}
+
+    def push(self, rows):
+        """Añade tuplas (IDDevice, IDSensor, type, Lecture, TimeStamp, alarm) ya guardadas en la BD."""
+        if not self._series:
+            return
+        grouped = {}
+        with self._lock:
+            for row in rows:
+                key = (row[0], row[2])
+                if key in self._series:
+                    grouped.setdefault(key, []).append((row[4], row[3]))
+            for key, readings in grouped.items():
+                series = self._series[key]
+                if series.pending is not None:
+                    series.pending.extend(readings)
+                if series.synced_at is not None and not self._extend(series, readings):
+                    # Alguna lectura no se pudo interpretar: se recarga en la próxima consulta
+                    series.synced_at = None
+
+    def _extend(self, series, readings, skip=None):
+        timestamps = []
+        values = []
+        for ts, value in readings:
+            ts64 = _to_datetime64(ts)
+            number = _to_float(value)
+            if ts64 is None or number is None:
+                return False
+            if skip is not None and (ts64, number) in skip:
+                continue
+            timestamps.append(ts64)
+            values.append(number)
+        if timestamps:
+            series.extend(np.array(timestamps, dtype="datetime64[s]"), np.array(values, dtype=np.float64))
+        return True
+
+    def latest(self, device_id, sensor_type, limit, load_fn, since=None, columns=False):
+        """
+        Últimas `limit` lecturas de la serie, solo las de `since` (datetime,
+        incluido) en adelante si se indica. Si el buffer está frío o hay que resincronizar,
+        se llama a load_fn(n) (consulta a la BD de las n últimas) y la serie se
+        carga con su resultado. Con columns=True se devuelven columnas
+        (ver columnar.py) en lugar de filas.
+        """
+        key = (device_id, sensor_type)
+        now = time.monotonic()
+        with self._lock:
+            self._sweep(now)
+            series = self._series.get(key)
+            if series is not None:
+                series.last_read = now
+                self._series.move_to_end(key)
+                fresh = series.synced_at is not None and (
+                    self.resync_ttl is None or now - series.synced_at <= self.resync_ttl)
+                if fresh and limit <= self.capacity:
+                    self._stats["hits"] += 1
+                    return series.latest(limit, None if since is None else _to_datetime64(since), columns)
+            self._stats["misses"] += 1
+            if limit > self.capacity:
+                series = None
+            else:
+                series = self._begin_sync(key, series, now)
+            pending = series.pending if series is not None else None
+
+        try:
+            # La serie se carga completa aunque se pidan menos lecturas
+            rows = load_fn(self.capacity if series is not None else limit)
+        except Exception:
+            if series is not None:
+                self._abort_sync(series, pending)
+            raise
+        if series is not None:
+            self._finish_sync(key, series, pending, rows)
+        if since is not None:
+            rows = [row for row in rows if isinstance(row["TimeStamp"], datetime) and row["TimeStamp"] >= since]
+        return rows_to_columns(rows[:limit]) if columns else rows[:limit]
+
+    def _begin_sync(self, key, series, now):
+        if series is None:
+            series = _Series(self.capacity)
+            self._series[key] = series
+            while len(self._series) > self.max_series:
+                self._series.popitem(last=False)
+                self._stats["evictions"] += 1
+        elif series.synced_at is not None:
+            self._stats["resyncs"] += 1
+        series.last_read = now
+        series.pending = []
+        return series
+
+    def _finish_sync(self, key, series, pending, rows):
+        """Carga la serie con las filas de la BD más lo recibido durante la consulta."""
+        with self._lock:
+            if self._series.get(key) is not series or series.pending is not pending:
+                # La serie se eliminó o otra consulta más reciente la está cargando
+                return
+            series.pending = None
+            series.clear()
+            loaded = [(row["TimeStamp"], row["value"]) for row in rows]
+            if not self._extend(series, loaded):
+                self._stats["load_errors"] += 1
+                series.clear()
+                return
+            # Lo recibido durante la consulta puede estar ya en las filas de la BD
+            skip = set(zip(series.timestamps[:series.size], series.values[:series.size].tolist()))
+            if not self._extend(series, pending, skip=skip):
+                self._stats["load_errors"] += 1
+                series.clear()
+                return
+            series.synced_at = time.monotonic()
+
+    def _abort_sync(self, series, pending):
+        with self._lock:
+            if series.pending is pending:
+                series.pending = None
+
+    def _sweep(self, now):
+        """Elimina las series sin consultas en `idle_ttl` segundos (como mucho una vez por segundo)."""
+        if self.idle_ttl is None or now - self._last_sweep < 1.0:
+            return
+        self._last_sweep = now
+        idle = [key for key, series in self._series.items() if now - series.last_read > self.idle_ttl]
+        for key in idle:
+            del self._series[key]
+        self._stats["evictions"] += len(idle)
+
+    def stats(self):
+        with self._lock:
+            data = dict(self._stats)
+            data["series"] = len(self._series)
+            data["warm_series"] = sum(1 for series in self._series.values() if series.synced_at is not None)
+        data["capacity"] = self.capacity
+        data["max_series"] = self.max_series
+        data["memory_bytes"] = data["series"] * self.capacity * 16
+        return data
@@ -0,0 +1,83 @@
+"""
+Agregados de lecturas por minuto, hora y día (count, sum, min, max) por
+(IDDevice, type). Se actualizan en la misma transacción que inserta las
+lecturas en 'sensor', sumando al bucket que corresponde a cada TimeStamp, así
+que las lecturas atrasadas caen en su bucket aunque lleguen tarde.
+Las lecturas sin valor numérico no cuentan (igual que AVG ignora NULL).
+"""
+# Resolución -> tabla de agregados
+ROLLUP_TABLES = {
+    "minute": "sensor_rollup_minute",
+    "hour": "sensor_rollup_hour",
+    "day": "sensor_rollup_day",
+}
+
+# Resolución -> duración del bucket en segundos
+ROLLUP_SECONDS = {
+    "minute": 60,
+    "hour": 3600,
+    "day": 86400,
+}
+
+ROLLUP_COLUMNS = ("IDDevice", "type", "bucket", "readings", "total", "min_value", "max_value")
+
+
+def bucket_start(timestamp, resolution):
+    """Inicio del bucket al que pertenece el TimeStamp."""
+    if resolution == "minute":
+        return timestamp.replace(second=0, microsecond=0)
+    if resolution == "hour":
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    if resolution == "day":
+        return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+    raise ValueError(f"Resolución desconocida: {resolution}")
+
+
+def aggregate_rows(rows):
+    """
+    Agrega un lote de tuplas (IDDevice, IDSensor, type, Lecture, TimeStamp, alarm).
+    Devuelve {resolución: [(IDDevice, type, bucket, readings, total, min, max), ...]}.
+    """
+    from storage import naive_timestamp  # storage importa este módulo
+
+    minutes = {}
+    for mac, _, sensor_type, value, timestamp, _ in rows:
+        if value is None:
+            continue
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            continue
+        timestamp = naive_timestamp(timestamp)
+        if timestamp is None:
+            continue
+        key = (mac, sensor_type, bucket_start(timestamp, "minute"))
+        acc = minutes.get(key)
+        if acc is None:
+            minutes[key] = [1, value, value, value]
+        else:
+            acc[0] += 1
+            acc[1] += value
+            acc[2] = min(acc[2], value)
+            acc[3] = max(acc[3], value)
+
+    # Las horas y los días se construyen a partir de los minutos del lote
+    result = {"minute": minutes}
+    for resolution in ("hour", "day"):
+        coarse = {}
+        for (mac, sensor_type, minute), (count, total, low, high) in minutes.items():
+            key = (mac, sensor_type, bucket_start(minute, resolution))
+            acc = coarse.get(key)
+            if acc is None:
+                coarse[key] = [count, total, low, high]
+            else:
+                acc[0] += count
+                acc[1] += total
+                acc[2] = min(acc[2], low)
+                acc[3] = max(acc[3], high)
+        result[resolution] = coarse
+
+    return {
+        resolution: [key + tuple(acc) for key, acc in buckets.items()]
+        for resolution, buckets in result.items()
+    }
@@ -0,0 +1,381 @@
+"""
+Esquema versionado de la BD (MySQL y SQLite).
+
+Cada migración tiene un número de versión y se aplica una sola vez; las
+aplicadas quedan en la tabla schema_version. Para cambiar el esquema se
+añade una migración nueva al final de MIGRATIONS, nunca se edita una antigua.
+
+Los índices de REQUIRED_INDEXES son los que necesitan las consultas de los
+dashboards (/api/realtime y /api/alarms); sin ellos cada consulta recorre y
+ordena toda la tabla. Los históricos (/api/gas) leen las tablas de
+agregados sensor_rollup_* (ver rollups.py) y /api/alarms la tabla alarm_event.
+"""
+from collections import namedtuple
+
+# Índice que crea una migración (se omite si ya existe uno con ese nombre)
+Index = namedtuple("Index", "name table columns")
+# Índice que borra una migración (se omite si no existe)
+DropIndex = namedtuple("DropIndex", "name table")
+
+
+def _rollup_steps(table, mysql_bucket, sqlite_bucket):
+    """Tabla de agregados (ver rollups.py) y su carga inicial desde 'sensor'."""
+    backfill = """
+        INSERT INTO {table} (IDDevice, type, bucket, readings, total, min_value, max_value)
+        SELECT IDDevice, type, {bucket}, COUNT(Lecture), SUM(Lecture), MIN(Lecture), MAX(Lecture)
+        FROM sensor
+        WHERE Lecture IS NOT NULL
+        GROUP BY IDDevice, type, {bucket}
+    """
+    return [
+        {
+            "mysql": f"""
+                CREATE TABLE IF NOT EXISTS {table} (
+                    IDDevice  VARCHAR(32) NOT NULL,
+                    type      VARCHAR(16) NOT NULL,
+                    bucket    DATETIME NOT NULL,
+                    readings  INT NOT NULL,
+                    total     DOUBLE NOT NULL,
+                    min_value DOUBLE NOT NULL,
+                    max_value DOUBLE NOT NULL,
+                    PRIMARY KEY (IDDevice, type, bucket)
+                )
+            """,
+            "sqlite": f"""
+                CREATE TABLE IF NOT EXISTS {table} (
+                    IDDevice  TEXT NOT NULL,
+                    type      TEXT NOT NULL,
+                    bucket    TEXT NOT NULL,
+                    readings  INTEGER NOT NULL,
+                    total     REAL NOT NULL,
+                    min_value REAL NOT NULL,
+                    max_value REAL NOT NULL,
+                    PRIMARY KEY (IDDevice, type, bucket)
+                ) WITHOUT ROWID
+            """,
+        },
+        {
+            "mysql": backfill.format(table=table, bucket=mysql_bucket),
+            "sqlite": backfill.format(table=table, bucket=sqlite_bucket),
+        },
+    ]
+
+
+MIGRATIONS = [
+    (1, "Tablas device, user y sensor", [
+        {
+            "mysql": """
+                CREATE TABLE IF NOT EXISTS device (
+                    IDDevice VARCHAR(32) NOT NULL PRIMARY KEY
+                )
+            """,
+            "sqlite": """
+                CREATE TABLE IF NOT EXISTS device (
+                    IDDevice TEXT PRIMARY KEY
+                )
+            """,
+        },
+        {
+            "mysql": """
+                CREATE TABLE IF NOT EXISTS user (
+                    IDUser   VARCHAR(64) NOT NULL PRIMARY KEY,
+                    Mail     VARCHAR(255),
+                    FName    VARCHAR(100),
+                    LName    VARCHAR(100),
+                    Password VARCHAR(255),
+                    IDDevice VARCHAR(32) NULL
+                )
+            """,
+            "sqlite": """
+                CREATE TABLE IF NOT EXISTS user (
+                    IDUser   TEXT PRIMARY KEY,
+                    Mail     TEXT,
+                    FName    TEXT,
+                    LName    TEXT,
+                    Password TEXT,
+                    IDDevice TEXT
+                )
+            """,
+        },
+        {
+            "mysql": """
+                CREATE TABLE IF NOT EXISTS sensor (
+                    IDReading BIGINT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+                    IDDevice  VARCHAR(32) NOT NULL,
+                    IDSensor  VARCHAR(64) NOT NULL,
+                    type      VARCHAR(16) NOT NULL,
+                    Lecture   FLOAT,
+                    TimeStamp DATETIME NOT NULL,
+                    alarm     TINYINT(1) NOT NULL DEFAULT 0
+                )
+            """,
+            "sqlite": """
+                CREATE TABLE IF NOT EXISTS sensor (
+                    IDReading INTEGER PRIMARY KEY,
+                    IDDevice  TEXT NOT NULL,
+                    IDSensor  TEXT NOT NULL,
+                    type      TEXT NOT NULL,
+                    Lecture   REAL,
+                    TimeStamp TEXT NOT NULL,
+                    alarm     INTEGER NOT NULL DEFAULT 0
+                )
+            """,
+        },
+    ]),
+    (2, "Índices compuestos para las consultas de los dashboards", [
+        # latest_readings y daily_averages: filtran por dispositivo y tipo, ordenan por
+        # TimeStamp y solo leen Lecture -> se resuelven desde el índice, sin filesort
+        Index("idx_sensor_device_type_ts", "sensor", ("IDDevice", "type", "TimeStamp", "Lecture")),
+        # alarms: type='gas' AND alarm=1 AND IDDevice=? ORDER BY TimeStamp DESC
+        Index("idx_sensor_device_alarm_ts", "sensor", ("IDDevice", "type", "alarm", "TimeStamp")),
+    ]),
+    (3, "Agregados por minuto, hora y día",
+        _rollup_steps("sensor_rollup_minute", "DATE_FORMAT(TimeStamp, '%Y-%m-%d %H:%i:00')",
+                      "strftime('%Y-%m-%d %H:%M:00', TimeStamp)")
+        + _rollup_steps("sensor_rollup_hour", "DATE_FORMAT(TimeStamp, '%Y-%m-%d %H:00:00')",
+                        "strftime('%Y-%m-%d %H:00:00', TimeStamp)")
+        + _rollup_steps("sensor_rollup_day", "DATE_FORMAT(TimeStamp, '%Y-%m-%d 00:00:00')",
+                        "strftime('%Y-%m-%d 00:00:00', TimeStamp)")),
+    (4, "Registro de eventos de alarma", [
+        {
+            "mysql": """
+                CREATE TABLE IF NOT EXISTS alarm_event (
+                    IDEvent   BIGINT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+                    IDDevice  VARCHAR(32) NOT NULL,
+                    IDSensor  VARCHAR(64) NOT NULL,
+                    type      VARCHAR(16) NOT NULL,
+                    Lecture   FLOAT,
+                    TimeStamp DATETIME NOT NULL
+                )
+            """,
+            "sqlite": """
+                CREATE TABLE IF NOT EXISTS alarm_event (
+                    IDEvent   INTEGER PRIMARY KEY,
+                    IDDevice  TEXT NOT NULL,
+                    IDSensor  TEXT NOT NULL,
+                    type      TEXT NOT NULL,
+                    Lecture   REAL,
+                    TimeStamp TEXT NOT NULL
+                )
+            """,
+        },
+        # Carga inicial con las alarmas ya guardadas en 'sensor'
+        dict.fromkeys(("mysql", "sqlite"), """
+            INSERT INTO alarm_event (IDDevice, IDSensor, type, Lecture, TimeStamp)
+            SELECT IDDevice, IDSensor, type, Lecture, TimeStamp
+            FROM sensor
+            WHERE alarm = 1
+            ORDER BY TimeStamp
+        """),
+        # /api/alarms: IDDevice=? AND type=? [rango de TimeStamp] ORDER BY TimeStamp DESC, IDEvent DESC
+        Index("idx_alarm_event_device_type_ts", "alarm_event", ("IDDevice", "type", "TimeStamp", "IDEvent")),
+    ]),
+    (5, "Borrar el índice de alarmas de 'sensor'", [
+        # Las alarmas se leen de alarm_event: el índice solo encarecía cada inserción
+        DropIndex("idx_sensor_device_alarm_ts", "sensor"),
+    ]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+# Columnas iniciales que debe tener algún índice de cada tabla, con cualquier nombre
+REQUIRED_INDEXES = {
+    "sensor": [
+        ("IDDevice", "type", "TimeStamp"),
+    ],
+    "alarm_event": [
+        ("IDDevice", "type", "TimeStamp"),
+    ],
+}
+
+_VERSION_TABLE = {
+    "mysql": """
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version     INT NOT NULL PRIMARY KEY,
+            description VARCHAR(255),
+            applied_at  DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    """,
+    "sqlite": """
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version     INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at  TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    """,
+}
+
+# Evita que varios workers migren a la vez al arrancar
+_MYSQL_LOCK_NAME = "gas_detector_schema"
+# Segundos que un proceso espera a que otro termine de migrar: la carga inicial
+# de los agregados (migración 3) recorre toda la tabla 'sensor' y puede tardar minutos
+MIGRATION_LOCK_TIMEOUT = 600
+
+
+class SchemaError(Exception):
+    """El esquema de la BD no es el que espera la aplicación."""
+
+
+def _placeholder(dialect):
+    return "%s" if dialect == "mysql" else "?"
+
+
+def _table_exists(cursor, dialect, table):
+    if dialect == "mysql":
+        cursor.execute("""
+            SELECT COUNT(*) FROM information_schema.tables
+            WHERE table_schema = DATABASE() AND table_name = %s
+        """, (table,))
+    else:
+        cursor.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = ?", (table,))
+    return cursor.fetchone()[0] > 0
+
+
+def current_version(cursor, dialect):
+    """Última migración aplicada (0 si la BD nunca se ha migrado)."""
+    if not _table_exists(cursor, dialect, "schema_version"):
+        return 0
+    cursor.execute("SELECT MAX(version) FROM schema_version")
+    return cursor.fetchone()[0] or 0
+
+
+def table_indexes(cursor, dialect, table):
+    """Índices de la tabla: {nombre: (columna, ...)} en el orden del índice."""
+    indexes = {}
+    if dialect == "mysql":
+        cursor.execute("""
+            SELECT INDEX_NAME, COLUMN_NAME FROM information_schema.statistics
+            WHERE table_schema = DATABASE() AND table_name = %s
+            ORDER BY INDEX_NAME, SEQ_IN_INDEX
+        """, (table,))
+        for name, column in cursor.fetchall():
+            indexes.setdefault(name, []).append(column)
+    else:
+        cursor.execute(f"PRAGMA index_list({table})")
+        names = [row[1] for row in cursor.fetchall()]
+        for name in names:
+            cursor.execute(f"PRAGMA index_info({name})")
+            indexes[name] = [row[2] for row in sorted(cursor.fetchall(), key=lambda row: row[0])]
+    return {name: tuple(columns) for name, columns in indexes.items()}
+
+
+def missing_indexes(cursor, dialect):
+    """Índices de REQUIRED_INDEXES que no están cubiertos por ningún índice existente."""
+    missing = []
+    for table, required in REQUIRED_INDEXES.items():
+        existing = table_indexes(cursor, dialect, table).values()
+        for columns in required:
+            if not any(index[:len(columns)] == columns for index in existing):
+                missing.append(f"{table}({', '.join(columns)})")
+    return missing
+
+
+def _create_index(cursor, dialect, index):
+    columns = ", ".join(index.columns)
+    if dialect == "sqlite":
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {index.name} ON {index.table} ({columns})")
+        return
+    # MySQL no tiene CREATE INDEX IF NOT EXISTS
+    if index.name not in table_indexes(cursor, dialect, index.table):
+        cursor.execute(f"CREATE INDEX {index.name} ON {index.table} ({columns})")
+
+
+def _drop_index(cursor, dialect, index):
+    if dialect == "sqlite":
+        cursor.execute(f"DROP INDEX IF EXISTS {index.name}")
+        return
+    # MySQL no tiene DROP INDEX IF EXISTS
+    if index.name in table_indexes(cursor, dialect, index.table):
+        cursor.execute(f"DROP INDEX {index.name} ON {index.table}")
+
+
+def _apply(cursor, dialect, version, description, steps):
+    for step in steps:
+        if isinstance(step, Index):
+            _create_index(cursor, dialect, step)
+        elif isinstance(step, DropIndex):
+            _drop_index(cursor, dialect, step)
+        else:
+            cursor.execute(step[dialect])
+    mark = _placeholder(dialect)
+    cursor.execute(f"INSERT INTO schema_version (version, description) VALUES ({mark}, {mark})",
+                   (version, description))
+
+
+def migrate(conn, cursor, dialect, lock_timeout=MIGRATION_LOCK_TIMEOUT):
+    """
+    Aplica las migraciones pendientes en orden.
+    Devuelve la lista de (versión, descripción) aplicadas.
+    Espera hasta `lock_timeout` segundos si otro proceso está migrando.
+    """
+    busy_timeout = None
+    if dialect == "mysql":
+        cursor.execute("SELECT GET_LOCK(%s, %s)", (_MYSQL_LOCK_NAME, lock_timeout))
+        if cursor.fetchone()[0] != 1:
+            raise SchemaError("No se pudo obtener el bloqueo de migración del esquema")
+    else:
+        conn.commit()
+        cursor.execute("PRAGMA busy_timeout")
+        busy_timeout = cursor.fetchone()[0]
+        cursor.execute(f"PRAGMA busy_timeout={int(lock_timeout * 1000)}")
+
+    applied = []
+    try:
+        if dialect == "sqlite":
+            # El bloqueo de escritura de SQLite serializa a los procesos que migran a la vez
+            cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute(_VERSION_TABLE[dialect])
+        version = current_version(cursor, dialect)
+        for number, description, steps in MIGRATIONS:
+            if number <= version:
+                continue
+            # En MySQL cada DDL hace commit implícito: se registra la versión migración a migración
+            _apply(cursor, dialect, number, description, steps)
+            conn.commit()
+            applied.append((number, description))
+            if dialect == "sqlite":
+                cursor.execute("BEGIN IMMEDIATE")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        if dialect == "mysql":
+            cursor.execute("SELECT RELEASE_LOCK(%s)", (_MYSQL_LOCK_NAME,))
+            cursor.fetchone()
+        else:
+            cursor.execute(f"PRAGMA busy_timeout={busy_timeout}")
+    return applied
+
+
+def status(cursor, dialect):
+    """Versión aplicada, versión esperada e índices que faltan."""
+    return {
+        "version": current_version(cursor, dialect),
+        "latest": LATEST_VERSION,
+        "missing_indexes": missing_indexes(cursor, dialect),
+    }
+
+
+def ensure_schema(storage, auto_migrate=True, on_missing="fail", lock_timeout=MIGRATION_LOCK_TIMEOUT):
+    """
+    Migra (si auto_migrate) y comprueba el esquema al arrancar.
+    Si falta una migración o un índice requerido: on_missing='fail' lanza
+    SchemaError y on_missing='warn' solo lo avisa por consola.
+    """
+    if auto_migrate:
+        for number, description in storage.migrate(lock_timeout):
+            print(f"Migración {number} aplicada: {description}")
+
+    info = storage.schema_status()
+    problems = []
+    if info["version"] < LATEST_VERSION:
+        problems.append(f"esquema en la versión {info['version']}, se esperaba la {LATEST_VERSION}")
+    if info["missing_indexes"]:
+        problems.append("faltan índices: " + "; ".join(info["missing_indexes"]))
+    if problems:
+        message = f"Esquema de la BD ({storage.backend}) incompleto: " + ", ".join(problems)
+        if on_missing == "fail":
+            raise SchemaError(message)
+        print("ADVERTENCIA:", message)
+    return info
@@ -0,0 +1,100 @@
+"""
+Punto de entrada de producción del backend (en lugar de app.run(debug=True)).
+
+    python serve.py --workers 4 --threads 8
+    python serve.py --server waitress --threads 16     # Windows
+
+Con gunicorn (Linux/macOS) se levantan `workers` procesos con `threads` hilos cada uno.
+Con waitress (cualquier sistema) hay un solo proceso con `threads` hilos.
+Cada proceso inicializa su pool de conexiones, caché de dispositivos y cola de
+ingesta después del fork, y los cierra (vaciando la cola) al terminar.
+"""
+import argparse
+import os
+
+import app as backend
+
+
+def default_workers():
+    return os.cpu_count() or 1
+
+
+def run_gunicorn(args):
+    from gunicorn.app.base import BaseApplication
+
+    class GasApplication(BaseApplication):
+        def load_config(self):
+            self.cfg.set("bind", f"{args.host}:{args.port}")
+            self.cfg.set("workers", args.workers)
+            self.cfg.set("threads", args.threads)
+            self.cfg.set("worker_class", "gthread")
+            self.cfg.set("timeout", args.timeout)
+            self.cfg.set("graceful_timeout", args.graceful_timeout)
+            self.cfg.set("keepalive", 5)
+            # Los recursos se crean en cada worker: un pool abierto antes del fork
+            # compartiría sockets entre procesos
+            self.cfg.set("post_worker_init", lambda worker: backend.startup())
+            self.cfg.set("worker_exit", lambda server, worker: backend.shutdown())
+
+        def load(self):
+            return backend.app
+
+    # Migraciones una sola vez antes del fork; los workers solo comprueban el esquema
+    backend.migrate_schema()
+    GasApplication().run()
+
+
+def run_waitress(args):
+    from waitress import serve
+
+    backend.startup()
+    try:
+        serve(backend.app, host=args.host, port=args.port, threads=args.threads)
+    finally:
+        backend.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor de producción del backend de monitoreo de gas")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=default_workers(), help="Procesos (solo gunicorn)")
+    parser.add_argument("--threads", type=int, default=8, help="Hilos por proceso")
+    parser.add_argument("--server", choices=["auto", "gunicorn", "waitress"], default="auto")
+    parser.add_argument("--timeout", type=int, default=30, help="Segundos antes de reiniciar un worker colgado")
+    parser.add_argument("--graceful-timeout", type=int, default=30,
+                        help="Segundos para terminar peticiones y vaciar la cola al apagar")
+    parser.add_argument("--storage", choices=["mysql", "sqlite"], help="Sustituye STORAGE_BACKEND")
+    parser.add_argument("--sqlite-path", help="Sustituye SQLITE_CONFIG['path']")
+    parser.add_argument("--ingest-mode", choices=["sync", "async"], help="Sustituye INGEST_CONFIG['mode']")
+    args = parser.parse_args()
+
+    # Se aplican antes de crear los workers para que todos hereden la misma configuración
+    if args.storage:
+        backend.STORAGE_BACKEND = args.storage
+    if args.sqlite_path:
+        backend.SQLITE_CONFIG['path'] = args.sqlite_path
+    if args.ingest_mode:
+        backend.INGEST_CONFIG['mode'] = args.ingest_mode
+    # Cada conexión de /api/stream ocupa un hilo: el máximo sale de --threads
+    backend.STREAM_CONFIG['server_threads'] = args.threads
+
+    server = args.server
+    if server == "auto":
+        try:
+            import gunicorn  # noqa: F401
+            server = "gunicorn"
+        except ImportError:
+            server = "waitress"
+
+    print(f"Iniciando {server} en {args.host}:{args.port} "
+          f"(workers={args.workers if server == 'gunicorn' else 1}, threads={args.threads}, "
+          f"conexiones de /api/stream por proceso={backend.stream_max_subscribers()})")
+    if server == "gunicorn":
+        run_gunicorn(args)
+    else:
+        run_waitress(args)
+
+
+if __name__ == "__main__":
+    main()
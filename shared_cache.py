@@ -0,0 +1,148 @@
+"""
+Caché de los datos de los dashboards compartida por todas las sesiones de un
+proceso de Streamlit, con claves como (device_id, serie, modo).
+
+Varias personas mirando el mismo dispositivo generan una sola consulta al
+backend por clave y por TTL, en lugar de una por sesión y rerun:
+- Coalescencia: si varias sesiones piden a la vez una clave caducada, solo una
+  la recarga. Las demás devuelven el valor anterior mientras tanto, o esperan
+  a la carga si todavía no hay valor.
+- Tamaño acotado: como máximo `max_entries` claves; se descartan las usadas
+  hace más tiempo (LRU).
+Los valores se comparten entre sesiones: quien los lee no debe modificarlos.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class _Entry:
+    __slots__ = ("value", "loaded_at", "loading", "error")
+
+    def __init__(self):
+        self.value = None
+        self.loaded_at = None      # None = sin valor todavía
+        self.loading = None        # threading.Event mientras alguien recarga la clave
+        self.error = None          # Excepción de la última carga, para quien la esperaba
+
+
+class SharedCache:
+    """Valores por clave con TTL, coalescencia de cargas y descarte LRU."""
+
+    def __init__(self, ttl=5.0, max_entries=1000, wait_timeout=15.0):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.wait_timeout = wait_timeout    # Espera máxima a la carga de otra sesión
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "stale_hits": 0, "loads": 0, "coalesced": 0, "evictions": 0, "errors": 0}
+
+    def get(self, key, load_fn, ttl=None):
+        """
+        Valor de la clave. Si no hay o caducó (`ttl`, o el de la caché), lo carga
+        llamando a load_fn(valor_anterior) (None si no había), de modo que la
+        recarga puede ser incremental. Las excepciones de load_fn se propagan.
+        """
+        ttl = self.ttl if ttl is None else ttl
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = _Entry()
+                self._evict()
+            self._entries.move_to_end(key)
+
+            now = time.monotonic()
+            if entry.loaded_at is not None and now - entry.loaded_at <= ttl:
+                self._stats["hits"] += 1
+                return entry.value
+            if entry.loading is not None:
+                if entry.loaded_at is not None:
+                    # Otra sesión ya la está recargando: se sirve el valor anterior
+                    self._stats["stale_hits"] += 1
+                    return entry.value
+                self._stats["coalesced"] += 1
+                loading = entry.loading
+            else:
+                loading = None
+                entry.loading = threading.Event()
+                previous = entry.value
+
+        if loading is not None:
+            return self._wait(entry, loading)
+        return self._load(key, entry, load_fn, previous)
+
+    def _wait(self, entry, loading):
+        if not loading.wait(self.wait_timeout):
+            raise TimeoutError("La carga compartida de los datos tardó demasiado")
+        with self._lock:
+            if entry.loaded_at is None:
+                raise entry.error or RuntimeError("La carga compartida de los datos falló")
+            return entry.value
+
+    def _load(self, key, entry, load_fn, previous):
+        try:
+            value = load_fn(previous)
+        except Exception as e:
+            with self._lock:
+                self._stats["errors"] += 1
+                entry.error = e
+                loading, entry.loading = entry.loading, None
+            loading.set()
+            raise
+        with self._lock:
+            self._stats["loads"] += 1
+            entry.value = value
+            entry.loaded_at = time.monotonic()
+            entry.error = None
+            loading, entry.loading = entry.loading, None
+        loading.set()
+        return value
+
+    def peek(self, key):
+        """Último valor de la clave aunque esté caducado (None si no hay)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry.value if entry is not None else None
+
+    def put(self, key, value):
+        """Guarda un valor cargado por otra vía (p. ej. dentro de una petición agrupada)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = _Entry()
+                self._evict()
+            self._entries.move_to_end(key)
+            entry.value = value
+            entry.loaded_at = time.monotonic()
+
+    def _evict(self):
+        # Nunca se descarta una clave que se está cargando (alguien espera su Event)
+        while len(self._entries) > self.max_entries:
+            for key, entry in self._entries.items():
+                if entry.loading is None:
+                    del self._entries[key]
+                    self._stats["evictions"] += 1
+                    break
+            else:
+                return
+
+    def stats(self):
+        with self._lock:
+            data = dict(self._stats)
+            data["entries"] = len(self._entries)
+        data["max_entries"] = self.max_entries
+        return data
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_shared_cache():
+    """Caché compartida por todas las páginas y sesiones del proceso de Streamlit."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = SharedCache()
+    return _cache
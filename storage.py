@@ -0,0 +1,717 @@
+import math
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime, timezone
+
+import mysql.connector
+
+import schema
+from bulk_insert import BulkWriter, SENSOR_COLUMNS
+from db_pool import ConnectionPool
+from rollups import ROLLUP_COLUMNS, ROLLUP_TABLES, aggregate_rows
+
+
+class StorageError(Exception):
+    """Error de la capa de almacenamiento, independiente del motor de BD."""
+
+    def __init__(self, msg):
+        super().__init__(msg)
+        self.msg = msg
+
+
+def _to_float(value):
+    return None if value is None else float(value)
+
+
+def naive_timestamp(value):
+    """
+    TimeStamp (datetime o texto ISO) como datetime sin zona, que es como se
+    guarda en la BD. Una hora con zona se pasa antes a UTC (la del formato
+    binario ya es UTC). None si no se reconoce.
+    """
+    if not isinstance(value, datetime):
+        try:
+            value = datetime.fromisoformat(str(value))
+        except ValueError:
+            return None
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _to_datetime(value):
+    if value is None:
+        return None
+    timestamp = naive_timestamp(value)
+    # TimeStamp con un formato que no es ISO: se devuelve tal cual
+    return value if timestamp is None else timestamp
+
+
+def _to_date(value):
+    if value is None or isinstance(value, date):
+        return value
+    return date.fromisoformat(value)
+
+
+ALARM_EVENT_COLUMNS = ("IDDevice", "IDSensor", "type", "Lecture", "TimeStamp")
+
+
+def _sensor_rows(rows):
+    """
+    Tuplas de 'sensor' con Lecture como float (o None) y TimeStamp como datetime
+    sin zona, igual en los dos backends. Lanza StorageError si alguna lectura no
+    se puede guardar, en lugar de que cada motor la rechace o la convierta a su manera.
+    """
+    result = []
+    for mac, id_sensor, sensor_type, value, ts, alarm in rows:
+        try:
+            value = _to_float(value)
+        except (TypeError, ValueError) as err:
+            raise StorageError(f"Lecture no numérico de {id_sensor}: {value!r}") from err
+        if value is not None and not math.isfinite(value):
+            raise StorageError(f"Lecture no numérico de {id_sensor}: {value!r}")
+        timestamp = naive_timestamp(ts)
+        if timestamp is None:
+            raise StorageError(f"TimeStamp inválido de {id_sensor}: {ts!r}")
+        result.append((mac, id_sensor, sensor_type, value, timestamp, bool(alarm)))
+    return result
+
+
+def _alarm_events(rows):
+    """Tuplas de alarm_event de las lecturas del lote que dispararon alarma."""
+    return [(mac, id_sensor, sensor_type, value, ts)
+            for mac, id_sensor, sensor_type, value, ts, alarm in rows if alarm]
+
+
+def _alarm_event_filter(mark, since=None, until=None, before=None):
+    """
+    Condiciones de alarm_event para un rango [since, until) y para el cursor
+    `before` = (TimeStamp, IDEvent) del último evento de la página anterior.
+    Devuelve (sql, params).
+    """
+    sql = []
+    params = []
+    if since is not None:
+        sql.append(f"AND TimeStamp >= {mark}")
+        params.append(since)
+    if until is not None:
+        sql.append(f"AND TimeStamp < {mark}")
+        params.append(until)
+    if before is not None:
+        # Paginación por clave: sigue justo después del último evento devuelto, sin OFFSET
+        sql.append(f"AND (TimeStamp < {mark} OR (TimeStamp = {mark} AND IDEvent < {mark}))")
+        params.extend([before[0], before[0], before[1]])
+    return " ".join(sql), params
+
+
+class MySQLStorage:
+    """Almacenamiento en MySQL con pool de conexiones y escritura masiva."""
+
+    backend = "mysql"
+
+    def __init__(self, db_config, pool_config, bulk_config):
+        self.pool = ConnectionPool(db_config, **pool_config)
+        self.bulk_writer = BulkWriter(**bulk_config)
+        # LOAD DATA LOCAL solo en un pool aparte, y solo desde el directorio temporal
+        # del BulkWriter: las conexiones del pool principal no pueden leer archivos locales
+        self.infile_pool = None
+        if self.bulk_writer.infile_dir is not None:
+            self.infile_pool = ConnectionPool(
+                {**db_config, "allow_local_infile_in_path": self.bulk_writer.infile_dir},
+                pool_size=self.bulk_writer.infile_connections, prewarm=0,
+                checkout_timeout=pool_config.get("checkout_timeout", 5.0))
+        self._local = threading.local()
+
+    @contextmanager
+    def _cursor(self, dictionary=False, pool=None):
+        """Presta una conexión del pool (o de `pool`) y la devuelve al terminar (o usa la de connection())."""
+        pinned = getattr(self._local, "conn", None)
+        conn = None
+        cursor = None
+        try:
+            conn = pinned or (pool or self.pool).get_connection()
+            cursor = conn.cursor(dictionary=dictionary)
+            yield conn, cursor
+        except mysql.connector.Error as err:
+            raise StorageError(err.msg) from err
+        finally:
+            if cursor:
+                cursor.close()
+            if conn and conn is not pinned: # Devuelve la conexión al pool
+                conn.close()
+
+    @contextmanager
+    def connection(self):
+        """Todas las consultas del bloque (en este hilo) usan una sola conexión del pool."""
+        if getattr(self._local, "conn", None) is not None:
+            yield
+            return
+        try:
+            conn = self.pool.get_connection()
+        except mysql.connector.Error as err:
+            raise StorageError(err.msg) from err
+        self._local.conn = conn
+        try:
+            yield
+        finally:
+            self._local.conn = None
+            conn.close()
+
+    # --- Usuarios -------------------------------------------------
+
+    def get_user(self, id_user):
+        with self._cursor(dictionary=True) as (conn, cursor):
+            cursor.execute(
+                "SELECT IDUser, IDDevice, FName, LName, Mail, Password FROM user WHERE IDUser = %s",
+                (id_user,))
+            return cursor.fetchone()
+
+    def create_user(self, id_user, mail, fname, lname, password):
+        """Inserta el usuario con IDDevice NULL. Devuelve False si el IDUser ya existe."""
+        with self._cursor() as (conn, cursor):
+            cursor.execute("SELECT IDUser FROM user WHERE IDUser = %s", (id_user,))
+            if cursor.fetchone():
+                return False
+            cursor.execute("""
+                INSERT INTO user (IDUser, Mail, FName, LName, Password, IDDevice)
+                VALUES (%s, %s, %s, %s, %s, NULL) -- Se inserta NULL en IDDevice
+            """, (id_user, mail, fname, lname, password))
+            conn.commit()
+            return True
+
+    def assign_free_device(self, id_user):
+        """Asigna al usuario el primer dispositivo sin dueño. Devuelve su IDDevice o None."""
+        with self._cursor() as (conn, cursor):
+            cursor.execute("""
+                SELECT IDDevice FROM device
+                WHERE IDDevice NOT IN (SELECT IDDevice FROM user WHERE IDDevice IS NOT NULL)
+                ORDER BY IDDevice ASC
+                LIMIT 1
+            """)
+            unassigned_device = cursor.fetchone()
+            if not unassigned_device:
+                return None
+            cursor.execute("UPDATE user SET IDDevice = %s WHERE IDUser = %s",
+                           (unassigned_device[0], id_user))
+            conn.commit()
+            return unassigned_device[0]
+
+    # --- Dispositivos ---------------------------------------------
+
+    def device_ids(self):
+        with self._cursor() as (conn, cursor):
+            cursor.execute("SELECT IDDevice FROM device")
+            return [row[0] for row in cursor.fetchall()]
+
+    def device_exists(self, mac_base):
+        with self._cursor() as (conn, cursor):
+            cursor.execute("SELECT IDDevice FROM device WHERE IDDevice = %s", (mac_base,))
+            return cursor.fetchone() is not None
+
+    def register_device(self, mac_base):
+        """
+        Registra el dispositivo y lo asigna al usuario MÁS RECIENTE sin IDDevice.
+        Devuelve el IDUser asignado, o None. Si otro proceso lo registró a la vez no hace nada.
+        """
+        with self._cursor() as (conn, cursor):
+            try:
+                cursor.execute("INSERT INTO device (IDDevice) VALUES (%s)", (mac_base,))
+                conn.commit()
+            except mysql.connector.IntegrityError:
+                conn.rollback()
+                return None
+
+            # NOTA: se usa ORDER BY IDUser DESC asumiendo que IDUser es secuencial
+            cursor.execute("""
+                SELECT IDUser
+                FROM user
+                WHERE IDDevice IS NULL
+                ORDER BY IDUser DESC
+                LIMIT 1
+            """)
+            user_to_link = cursor.fetchone()
+            if not user_to_link:
+                return None
+            cursor.execute("UPDATE user SET IDDevice = %s WHERE IDUser = %s", (mac_base, user_to_link[0]))
+            conn.commit()
+            return user_to_link[0]
+
+    # --- Lecturas -------------------------------------------------
+
+    def insert_readings(self, rows):
+        """Inserta tuplas (IDDevice, IDSensor, type, Lecture, TimeStamp, alarm) en un solo commit."""
+        rows = _sensor_rows(rows)
+        # Los lotes muy grandes van por una conexión del pool con LOAD DATA LOCAL
+        infile = (self.infile_pool is not None and getattr(self._local, "conn", None) is None
+                  and self.bulk_writer.uses_infile(rows))
+        with self._cursor(pool=self.infile_pool if infile else None) as (conn, cursor):
+            # INSERT multi-fila por trozos, o LOAD DATA para lotes muy grandes
+            self.bulk_writer.insert(cursor, rows, infile=infile)
+            self._upsert_rollups(cursor, rows)
+            self._insert_alarm_events(cursor, rows)
+            conn.commit()
+
+    def _upsert_rollups(self, cursor, rows):
+        """Suma el lote a los agregados por minuto, hora y día (en la misma transacción)."""
+        chunk_size = self.bulk_writer.chunk_size
+        placeholders = "(" + ", ".join(["%s"] * len(ROLLUP_COLUMNS)) + ")"
+        for resolution, buckets in aggregate_rows(rows).items():
+            # Orden fijo de claves: evita interbloqueos entre workers que actualizan los mismos buckets
+            buckets.sort()
+            for start in range(0, len(buckets), chunk_size):
+                chunk = buckets[start:start + chunk_size]
+                cursor.execute(f"""
+                    INSERT INTO {ROLLUP_TABLES[resolution]} ({', '.join(ROLLUP_COLUMNS)})
+                    VALUES {', '.join([placeholders] * len(chunk))}
+                    ON DUPLICATE KEY UPDATE
+                        readings = readings + VALUES(readings),
+                        total = total + VALUES(total),
+                        min_value = LEAST(min_value, VALUES(min_value)),
+                        max_value = GREATEST(max_value, VALUES(max_value))
+                """, [value for bucket in chunk for value in bucket])
+
+    def _insert_alarm_events(self, cursor, rows):
+        """Añade las lecturas con alarma del lote a alarm_event (en la misma transacción)."""
+        events = _alarm_events(rows)
+        chunk_size = self.bulk_writer.chunk_size
+        placeholders = "(" + ", ".join(["%s"] * len(ALARM_EVENT_COLUMNS)) + ")"
+        for start in range(0, len(events), chunk_size):
+            chunk = events[start:start + chunk_size]
+            cursor.execute(f"""
+                INSERT INTO alarm_event ({', '.join(ALARM_EVENT_COLUMNS)})
+                VALUES {', '.join([placeholders] * len(chunk))}
+            """, [value for event in chunk for value in event])
+
+    def count_readings(self, device_ids):
+        """Número de lecturas guardadas de los dispositivos indicados."""
+        if not device_ids:
+            return 0
+        with self._cursor() as (conn, cursor):
+            placeholders = ", ".join(["%s"] * len(device_ids))
+            cursor.execute(f"SELECT COUNT(*) FROM sensor WHERE IDDevice IN ({placeholders})", list(device_ids))
+            return cursor.fetchone()[0]
+
+    def latest_readings(self, device_id, sensor_type, limit=30, since=None):
+        """Últimas `limit` lecturas (solo las de `since` en adelante si se indica), de la más reciente a la más antigua."""
+        params = [sensor_type, device_id]
+        since_sql = ""
+        if since is not None:
+            since_sql = "AND TimeStamp >= %s"
+            params.append(since)
+        with self._cursor(dictionary=True) as (conn, cursor):
+            cursor.execute(f"""
+                SELECT TimeStamp, Lecture AS value
+                FROM sensor
+                WHERE type=%s AND IDDevice=%s {since_sql}
+                ORDER BY TimeStamp DESC
+                LIMIT %s
+            """, params + [limit])
+            rows = cursor.fetchall()
+        for row in rows:
+            row['value'] = _to_float(row['value'])
+        return rows
+
+    def readings_between(self, device_id, sensor_type, since, until, limit):
+        """Lecturas entre `since` (incluido) y `until` (excluido), de la más antigua a la más reciente, como máximo `limit`."""
+        with self._cursor(dictionary=True) as (conn, cursor):
+            cursor.execute("""
+                SELECT TimeStamp, Lecture AS value
+                FROM sensor
+                WHERE type=%s AND IDDevice=%s AND TimeStamp >= %s AND TimeStamp < %s
+                ORDER BY TimeStamp ASC
+                LIMIT %s
+            """, (sensor_type, device_id, since, until, limit))
+            rows = cursor.fetchall()
+        for row in rows:
+            row['value'] = _to_float(row['value'])
+        return rows
+
+    def daily_averages(self, device_id, sensor_type, days):
+        """Promedio por día de los últimos `days` días naturales (hoy incluido), desde los agregados diarios."""
+        with self._cursor(dictionary=True) as (conn, cursor):
+            cursor.execute("""
+                SELECT DATE(bucket) AS date,
+                       total / readings AS consumption
+                FROM sensor_rollup_day
+                WHERE IDDevice=%s AND type=%s
+                AND bucket >= DATE(NOW()) - INTERVAL %s DAY
+                ORDER BY bucket ASC
+            """, (device_id, sensor_type, days - 1))
+            rows = cursor.fetchall()
+        for row in rows:
+            row['consumption'] = _to_float(row['consumption'])
+        return rows
+
+    def rollups(self, device_id, sensor_type, resolution, since, until=None):
+        """
+        Agregados de una serie entre `since` (incluido) y `until` (excluido) con
+        resolución 'minute', 'hour' o 'day': [{bucket, readings, avg, min, max}].
+        """
+        table = ROLLUP_TABLES[resolution]
+        params = [device_id, sensor_type, since]
+        until_sql = ""
+        if until is not None:
+            until_sql = "AND bucket < %s"
+            params.append(until)
+        with self._cursor(dictionary=True) as (conn, cursor):
+            cursor.execute(f"""
+                SELECT bucket, readings, total / readings AS avg, min_value AS min, max_value AS max
+                FROM {table}
+                WHERE IDDevice=%s AND type=%s AND bucket >= %s {until_sql}
+                ORDER BY bucket ASC
+            """, params)
+            rows = cursor.fetchall()
+        for row in rows:
+            for field in ('avg', 'min', 'max'):
+                row[field] = _to_float(row[field])
+        return rows
+
+    def alarm_events(self, device_id, sensor_type, limit=50, since=None, until=None, before=None):
+        """
+        Eventos de alarma [{IDEvent, TimeStamp, IDSensor, value}] del más reciente
+        al más antiguo, entre `since` (incluido) y `until` (excluido) si se indican,
+        y anteriores al cursor `before` = (TimeStamp, IDEvent).
+        """
+        filter_sql, params = _alarm_event_filter("%s", since, until, before)
+        with self._cursor(dictionary=True) as (conn, cursor):
+            cursor.execute(f"""
+                SELECT IDEvent, TimeStamp, IDSensor, Lecture AS value
+                FROM alarm_event
+                WHERE IDDevice=%s AND type=%s {filter_sql}
+                ORDER BY TimeStamp DESC, IDEvent DESC
+                LIMIT %s
+            """, [device_id, sensor_type] + params + [limit])
+            rows = cursor.fetchall()
+        for row in rows:
+            row['value'] = _to_float(row['value'])
+        return rows
+
+    def count_alarm_events(self, device_id, sensor_type, since=None, until=None):
+        """Número de eventos de alarma en el rango (se resuelve desde el índice)."""
+        filter_sql, params = _alarm_event_filter("%s", since, until)
+        with self._cursor() as (conn, cursor):
+            cursor.execute(f"""
+                SELECT COUNT(*) FROM alarm_event
+                WHERE IDDevice=%s AND type=%s {filter_sql}
+            """, [device_id, sensor_type] + params)
+            return cursor.fetchone()[0]
+
+    # --- Esquema --------------------------------------------------
+
+    def migrate(self, lock_timeout=schema.MIGRATION_LOCK_TIMEOUT):
+        """Aplica las migraciones pendientes (ver schema.py)."""
+        with self._cursor() as (conn, cursor):
+            return schema.migrate(conn, cursor, self.backend, lock_timeout)
+
+    def schema_status(self):
+        with self._cursor() as (conn, cursor):
+            return schema.status(cursor, self.backend)
+
+    # --- Operación ------------------------------------------------
+
+    def stats(self):
+        data = {"backend": self.backend, **self.pool.stats()}
+        if self.infile_pool is not None:
+            data["infile_pool"] = self.infile_pool.stats()
+        return data
+
+    def close(self):
+        self.pool.close_all()
+        if self.infile_pool is not None:
+            self.infile_pool.close_all()
+        self.bulk_writer.close()
+
+
+def _sqlite_timestamp(value):
+    """TimeStamp como texto 'YYYY-MM-DD HH:MM:SS' para que ordene igual que un DATETIME."""
+    timestamp = naive_timestamp(value)
+    if timestamp is not None:
+        return timestamp.strftime("%Y-%m-%d %H:%M:%S")
+    return str(value).replace("T", " ", 1)
+
+
+class SQLiteStorage:
+    """
+    Almacenamiento embebido en SQLite en modo WAL (instalaciones de un solo nodo
+    y benchmarks sin servidor de BD). Una conexión por hilo.
+    Las tablas se crean con migrate() (ver schema.py).
+    """
+
+    backend = "sqlite"
+
+    def __init__(self, path, busy_timeout=5000):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout / 1000,
+                                   check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            try:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+                conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout)}")
+            except sqlite3.Error:
+                conn.close()
+                raise
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """Cada hilo ya usa siempre la misma conexión."""
+        yield
+
+    @contextmanager
+    def _cursor(self):
+        try:
+            conn = self._connection()
+        except sqlite3.Error as err:
+            raise StorageError(str(err)) from err
+        cursor = conn.cursor()
+        try:
+            yield conn, cursor
+        except sqlite3.Error as err:
+            conn.rollback()
+            raise StorageError(str(err)) from err
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+
+    # --- Usuarios -------------------------------------------------
+
+    def get_user(self, id_user):
+        with self._cursor() as (conn, cursor):
+            cursor.execute(
+                "SELECT IDUser, IDDevice, FName, LName, Mail, Password FROM user WHERE IDUser = ?",
+                (id_user,))
+            row = cursor.fetchone()
+            return dict(row) if row else None
+
+    def create_user(self, id_user, mail, fname, lname, password):
+        with self._cursor() as (conn, cursor):
+            cursor.execute("SELECT IDUser FROM user WHERE IDUser = ?", (id_user,))
+            if cursor.fetchone():
+                return False
+            cursor.execute("""
+                INSERT INTO user (IDUser, Mail, FName, LName, Password, IDDevice)
+                VALUES (?, ?, ?, ?, ?, NULL)
+            """, (id_user, mail, fname, lname, password))
+            conn.commit()
+            return True
+
+    def assign_free_device(self, id_user):
+        with self._cursor() as (conn, cursor):
+            cursor.execute("""
+                SELECT IDDevice FROM device
+                WHERE IDDevice NOT IN (SELECT IDDevice FROM user WHERE IDDevice IS NOT NULL)
+                ORDER BY IDDevice ASC
+                LIMIT 1
+            """)
+            unassigned_device = cursor.fetchone()
+            if not unassigned_device:
+                return None
+            cursor.execute("UPDATE user SET IDDevice = ? WHERE IDUser = ?",
+                           (unassigned_device[0], id_user))
+            conn.commit()
+            return unassigned_device[0]
+
+    # --- Dispositivos ---------------------------------------------
+
+    def device_ids(self):
+        with self._cursor() as (conn, cursor):
+            cursor.execute("SELECT IDDevice FROM device")
+            return [row[0] for row in cursor.fetchall()]
+
+    def device_exists(self, mac_base):
+        with self._cursor() as (conn, cursor):
+            cursor.execute("SELECT IDDevice FROM device WHERE IDDevice = ?", (mac_base,))
+            return cursor.fetchone() is not None
+
+    def register_device(self, mac_base):
+        with self._cursor() as (conn, cursor):
+            try:
+                cursor.execute("INSERT INTO device (IDDevice) VALUES (?)", (mac_base,))
+            except sqlite3.IntegrityError:
+                conn.rollback()
+                return None
+            cursor.execute("""
+                SELECT IDUser FROM user
+                WHERE IDDevice IS NULL
+                ORDER BY IDUser DESC
+                LIMIT 1
+            """)
+            user_to_link = cursor.fetchone()
+            if user_to_link:
+                cursor.execute("UPDATE user SET IDDevice = ? WHERE IDUser = ?", (mac_base, user_to_link[0]))
+            conn.commit()
+            return user_to_link[0] if user_to_link else None
+
+    # --- Lecturas -------------------------------------------------
+
+    def insert_readings(self, rows):
+        rows = _sensor_rows(rows)
+        with self._cursor() as (conn, cursor):
+            cursor.executemany(
+                f"INSERT INTO sensor ({', '.join(SENSOR_COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?)",
+                [(mac, id_sensor, sensor_type, _to_float(value), _sqlite_timestamp(ts), int(bool(alarm)))
+                 for mac, id_sensor, sensor_type, value, ts, alarm in rows])
+            for resolution, buckets in aggregate_rows(rows).items():
+                cursor.executemany(f"""
+                    INSERT INTO {ROLLUP_TABLES[resolution]} ({', '.join(ROLLUP_COLUMNS)})
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (IDDevice, type, bucket) DO UPDATE SET
+                        readings = readings + excluded.readings,
+                        total = total + excluded.total,
+                        min_value = MIN(min_value, excluded.min_value),
+                        max_value = MAX(max_value, excluded.max_value)
+                """, [(mac, sensor_type, _sqlite_timestamp(bucket), count, total, low, high)
+                      for mac, sensor_type, bucket, count, total, low, high in buckets])
+            cursor.executemany(
+                f"INSERT INTO alarm_event ({', '.join(ALARM_EVENT_COLUMNS)}) VALUES (?, ?, ?, ?, ?)",
+                [(mac, id_sensor, sensor_type, _to_float(value), _sqlite_timestamp(ts))
+                 for mac, id_sensor, sensor_type, value, ts in _alarm_events(rows)])
+            conn.commit()
+
+    def count_readings(self, device_ids):
+        if not device_ids:
+            return 0
+        with self._cursor() as (conn, cursor):
+            placeholders = ", ".join(["?"] * len(device_ids))
+            cursor.execute(f"SELECT COUNT(*) FROM sensor WHERE IDDevice IN ({placeholders})", list(device_ids))
+            return cursor.fetchone()[0]
+
+    def latest_readings(self, device_id, sensor_type, limit=30, since=None):
+        params = [sensor_type, device_id]
+        since_sql = ""
+        if since is not None:
+            since_sql = "AND TimeStamp >= ?"
+            params.append(_sqlite_timestamp(since))
+        with self._cursor() as (conn, cursor):
+            cursor.execute(f"""
+                SELECT TimeStamp, Lecture AS value
+                FROM sensor
+                WHERE type=? AND IDDevice=? {since_sql}
+                ORDER BY TimeStamp DESC
+                LIMIT ?
+            """, params + [limit])
+            return [{"TimeStamp": _to_datetime(row[0]), "value": _to_float(row[1])}
+                    for row in cursor.fetchall()]
+
+    def readings_between(self, device_id, sensor_type, since, until, limit):
+        with self._cursor() as (conn, cursor):
+            cursor.execute("""
+                SELECT TimeStamp, Lecture AS value
+                FROM sensor
+                WHERE type=? AND IDDevice=? AND TimeStamp >= ? AND TimeStamp < ?
+                ORDER BY TimeStamp ASC
+                LIMIT ?
+            """, (sensor_type, device_id, _sqlite_timestamp(since), _sqlite_timestamp(until), limit))
+            return [{"TimeStamp": _to_datetime(row[0]), "value": _to_float(row[1])}
+                    for row in cursor.fetchall()]
+
+    def daily_averages(self, device_id, sensor_type, days):
+        with self._cursor() as (conn, cursor):
+            cursor.execute("""
+                SELECT DATE(bucket) AS date,
+                       total / readings AS consumption
+                FROM sensor_rollup_day
+                WHERE IDDevice=? AND type=?
+                AND bucket >= date('now', 'localtime', ?)
+                ORDER BY bucket ASC
+            """, (device_id, sensor_type, f"-{int(days) - 1} days"))
+            return [{"date": _to_date(row[0]), "consumption": _to_float(row[1])}
+                    for row in cursor.fetchall()]
+
+    def rollups(self, device_id, sensor_type, resolution, since, until=None):
+        table = ROLLUP_TABLES[resolution]
+        params = [device_id, sensor_type, _sqlite_timestamp(since)]
+        until_sql = ""
+        if until is not None:
+            until_sql = "AND bucket < ?"
+            params.append(_sqlite_timestamp(until))
+        with self._cursor() as (conn, cursor):
+            cursor.execute(f"""
+                SELECT bucket, readings, total / readings, min_value, max_value
+                FROM {table}
+                WHERE IDDevice=? AND type=? AND bucket >= ? {until_sql}
+                ORDER BY bucket ASC
+            """, params)
+            return [{"bucket": _to_datetime(row[0]), "readings": row[1], "avg": _to_float(row[2]),
+                     "min": _to_float(row[3]), "max": _to_float(row[4])}
+                    for row in cursor.fetchall()]
+
+    def alarm_events(self, device_id, sensor_type, limit=50, since=None, until=None, before=None):
+        filter_sql, params = _alarm_event_filter(
+            "?", _sqlite_timestamp(since) if since is not None else None,
+            _sqlite_timestamp(until) if until is not None else None,
+            (_sqlite_timestamp(before[0]), before[1]) if before is not None else None)
+        with self._cursor() as (conn, cursor):
+            cursor.execute(f"""
+                SELECT IDEvent, TimeStamp, IDSensor, Lecture AS value
+                FROM alarm_event
+                WHERE IDDevice=? AND type=? {filter_sql}
+                ORDER BY TimeStamp DESC, IDEvent DESC
+                LIMIT ?
+            """, [device_id, sensor_type] + params + [limit])
+            return [{"IDEvent": row[0], "TimeStamp": _to_datetime(row[1]), "IDSensor": row[2],
+                     "value": _to_float(row[3])}
+                    for row in cursor.fetchall()]
+
+    def count_alarm_events(self, device_id, sensor_type, since=None, until=None):
+        filter_sql, params = _alarm_event_filter(
+            "?", _sqlite_timestamp(since) if since is not None else None,
+            _sqlite_timestamp(until) if until is not None else None)
+        with self._cursor() as (conn, cursor):
+            cursor.execute(f"""
+                SELECT COUNT(*) FROM alarm_event
+                WHERE IDDevice=? AND type=? {filter_sql}
+            """, [device_id, sensor_type] + params)
+            return cursor.fetchone()[0]
+
+    # --- Esquema --------------------------------------------------
+
+    def migrate(self, lock_timeout=schema.MIGRATION_LOCK_TIMEOUT):
+        """Aplica las migraciones pendientes (ver schema.py)."""
+        with self._cursor() as (conn, cursor):
+            return schema.migrate(conn, cursor, self.backend, lock_timeout)
+
+    def schema_status(self):
+        with self._cursor() as (conn, cursor):
+            return schema.status(cursor, self.backend)
+
+    # --- Operación ------------------------------------------------
+
+    def stats(self):
+        with self._lock:
+            connections = len(self._connections)
+        size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        return {"backend": self.backend, "path": self.path, "connections": connections,
+                "size_bytes": size}
+
+    def close(self):
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+
+
+def create_storage(backend, db_config=None, pool_config=None, bulk_config=None, sqlite_config=None):
+    """Crea el almacenamiento configurado ('mysql' o 'sqlite')."""
+    if backend == "mysql":
+        return MySQLStorage(db_config, pool_config or {}, bulk_config or {})
+    if backend == "sqlite":
+        return SQLiteStorage(**(sqlite_config or {}))
+    raise ValueError(f"Backend de almacenamiento desconocido: {backend}")
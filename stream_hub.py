@@ -0,0 +1,146 @@
+import threading
+from collections import deque
+
+from storage import naive_timestamp
+
+
+def _to_float(value):
+    """Lecture como float, igual que en /api/realtime; None si no es numérica."""
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return value if value == value else None  # NaN no es JSON válido
+
+
+class StreamHubFull(Exception):
+    """Se alcanzó el máximo de suscriptores del stream."""
+
+
+def _isoformat(value):
+    timestamp = naive_timestamp(value)
+    return str(value).replace(" ", "T", 1) if timestamp is None else timestamp.isoformat()
+
+
+class Subscription:
+    """
+    Cola acotada de eventos de un suscriptor (una conexión de /api/stream).
+    Si el cliente no consume a tiempo se descartan los eventos más antiguos y se
+    marca `lagged`: el cliente debe recargar /api/realtime en lugar de seguir
+    con un hueco en los datos.
+    """
+
+    def __init__(self, device_id, types, max_queue):
+        self.device_id = device_id
+        self.types = frozenset(types)
+        self.max_queue = max_queue
+        self.lagged = False
+        self.closed = False
+        self.dropped = 0
+        self._events = deque()
+        self._cond = threading.Condition()
+
+    def put(self, event):
+        with self._cond:
+            if len(self._events) >= self.max_queue:
+                self._events.popleft()
+                self.dropped += 1
+                self.lagged = True
+            self._events.append(event)
+            self._cond.notify()
+
+    def get(self, timeout):
+        """
+        Espera eventos hasta `timeout` segundos. Devuelve (eventos, lagged);
+        ([], False) si no llegó nada. Tras un retraso se descarta lo pendiente.
+        """
+        with self._cond:
+            if not self._events and not self.lagged and not self.closed:
+                self._cond.wait(timeout)
+            if self.lagged:
+                self.lagged = False
+                self._events.clear()
+                return [], True
+            events = list(self._events)
+            self._events.clear()
+            return events, False
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify()
+
+
+class StreamHub:
+    """
+    Reparte en el proceso las lecturas que guarda /datos entre los suscriptores
+    de /api/stream, por dispositivo y tipo de sensor. Cada suscriptor tiene su
+    propia cola acotada, así que un cliente lento no frena a /datos ni a los demás.
+    """
+
+    def __init__(self, max_subscribers=200, max_queue=100):
+        self.max_subscribers = max_subscribers
+        self.max_queue = max_queue
+        self._by_device = {}
+        self._count = 0
+        self._lock = threading.Lock()
+        self._stats = {"published_events": 0, "lagged_subscribers": 0, "rejected": 0}
+
+    def subscribe(self, device_id, types):
+        with self._lock:
+            if self._count >= self.max_subscribers:
+                self._stats["rejected"] += 1
+                raise StreamHubFull(f"Máximo de {self.max_subscribers} suscriptores alcanzado")
+            subscription = Subscription(device_id, types, self.max_queue)
+            self._by_device.setdefault(device_id, set()).add(subscription)
+            self._count += 1
+            return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._by_device.get(subscription.device_id)
+            if subscribers is None or subscription not in subscribers:
+                return
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._by_device[subscription.device_id]
+            self._count -= 1
+            if subscription.dropped:
+                self._stats["lagged_subscribers"] += 1
+        subscription.close()
+
+    def publish(self, rows):
+        """Publica tuplas (IDDevice, IDSensor, type, Lecture, TimeStamp, alarm) ya guardadas en la BD."""
+        if not self._by_device:
+            return
+        with self._lock:
+            targets = {device_id: list(subscribers) for device_id, subscribers in self._by_device.items()}
+
+        events = {}
+        for row in rows:
+            if row[0] in targets:
+                events.setdefault((row[0], row[2]), []).append(
+                    {"TimeStamp": _isoformat(row[4]), "value": _to_float(row[3])})
+
+        for (device_id, sensor_type), readings in events.items():
+            event = {"type": sensor_type, "readings": readings}
+            for subscription in targets[device_id]:
+                if sensor_type in subscription.types:
+                    subscription.put(event)
+                    self._stats["published_events"] += 1
+
+    def close(self):
+        """Cierra todas las suscripciones (al apagar el servidor)."""
+        with self._lock:
+            subscriptions = [s for subscribers in self._by_device.values() for s in subscribers]
+        for subscription in subscriptions:
+            subscription.close()
+
+    def stats(self):
+        with self._lock:
+            data = dict(self._stats)
+            data["subscribers"] = self._count
+            data["devices"] = len(self._by_device)
+        data["max_subscribers"] = self.max_subscribers
+        data["max_queue"] = self.max_queue
+        return data
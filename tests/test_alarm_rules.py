@@ -0,0 +1,43 @@
+import numpy as np
+
+from alarm_rules import AlarmRules
+
+RULES = {"gas": {"max": 500}, "temp": {"min": 5, "max": 45}, "hum": {"min": None, "max": None}}
+
+
+def test_thresholds_by_type():
+    rules = AlarmRules(RULES)
+    alarms, valid = rules.evaluate("AA", ["gas", "gas", "temp", "temp", "temp", "hum"],
+                                   [499.0, 501.0, 4.0, 20.0, 46.0, 99.0])
+    assert alarms == [False, True, True, False, True, False]
+    assert all(valid)
+
+
+def test_device_overrides_only_their_types():
+    rules = AlarmRules(RULES, {"BB": {"gas": {"max": 300}}})
+    assert rules.evaluate("BB", ["gas", "temp"], [400.0, 50.0])[0] == [True, True]
+    assert rules.evaluate("AA", ["gas"], [400.0])[0] == [False]
+    assert rules.thresholds("BB")["gas"] == {"min": None, "max": 300.0}
+    assert rules.thresholds("AA") == {"gas": {"min": None, "max": 500.0}, "temp": {"min": 5.0, "max": 45.0}}
+
+
+def test_none_is_not_an_alarm():
+    alarms, valid = AlarmRules(RULES).evaluate("AA", ["gas", "temp"], [None, None])
+    assert alarms == [False, False]
+    assert valid == [True, True]
+
+
+def test_non_numeric_values_are_invalid_only_with_a_rule():
+    alarms, valid = AlarmRules(RULES).evaluate("AA", ["gas", "hum", "gas"], ["alto", "x", "900"])
+    assert valid == [False, True, True]
+    assert alarms == [False, False, True]
+
+
+def test_results_are_python_bools():
+    alarms, valid = AlarmRules(RULES).evaluate("AA", ["gas"], [np.float64(600)])
+    assert type(alarms[0]) is bool and type(valid[0]) is bool
+
+
+def test_empty_batch_and_no_rules():
+    assert AlarmRules(RULES).evaluate("AA", [], []) == ([], [])
+    assert AlarmRules({}).evaluate("AA", ["gas"], [900.0]) == ([False], [True])
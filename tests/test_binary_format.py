@@ -0,0 +1,55 @@
+from datetime import datetime
+
+import pytest
+
+import app as backend
+from binary_format import BINARY_CONTENT_TYPE, decode_lecturas, encode_lecturas, lecturas_to_columns
+
+LECTURAS = [
+    {"type": "gas", "Lecture": 612.5, "TimeStamp": 1714557600, "id_suffix": "_gas"},
+    {"type": "hum", "Lecture": 40.25, "TimeStamp": 1714557601, "id_suffix": "_hum"},
+    {"type": "temp", "Lecture": 22.125, "TimeStamp": 1714557602, "id_suffix": "_temp"},
+]
+
+
+def test_roundtrip_matches_json_columns():
+    mac_base, columns = decode_lecturas(encode_lecturas("A1B2C3", LECTURAS))
+    assert mac_base == "A1B2C3"
+    assert columns["type"] == ["gas", "hum", "temp"]
+    assert columns["Lecture"] == [612.5, 40.25, 22.125]
+    assert columns["id_suffix"] == ["_gas", "_hum", "_temp"]
+    # Segundos desde epoch -> datetime sin zona (UTC)
+    assert columns["TimeStamp"][0] == datetime(2024, 5, 1, 10, 0, 0)
+    assert set(columns) == set(lecturas_to_columns(LECTURAS))
+
+
+def test_empty_batch():
+    mac_base, columns = decode_lecturas(encode_lecturas("A1", []))
+    assert mac_base == "A1"
+    assert columns["type"] == []
+
+
+@pytest.mark.parametrize("payload, message", [
+    (b"G", "Cabecera incompleta"),
+    (b"XX\x01\x00" + b"\x00" * 4, "Formato binario desconocido"),
+    (b"GD\x02\x00" + b"\x00" * 4, "Formato binario desconocido"),
+    (encode_lecturas("A1", LECTURAS)[:-1], "no coincide"),
+    (encode_lecturas("A1", LECTURAS) + b"\x00", "no coincide"),
+])
+def test_malformed_payload_raises_value_error(payload, message):
+    with pytest.raises(ValueError, match=message):
+        decode_lecturas(payload)
+
+
+def test_unknown_sensor_type():
+    payload = bytearray(encode_lecturas("A1", LECTURAS[:1]))
+    payload[len(payload) - 17] = 9  # Tipo del único registro
+    with pytest.raises(ValueError, match="Tipo de sensor desconocido"):
+        decode_lecturas(bytes(payload))
+
+
+def test_datos_rejects_malformed_binary_with_400():
+    client = backend.app.test_client()
+    response = client.post("/datos", data=b"GD\x01", content_type=BINARY_CONTENT_TYPE)
+    assert response.status_code == 400
+    assert "Formato binario inválido" in response.get_json()["message"]
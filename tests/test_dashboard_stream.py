@@ -0,0 +1,57 @@
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("pandas")
+requests = pytest.importorskip("requests")
+pytest.importorskip("streamlit")
+
+import dashboard_stream  # noqa: E402
+from backend_client import retry_after  # noqa: E402
+from dashboard_stream import RealtimeStream  # noqa: E402
+
+
+def _response(value):
+    return SimpleNamespace(headers={} if value is None else {"Retry-After": value})
+
+
+def test_retry_after_seconds_and_http_date():
+    assert retry_after(_response("30")) == 30.0
+    assert retry_after(_response("Wed, 21 Oct 2015 07:28:00 GMT")) == 0.0, "fecha pasada"
+    assert retry_after(_response(None)) is None
+    assert retry_after(_response("pronto")) is None
+    assert retry_after(None) is None
+
+
+def test_reconnect_wait_is_exponential_and_capped(monkeypatch):
+    monkeypatch.setattr(dashboard_stream.random, "uniform", lambda low, high: high)
+    stream = RealtimeStream("http://backend", "AA", reconnect_delay=3.0, max_reconnect_delay=20.0)
+    assert [stream._reconnect_wait(n) for n in (1, 2, 3, 4, 10)] == [3.0, 6.0, 12.0, 20.0, 20.0]
+    assert stream._reconnect_wait(1, server_wait=30.0) == 30.0, "Retry-After manda si es mayor"
+    assert stream._reconnect_wait(4, server_wait=1.0) == 20.0
+
+
+def test_run_backs_off_and_resets_after_connecting(monkeypatch):
+    monkeypatch.setattr(dashboard_stream.random, "uniform", lambda low, high: high)
+    stream = RealtimeStream("http://backend", "AA", reconnect_delay=1.0, max_reconnect_delay=60.0)
+    outcomes = iter(["fail", "fail", "connect", "fail", "full"])
+    sleeps = []
+
+    def consume():
+        outcome = next(outcomes)
+        if outcome == "connect":
+            stream.connected = True
+        elif outcome == "full":
+            raise requests.exceptions.HTTPError("503", response=_response("5"))
+        else:
+            raise requests.exceptions.ConnectionError("sin conexión")
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        if len(sleeps) == 5:
+            stream.idle_timeout = -1  # detiene el hilo
+
+    monkeypatch.setattr(stream, "_consume", consume)
+    monkeypatch.setattr(dashboard_stream.time, "sleep", sleep)
+    stream._run()
+    assert sleeps == [1.0, 2.0, 1.0, 1.0, 5.0], "exponencial, vuelta a la base y Retry-After"
@@ -0,0 +1,108 @@
+import pytest
+
+import app as backend
+from dedup import BatchInFlight, IngestDeduplicator, RecentKeys
+
+ROWS = [("AA", "AA_gas", "gas", 10.0, "2024-05-01T10:00:00", False)]
+
+
+def _stored(dedup, mac, seq, rows=ROWS):
+    """Reserva y confirma un lote como si se hubiera guardado."""
+    new_rows, keys = dedup.claim(mac, seq, rows)
+    dedup.commit(keys)
+    return new_rows
+
+
+def test_recent_keys_forgets_oldest():
+    keys = RecentKeys(2)
+    for key in ("a", "b", "c"):
+        keys.add(key)
+    assert "a" not in keys and "b" in keys and "c" in keys
+
+
+def test_same_seq_is_a_retry():
+    dedup = IngestDeduplicator()
+    assert _stored(dedup, "AA", 7) == ROWS
+    assert dedup.claim("AA", 7, ROWS) == ([], [])
+    assert dedup.claim("AA", 8, ROWS)[0] == ROWS
+    assert dedup.stats()["duplicate_batches"] == 1
+
+
+def test_smaller_seq_is_a_device_restart():
+    dedup = IngestDeduplicator()
+    for seq in range(5):
+        _stored(dedup, "AA", seq)
+    # El dispositivo se reinició y vuelve a contar desde 0: no es un reintento
+    assert _stored(dedup, "AA", 0) == ROWS
+    assert _stored(dedup, "AA", 1) == ROWS
+    assert dedup.claim("AA", 1, ROWS) == ([], [])
+    assert dedup.stats()["restarts"] == 1
+
+
+def test_seq_is_tracked_per_device():
+    dedup = IngestDeduplicator()
+    _stored(dedup, "AA", 3)
+    assert _stored(dedup, "BB", 3) == ROWS
+
+
+def test_retry_while_in_flight_raises():
+    dedup = IngestDeduplicator()
+    _, keys = dedup.claim("AA", 3, ROWS)
+    with pytest.raises(BatchInFlight):
+        dedup.claim("AA", 3, ROWS)
+    assert dedup.stats()["in_flight"] == 1
+
+    dedup.commit(keys)
+    assert dedup.claim("AA", 3, ROWS) == ([], [])
+    assert dedup.stats()["in_flight"] == 0
+
+
+def test_released_batch_is_accepted_again():
+    dedup = IngestDeduplicator()
+    _stored(dedup, "AA", 2)
+    _, keys = dedup.claim("AA", 3, ROWS)
+    dedup.release(keys)
+    assert _stored(dedup, "AA", 3) == ROWS
+    assert dedup.claim("AA", 2, ROWS)[0] == ROWS  # Menor que el último: reinicio
+
+
+def test_check_readings_discards_repeated_readings():
+    dedup = IngestDeduplicator(check_readings=True)
+    rows = ROWS + [("AA", "AA_hum", "hum", 40.0, "2024-05-01T10:00:00", False)]
+    assert _stored(dedup, "AA", None, rows) == rows
+    new_rows, keys = dedup.claim("AA", None, rows + [("AA", "AA_gas", "gas", 11.0, "2024-05-01T10:00:01", False)])
+    assert [row[4] for row in new_rows] == ["2024-05-01T10:00:01"]
+    dedup.release(keys)
+    assert dedup.claim("AA", None, new_rows)[0] == new_rows
+
+
+def test_capacity_bounds_tracked_devices():
+    dedup = IngestDeduplicator(capacity=2)
+    for mac in ("AA", "BB", "CC"):
+        _stored(dedup, mac, 1)
+    assert dedup.stats()["tracked_devices"] == 2
+
+
+def test_datos_answers_409_while_first_copy_is_queued(monkeypatch):
+    enqueued = []
+
+    class _Buffer:
+        def enqueue(self, mac_base, rows, keys=()):
+            enqueued.append((mac_base, rows, keys))
+
+    monkeypatch.setattr(backend, "_deduplicator", IngestDeduplicator())
+    monkeypatch.setitem(backend.INGEST_CONFIG, "mode", "async")
+    monkeypatch.setattr(backend, "get_ingest_buffer", lambda: _Buffer())
+    client = backend.app.test_client()
+    body = {"mac_base": "AA", "seq": 5,
+            "lecturas": [{"type": "gas", "Lecture": 10, "TimeStamp": "2024-05-01T10:00:00", "id_suffix": "_gas"}]}
+
+    assert client.post("/datos", json=body).status_code == 202
+    retry = client.post("/datos", json=body)
+    assert retry.status_code == 409
+    assert retry.headers["Retry-After"] == "1"
+
+    # Cuando el escritor lo guarda, el reintento ya es un duplicado
+    backend._deduplicator.commit(enqueued[0][2])
+    assert client.post("/datos", json=body).status_code == 200
+    assert len(enqueued) == 1
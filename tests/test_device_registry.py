@@ -0,0 +1,71 @@
+from device_registry import DeviceRegistry
+
+
+class _Devices:
+    """load_fn con contador de consultas; falla si `error` está activo."""
+
+    def __init__(self, devices):
+        self.devices = set(devices)
+        self.loads = 0
+        self.error = False
+
+    def __call__(self):
+        self.loads += 1
+        if self.error:
+            raise RuntimeError("BD caída")
+        return list(self.devices)
+
+
+def test_known_devices_are_served_from_memory():
+    devices = _Devices({"AA", "BB"})
+    registry = DeviceRegistry(devices, ttl=60)
+    assert registry.is_known("AA")
+    assert registry.is_known("BB")
+    assert not registry.is_known("CC")
+    assert devices.loads == 1
+    stats = registry.stats()
+    assert (stats["hits"], stats["misses"], stats["devices"]) == (2, 1, 2)
+
+
+def test_add_marks_new_device_without_reload():
+    devices = _Devices({"AA"})
+    registry = DeviceRegistry(devices, ttl=60)
+    assert not registry.is_known("CC")
+    registry.add("CC")
+    assert registry.is_known("CC")
+    assert devices.loads == 1
+
+
+def test_stale_cache_reloads_devices_from_other_workers(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("device_registry.time.monotonic", lambda: now[0])
+    devices = _Devices({"AA"})
+    registry = DeviceRegistry(devices, ttl=30)
+    assert not registry.is_known("BB")
+
+    devices.devices.add("BB")  # Lo registró otro worker
+    now[0] += 31
+    assert registry.is_known("BB")
+    assert devices.loads == 2
+
+
+def test_invalidate_forces_reload():
+    devices = _Devices({"AA"})
+    registry = DeviceRegistry(devices, ttl=60)
+    registry.is_known("AA")
+    devices.devices.discard("AA")
+    registry.invalidate()
+    assert not registry.is_known("AA")
+    assert devices.loads == 2
+
+
+def test_reload_error_falls_back_to_database_check():
+    devices = _Devices({"AA"})
+    devices.error = True
+    registry = DeviceRegistry(devices, ttl=60)
+    # Sin caché válida is_known() responde False y el llamador consulta la BD
+    assert not registry.is_known("AA")
+    assert registry.stats()["reload_errors"] == 1
+
+    devices.error = False
+    assert registry.is_known("AA")
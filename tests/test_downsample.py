@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+import downsample
+
+EMPTY_TS = np.array([], dtype=np.int64)
+EMPTY = np.array([], dtype=np.float64)
+
+
+@pytest.fixture
+def series():
+    """Seno de 10000 lecturas, una por segundo, con un pico de un solo punto."""
+    timestamps = np.arange(10000, dtype=np.int64) * 1000
+    values = np.sin(np.arange(10000) / 100.0)
+    values[1234] = 50.0
+    return timestamps, values
+
+
+@pytest.mark.parametrize("reduce", [
+    lambda: downsample.lttb(EMPTY_TS, EMPTY, 10),
+    lambda: downsample.minmax(EMPTY_TS, EMPTY, points=10),
+    lambda: downsample.minmax(EMPTY_TS, EMPTY, EMPTY, points=10),
+])
+def test_empty_series(reduce):
+    timestamps, values = reduce()
+    assert len(timestamps) == 0 and len(values) == 0
+
+
+def test_short_series_unchanged():
+    timestamps = np.arange(5, dtype=np.int64) * 1000
+    values = np.array([1.0, 5.0, 2.0, 8.0, 3.0])
+    for out_ts, out_values in (downsample.lttb(timestamps, values, 10),
+                               downsample.minmax(timestamps, values, points=10)):
+        assert out_ts.tolist() == timestamps.tolist() and out_values.tolist() == values.tolist()
+
+
+@pytest.mark.parametrize("points", [2, 3, 100])
+def test_lttb_keeps_ends_and_order(series, points):
+    timestamps, values = series
+    out_ts, out_values = downsample.lttb(timestamps, values, points)
+    assert len(out_ts) == len(out_values) == points
+    assert out_ts[0] == timestamps[0] and out_ts[-1] == timestamps[-1], "conserva los extremos"
+    assert np.all(np.diff(out_ts) > 0), "en orden"
+
+
+@pytest.mark.parametrize("points", [2, 3, 100])
+def test_minmax_keeps_peaks(series, points):
+    timestamps, values = series
+    out_ts, out_values = downsample.minmax(timestamps, values, points=points)
+    assert len(out_ts) <= points and np.all(np.diff(out_ts) >= 0)
+    assert out_values.max() == 50.0 and out_values.min() == values.min(), "el pico de un punto se conserva"
+
+
+def test_minmax_rollup_columns(series):
+    timestamps, values = series
+    low, high = values - 1.0, values + 1.0
+    out_ts, out_values = downsample.minmax(timestamps, low, high, points=100)
+    assert len(out_ts) <= 100
+    assert out_values.max() == 51.0 and out_values.min() == low.min()
+
+
+def test_minmax_few_rollups_keep_both_bounds():
+    timestamps = np.array([0, 1000], dtype=np.int64)
+    out_ts, out_values = downsample.minmax(timestamps, np.array([1.0, 2.0]), np.array([3.0, 2.0]), points=10)
+    assert out_ts.tolist() == [0, 0, 1000] and out_values.tolist() == [1.0, 3.0, 2.0], \
+        "mínimo y máximo de cada agregado, uno solo si coinciden"
+
+
+def test_drop_missing():
+    timestamps, values = downsample.drop_missing(np.arange(4, dtype=np.int64), np.array([1.0, np.nan, 3.0, np.nan]))
+    assert timestamps.tolist() == [0, 2] and values.tolist() == [1.0, 3.0]
+    timestamps, low, high = downsample.drop_missing(
+        np.arange(3, dtype=np.int64), np.array([1.0, 2.0, np.nan]), np.array([np.nan, 4.0, 5.0]))
+    assert timestamps.tolist() == [1] and low.tolist() == [2.0] and high.tolist() == [4.0]
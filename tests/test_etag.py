@@ -0,0 +1,83 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import app as backend
+from device_versions import DeviceVersions
+from storage import create_storage
+
+MAC = "AABBCC000001"
+START = datetime(2025, 1, 1, 10, 0, 0)
+
+
+def _rows(count, sensor_type="gas", alarm=False):
+    return [(MAC, MAC + "_" + sensor_type, sensor_type, float(i), START + timedelta(minutes=i), alarm)
+            for i in range(count)]
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    storage = create_storage("sqlite", sqlite_config={"path": str(tmp_path / "iot.db")})
+    storage.migrate()
+    monkeypatch.setattr(backend, "_storage", storage)
+    monkeypatch.setattr(backend, "_device_versions", DeviceVersions(resync_ttl=None))
+    yield backend.app.test_client()
+    storage.close()
+
+
+def _get(client, url, etag=None):
+    return client.get(url, headers={"If-None-Match": etag} if etag else {})
+
+
+def test_history_not_modified_until_new_readings(client):
+    backend.get_storage().insert_readings(_rows(10))
+    url = f"/api/history?device_id={MAC}&type=gas&from=2025-01-01T10:00:00&to=2025-01-01T11:00:00"
+    first = _get(client, url)
+    assert first.status_code == 200 and first.headers["ETag"]
+    assert _get(client, url, first.headers["ETag"]).status_code == 304
+
+    rows = _rows(12)[10:]
+    backend.get_storage().insert_readings(rows)
+    backend.publish_readings(rows)
+    assert _get(client, url, first.headers["ETag"]).status_code == 200
+
+
+def test_history_etag_depends_on_query(client):
+    backend.get_storage().insert_readings(_rows(10))
+    base = f"/api/history?device_id={MAC}&from=2025-01-01T10:00:00"
+    etag = _get(client, base + "&type=gas&to=2025-01-01T11:00:00").headers["ETag"]
+    for other in ("&type=gas&to=2025-01-01T10:05:00", "&type=gas&to=2025-01-01T11:00:00&points=3",
+                  "&type=gas&to=2025-01-01T11:00:00&method=lttb", "&type=hum&to=2025-01-01T11:00:00"):
+        assert _get(client, base + other, etag).status_code == 200, other
+
+
+def test_history_relative_to_now_has_no_etag(client):
+    response = _get(client, f"/api/history?device_id={MAC}&type=gas&from=2025-01-01T10:00:00")
+    assert response.status_code == 200
+    assert "ETag" not in response.headers
+
+
+def test_alarms_etag_depends_on_page(client):
+    backend.get_storage().insert_readings(_rows(3, alarm=True))
+    first = _get(client, f"/api/alarms?device_id={MAC}&limit=1")
+    assert _get(client, f"/api/alarms?device_id={MAC}&limit=1", first.headers["ETag"]).status_code == 304
+    cursor = first.headers["X-Next-Cursor"]
+    for other in (f"&limit=1&cursor={cursor}", "&limit=2", "&type=hum", "&limit=1&from=2025-01-01T10:01:00"):
+        assert _get(client, f"/api/alarms?device_id={MAC}" + other, first.headers["ETag"]).status_code == 200, other
+
+
+def test_publish_fills_buffer_before_changing_etag(monkeypatch):
+    versions = DeviceVersions(resync_ttl=None)
+    seen = []
+
+    class _Buffers:
+        def push(self, rows):
+            seen.append(versions.etag(MAC))
+
+    monkeypatch.setattr(backend, "_device_versions", versions)
+    monkeypatch.setattr(backend, "_realtime_buffers", _Buffers())
+    monkeypatch.setitem(backend.REALTIME_BUFFER_CONFIG, "enabled", True)
+    before = versions.etag(MAC)
+    backend.publish_readings(_rows(1))
+    assert seen == [before], "el ETag cambia después de llenar el buffer"
+    assert versions.etag(MAC) != before
@@ -0,0 +1,79 @@
+import threading
+
+from ingest import IngestBuffer
+
+
+def _rows(mac, count):
+    return [(mac, mac + "_gas", "gas", 10.0, "2024-05-01T10:00:00", False)] * count
+
+
+def _batch(mac, count, keys=()):
+    return (mac, _rows(mac, count), keys)
+
+
+class _Writer:
+    """write_fn que falla con los lotes de los dispositivos de `bad`."""
+
+    def __init__(self, bad=()):
+        self.bad = set(bad)
+        self.calls = []
+        self.stored = []
+
+    def __call__(self, batches):
+        self.calls.append([batch[0] for batch in batches])
+        if any(batch[0] in self.bad for batch in batches):
+            raise RuntimeError("lote imposible de guardar")
+        self.stored.extend(batch[0] for batch in batches)
+
+
+def test_group_commit_single_transaction():
+    writer = _Writer()
+    buffer = IngestBuffer(writer)
+    buffer._flush([_batch("A", 2), _batch("B", 3)])
+    assert writer.calls == [["A", "B"]]
+    stats = buffer.stats()
+    assert stats["flushes"] == 1 and stats["flushed_rows"] == 5
+    assert stats["dropped_rows"] == 0
+
+
+def test_failing_batch_does_not_drop_other_devices():
+    writer = _Writer(bad={"B"})
+    dropped = []
+    buffer = IngestBuffer(writer, max_retries=3, drop_fn=dropped.append)
+    buffer._flush([_batch("A", 2), _batch("B", 3, keys=["kB"]), _batch("C", 1)])
+
+    assert writer.stored == ["A", "C"]
+    # Commit agrupado, y luego cada lote por separado; B se reintenta hasta agotar max_retries
+    assert writer.calls == [["A", "B", "C"], ["A"], ["B"], ["B"], ["C"]]
+    stats = buffer.stats()
+    assert stats["flushed_rows"] == 3
+    assert stats["dropped_batches"] == 1 and stats["dropped_rows"] == 3
+    # drop_fn recibe el lote con sus claves (para liberar la deduplicación)
+    assert dropped == [_batch("B", 3, keys=["kB"])]
+
+
+def test_flush_does_not_sleep_between_retries(monkeypatch):
+    def no_sleep(seconds):
+        raise AssertionError("el escritor no debe dormir con la cola detenida")
+
+    monkeypatch.setattr("ingest.time.sleep", no_sleep)
+    buffer = IngestBuffer(_Writer(bad={"A"}), max_retries=3)
+    buffer._flush([_batch("A", 1)])
+    assert buffer.stats()["dropped_batches"] == 1
+
+
+def test_writer_thread_flushes_queue_on_stop():
+    stored = []
+    done = threading.Event()
+
+    def write(batches):
+        stored.extend(batches)
+        done.set()
+
+    buffer = IngestBuffer(write, flush_interval=0.05)
+    buffer.start()
+    buffer.enqueue("A", _rows("A", 2))
+    assert done.wait(2)
+    buffer.stop()
+    assert stored == [("A", _rows("A", 2), ())]
+    assert not buffer.stats()["running"]
@@ -0,0 +1,89 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from realtime_buffer import RealtimeBuffers
+
+MAC = "AABBCC000001"
+START = datetime(2025, 1, 1, 10, 0, 0)
+
+
+def _reading(second, value, sensor_type="gas"):
+    return (MAC, MAC + "_" + sensor_type, sensor_type, value, START + timedelta(seconds=second), False)
+
+
+def _stored(*seconds):
+    return [{"TimeStamp": START + timedelta(seconds=s), "value": float(s)} for s in seconds]
+
+
+def _values(rows):
+    return [row["value"] for row in rows]
+
+
+@pytest.fixture
+def buffers():
+    return RealtimeBuffers(capacity=5, idle_ttl=None, resync_ttl=None)
+
+
+def test_cold_series_loads_from_database_once(buffers):
+    calls = []
+
+    def load_fn(limit):
+        calls.append(limit)
+        return _stored(2, 1, 0)
+
+    assert buffers.latest(MAC, "gas", 3, load_fn) == _stored(2, 1, 0)
+    assert calls == [5], "buffer frío: carga la serie completa"
+    assert _values(buffers.latest(MAC, "gas", 2, load_fn)) == [2.0, 1.0]
+    assert calls == [5], "segunda consulta desde memoria"
+
+
+def test_readings_pushed_during_load_are_added_once(buffers):
+    def load_fn(limit):
+        # Lotes guardados mientras dura la consulta: uno ya está en las filas de la BD
+        buffers.push([_reading(2, "2"), _reading(3, 3)])
+        return _stored(2, 1, 0)
+
+    buffers.latest(MAC, "gas", 3, load_fn)
+    rows = buffers.latest(MAC, "gas", 5, load_fn)
+    assert _values(rows) == [3.0, 2.0, 1.0, 0.0]
+
+
+def test_keeps_newest_capacity_readings_in_order(buffers):
+    buffers.latest(MAC, "gas", 5, lambda limit: _stored(3, 2, 1, 0))
+    buffers.push([_reading(4, 4.0), _reading(5, 5.0), _reading(1, 1.5)])
+    rows = buffers.latest(MAC, "gas", 5, None)
+    assert _values(rows) == [5.0, 4.0, 3.0, 2.0, 1.5]
+
+
+def test_since_is_inclusive(buffers):
+    buffers.latest(MAC, "gas", 5, lambda limit: _stored(5, 4, 3))
+    assert _values(buffers.latest(MAC, "gas", 5, None, since=START + timedelta(seconds=4))) == [5.0, 4.0]
+
+
+def test_series_are_independent_by_type(buffers):
+    buffers.latest(MAC, "gas", 5, lambda limit: [])
+    buffers.latest(MAC, "hum", 5, lambda limit: [])
+    buffers.push([_reading(1, 40.0, "hum")])
+    assert buffers.latest(MAC, "gas", 5, None) == []
+    assert _values(buffers.latest(MAC, "hum", 5, None)) == [40.0]
+
+
+def test_max_series_evicts_least_recently_used():
+    buffers = RealtimeBuffers(capacity=5, max_series=2, idle_ttl=None, resync_ttl=None)
+    for sensor_type in ("gas", "hum", "temp"):
+        buffers.latest(MAC, sensor_type, 5, lambda limit: [])
+    assert buffers.stats()["evictions"] == 1
+    loads = []
+    buffers.latest(MAC, "gas", 5, lambda limit: loads.append(limit) or [])
+    assert loads == [5], "la serie desalojada se vuelve a cargar"
+
+
+def test_failed_load_is_retried(buffers):
+    def failing_load(limit):
+        raise RuntimeError("BD caída")
+
+    with pytest.raises(RuntimeError):
+        buffers.latest("OTRO", "gas", 5, failing_load)
+    assert buffers.latest("OTRO", "gas", 5, lambda limit: []) == [], "tras un error la serie se vuelve a cargar"
+    assert buffers.stats()["warm_series"] == 1
@@ -0,0 +1,46 @@
+import pytest
+
+import app as backend
+
+
+@pytest.fixture
+def client():
+    return backend.app.test_client()
+
+
+def _lectura(**overrides):
+    lectura = {"type": "hum", "Lecture": 40.5, "TimeStamp": "2024-05-01T10:00:00", "id_suffix": "_hum"}
+    lectura.update(overrides)
+    return lectura
+
+
+def test_parse_lecturas_coerces_values_and_timestamps():
+    columns = backend.lecturas_to_columns([
+        _lectura(Lecture="41.5"),
+        _lectura(type="gas", Lecture=900, TimeStamp="2024-05-01T12:00:00+02:00", id_suffix="_gas"),
+        _lectura(Lecture=None),
+    ])
+    rows = backend.parse_lecturas("AA", columns)
+    assert [row[3] for row in rows] == [41.5, 900.0, None]
+    # Con zona se guarda en UTC, sin zona
+    assert rows[1][4].isoformat() == "2024-05-01T10:00:00"
+    assert [bool(row[5]) for row in rows] == [False, True, False]
+
+
+@pytest.mark.parametrize("lectura", [
+    _lectura(Lecture="abc"),
+    _lectura(type="gas", Lecture="alto"),
+    _lectura(Lecture=float("nan")),
+    _lectura(TimeStamp="ayer"),
+    _lectura(TimeStamp=None),
+])
+def test_unstorable_batch_is_rejected_before_enqueue(client, monkeypatch, lectura):
+    def get_ingest_buffer():
+        raise AssertionError("un lote inválido no debe llegar a la cola")
+
+    monkeypatch.setitem(backend.INGEST_CONFIG, "mode", "async")
+    monkeypatch.setattr(backend, "get_ingest_buffer", get_ingest_buffer)
+
+    response = client.post("/datos", json={"mac_base": "AA", "lecturas": [_lectura(), lectura]})
+    assert response.status_code == 400
+    assert "Lecturas inválidas" in response.get_json()["message"]
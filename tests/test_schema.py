@@ -0,0 +1,58 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from schema import LATEST_VERSION
+from storage import StorageError, create_storage
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "iot.db")
+
+
+def _storage(path, busy_timeout=5000):
+    return create_storage("sqlite", sqlite_config={"path": path, "busy_timeout": busy_timeout})
+
+
+def test_migrate_restores_busy_timeout(db_path):
+    storage = _storage(db_path, busy_timeout=1234)
+    try:
+        assert len(storage.migrate(lock_timeout=30)) == LATEST_VERSION
+        assert storage._connection().execute("PRAGMA busy_timeout").fetchone()[0] == 1234
+    finally:
+        storage.close()
+
+
+def test_migrate_waits_lock_timeout_not_busy_timeout(db_path):
+    storage = _storage(db_path, busy_timeout=50)
+    storage._connection()  # Crea la BD en modo WAL
+    # Otro proceso migrando: tiene el bloqueo de escritura durante la carga inicial
+    other = sqlite3.connect(db_path, isolation_level=None, check_same_thread=False)
+    other.execute("BEGIN IMMEDIATE")
+    released = threading.Timer(0.5, other.execute, ("COMMIT",))
+    released.start()
+    try:
+        started = time.monotonic()
+        assert len(storage.migrate(lock_timeout=5)) == LATEST_VERSION
+        assert time.monotonic() - started >= 0.4, "esperó al otro proceso en lugar de fallar"
+    finally:
+        released.join()
+        storage.close()
+        other.close()
+
+
+def test_migrate_fails_after_lock_timeout(db_path):
+    storage = _storage(db_path)
+    storage._connection()
+    other = sqlite3.connect(db_path, isolation_level=None)
+    other.execute("BEGIN IMMEDIATE")
+    try:
+        with pytest.raises(StorageError):
+            storage.migrate(lock_timeout=0.1)
+    finally:
+        other.execute("COMMIT")
+        storage.close()
+        other.close()
@@ -0,0 +1,124 @@
+import threading
+import time
+
+import pytest
+
+from shared_cache import SharedCache
+
+
+def _wait_until(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.005)
+    return True
+
+
+class _BlockedLoad:
+    """load_fn que no termina hasta release(); cuenta las llamadas."""
+
+    def __init__(self, value=None, error=None):
+        self.value = value
+        self.error = error
+        self.calls = 0
+        self.started = threading.Event()
+        self._release = threading.Event()
+
+    def __call__(self, previous):
+        self.calls += 1
+        self.started.set()
+        self._release.wait(5)
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+    def release(self):
+        self._release.set()
+
+
+def _in_thread(fn, *args):
+    """Ejecuta fn en un hilo; devuelve (hilo, resultado) con resultado = {"value"} o {"error"}."""
+    result = {}
+
+    def target():
+        try:
+            result["value"] = fn(*args)
+        except Exception as e:
+            result["error"] = e
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    return thread, result
+
+
+def _start_coalesced(cache, key, load):
+    """Una sesión carga la clave con `load` y otra la pide mientras tanto."""
+    loader, first = _in_thread(cache.get, key, load)
+    assert load.started.wait(2)
+    waiter, second = _in_thread(cache.get, key, lambda previous: "otra carga")
+    assert _wait_until(lambda: cache.stats()["coalesced"] == 1), "sin valor todavía: la segunda sesión espera"
+    return (loader, first), (waiter, second)
+
+
+def test_concurrent_loads_are_coalesced():
+    cache = SharedCache(ttl=60, wait_timeout=5)
+    load = _BlockedLoad(value="v1")
+    (loader, first), (waiter, second) = _start_coalesced(cache, "k", load)
+    load.release()
+    loader.join(2)
+    waiter.join(2)
+    assert first == {"value": "v1"} and second == {"value": "v1"}
+    assert load.calls == 1 and cache.stats()["loads"] == 1, "una sola carga para las dos sesiones"
+
+
+def test_stale_value_served_while_reloading():
+    cache = SharedCache(ttl=60, wait_timeout=5)
+    assert cache.get("k", lambda previous: "v1") == "v1"
+    reload = _BlockedLoad(value="v2")
+    loader, first = _in_thread(cache.get, "k", reload, 0)
+    assert reload.started.wait(2)
+    assert cache.get("k", lambda previous: "otra carga", 0) == "v1", "no espera a la recarga"
+    assert cache.stats()["stale_hits"] == 1
+    reload.release()
+    loader.join(2)
+    assert first == {"value": "v2"} and cache.peek("k") == "v2"
+
+
+def test_load_error_reaches_waiters_and_is_not_cached():
+    cache = SharedCache(ttl=60, wait_timeout=5)
+    load = _BlockedLoad(error=ValueError("backend caído"))
+    (loader, first), (waiter, second) = _start_coalesced(cache, "k", load)
+    load.release()
+    loader.join(2)
+    waiter.join(2)
+    assert isinstance(first.get("error"), ValueError)
+    assert second.get("error") is first["error"], "quien esperaba recibe la misma excepción"
+    assert cache.stats()["errors"] == 1
+    assert cache.get("k", lambda previous: "v1") == "v1", "la siguiente consulta recarga"
+
+
+def test_wait_timeout():
+    cache = SharedCache(ttl=60, wait_timeout=0.05)
+    load = _BlockedLoad(value="tarde")
+    loader, _ = _in_thread(cache.get, "k", load)
+    assert load.started.wait(2)
+    with pytest.raises(TimeoutError):
+        cache.get("k", lambda previous: "otra carga")
+    load.release()
+    loader.join(2)
+
+
+def test_eviction_keeps_key_being_loaded():
+    cache = SharedCache(ttl=60, max_entries=2, wait_timeout=5)
+    load = _BlockedLoad(value="a")
+    (loader, first), (waiter, second) = _start_coalesced(cache, "a", load)
+    for key in ("b", "c", "d"):
+        cache.put(key, key)
+    assert cache.stats()["entries"] == 2 and cache.stats()["evictions"] == 2
+    assert cache.peek("b") is None and cache.peek("c") is None, "se descartan las más antiguas"
+    load.release()
+    loader.join(2)
+    waiter.join(2)
+    assert first == {"value": "a"} and second == {"value": "a"}, "la clave que se carga no se descarta"
+    assert cache.peek("a") == "a"
@@ -0,0 +1,34 @@
+import sqlite3
+
+import pytest
+
+from storage import StorageError, create_storage
+
+
+def test_sqlite_connection_errors_are_storage_errors(tmp_path):
+    path = str(tmp_path / "iot.db")
+    # BD nueva bloqueada por otro proceso: no se puede activar el modo WAL
+    other = sqlite3.connect(path, isolation_level=None)
+    other.execute("BEGIN EXCLUSIVE")
+    storage = create_storage("sqlite", sqlite_config={"path": path, "busy_timeout": 50})
+    try:
+        with pytest.raises(StorageError):
+            storage.device_ids()
+        assert storage.stats()["connections"] == 0, "la conexión a medio abrir no se guarda"
+    finally:
+        other.execute("COMMIT")
+        storage.close()
+        other.close()
+
+
+def test_sqlite_unstorable_reading_is_rolled_back(tmp_path):
+    storage = create_storage("sqlite", sqlite_config={"path": str(tmp_path / "iot.db")})
+    try:
+        storage.migrate()
+        row = ("AA", "AA_hum", "hum", 40.0, "2024-05-01T10:00:00", False)
+        with pytest.raises(StorageError, match="Lecture no numérico"):
+            storage.insert_readings([row, row[:3] + ("x",) + row[4:]])
+        storage.insert_readings([row])
+        assert storage.count_readings(["AA"]) == 1
+    finally:
+        storage.close()
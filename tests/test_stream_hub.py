@@ -0,0 +1,72 @@
+from datetime import datetime
+
+import pytest
+
+from stream_hub import StreamHub, StreamHubFull
+
+MAC = "AABBCC000001"
+
+
+def _row(value, sensor_type="gas", device_id=MAC, second=0):
+    return (device_id, device_id + "_" + sensor_type, sensor_type, value,
+            datetime(2025, 1, 1, 10, 0, second), False)
+
+
+def test_publish_reaches_matching_subscribers_only():
+    hub = StreamHub()
+    gas = hub.subscribe(MAC, ["gas"])
+    other = hub.subscribe("OTRO", ["gas"])
+    hub.publish([_row(10.0), _row(40.0, "hum"), _row(11.0, second=1)])
+
+    events, lagged = gas.get(timeout=0)
+    assert not lagged
+    assert events == [{"type": "gas", "readings": [
+        {"TimeStamp": "2025-01-01T10:00:00", "value": 10.0},
+        {"TimeStamp": "2025-01-01T10:00:01", "value": 11.0}]}], "un evento por tipo y lote"
+    assert other.get(timeout=0) == ([], False)
+
+
+def test_values_and_timestamps_are_json_safe():
+    hub = StreamHub()
+    subscription = hub.subscribe(MAC, ["gas"])
+    hub.publish([_row("12.5"), _row(float("nan")), _row("abc"),
+                 (MAC, MAC + "_gas", "gas", 1.0, "2025-01-01 10:00:05", False)])
+    readings = subscription.get(timeout=0)[0][0]["readings"]
+    assert [item["value"] for item in readings] == [12.5, None, None, 1.0]
+    assert readings[-1]["TimeStamp"] == "2025-01-01T10:00:05"
+
+
+def test_max_subscribers():
+    hub = StreamHub(max_subscribers=1)
+    first = hub.subscribe(MAC, ["gas"])
+    with pytest.raises(StreamHubFull):
+        hub.subscribe(MAC, ["gas"])
+    assert hub.stats()["rejected"] == 1
+    hub.unsubscribe(first)
+    assert first.closed
+    hub.subscribe(MAC, ["gas"])
+    assert hub.stats()["subscribers"] == 1
+
+
+def test_slow_subscriber_lags_without_blocking_others():
+    hub = StreamHub(max_queue=2)
+    slow = hub.subscribe(MAC, ["gas"])
+    fast = hub.subscribe(MAC, ["gas"])
+    for second in range(3):
+        hub.publish([_row(float(second), second=second)])
+        if second < 2:
+            assert len(fast.get(timeout=0)[0]) == 1
+
+    assert slow.get(timeout=0) == ([], True), "cola llena: el cliente debe recargar"
+    assert slow.get(timeout=0) == ([], False), "lo pendiente se descarta tras el aviso"
+    assert len(fast.get(timeout=0)[0]) == 1
+    hub.unsubscribe(slow)
+    assert hub.stats()["lagged_subscribers"] == 1
+
+
+def test_close_wakes_waiting_subscribers():
+    hub = StreamHub()
+    subscription = hub.subscribe(MAC, ["gas"])
+    hub.close()
+    assert subscription.get(timeout=5) == ([], False)
+    assert subscription.closed